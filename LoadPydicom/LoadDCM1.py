@@ -1,59 +1,166 @@
 import os
-import vtk
+import sys
+
+# 只导入用到的vtkmodules，不导入整个vtk
+import vtkmodules.vtkRenderingOpenGL2  # noqa: F401  注册OpenGL2渲染实现
+from vtkmodules.vtkFiltersSources import vtkLineSource
+from vtkmodules.vtkInteractionStyle import vtkInteractorStyleMultiTouchCamera
+from vtkmodules.vtkRenderingCore import (vtkActor, vtkPolyDataMapper, vtkRenderer,
+                                         vtkRenderWindow, vtkRenderWindowInteractor)
+
+# 仓库根目录加到路径里，才能导入spine_viewer
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from spine_viewer import instrument
+from spine_viewer.mesh_bvh import NeedleChecker
+from spine_viewer.mesh_lod import MeshLOD, MeshPyramid
+from spine_viewer.pipeline import DicomVolumePipeline
+from spine_viewer.surface import BoneSurfaceExtractor
 
-# vtk自带读取dcm函数
 dicom_path = os.path.expanduser("~") + "\spine\dataStore\dicom_data"
 print(dicom_path)
 
 
 class LoadPydicom:
-    
-    def __init__(self):
-        dicom_reader = vtk.vtkDICOMImageReader()
-        dicom_reader.SetDirectoryName(dicom_path)
-        dicom_reader.Update()
-        
-        # 提取模型
-        iso = vtk.vtkMarchingCubes()
-        iso.SetInputConnection(dicom_reader.GetOutputPort())
-        iso.SetValue(0, 200) # 设置CT阈值范围 低于200的不会显示
-        
-        # 光滑处理
-        smooth = vtk.vtkSmoothPolyDataFilter()
-        smooth.SetInputConnection(iso.GetOutputPort())
-        smooth.SetNumberOfIterations(20)
-        smooth.SetRelaxationFactor(0.1)
-        
+    """
+    iso_value: CT阈值(HU) 低于它的不会显示
+    stl_path: 给了就把表面导出成STL，LoadSTL的场景可以直接读取
+    lod: 交互时按帧率自动切换减面的表面
+    collision: 给骨表面建BVH，check_needle检查针和骨头的碰撞(一次1ms以内)
+    构造时只搭好场景，start()才显示窗口；start()之前用track_needle注册跟踪器，窗口打开后每帧检查一次
+    """
+
+    def __init__(self, path=dicom_path, iso_value=200, decimate=0.0, stl_path=None, lod=True, collision=True):
+        # 没有读到数据、collision=False或者表面是空的时候没有BVH，check_needle会报错
+        self.bvh = None
+        self.needle_checker = None
+        self.lod = None  # lod=False、表面为空或没有读到数据时没有LOD
+        self.needle_state = None  # track_needle最近一帧的 (是否碰到, 针尖距离, 进入位置)
+        self.iren = None
+        # 体数据走spine_viewer的缓存，表面按 序列指纹+阈值+光滑参数 缓存，第二次打开直接读
+        pipeline = DicomVolumePipeline()
+        vtk_image = pipeline.load_volume_image(path)
+        if vtk_image is None:
+            return
+
+        # 提取模型 + 光滑处理(20次, 0.1) + 法向
+        extractor = BoneSurfaceExtractor(iso_value=iso_value, iterations=20, relaxation=0.1, decimate=decimate)
+        surface = extractor.extract(vtk_image, series_key=pipeline.series_key)
+        if stl_path:
+            extractor.export_stl(stl_path)
+            print(f"STL已导出: {stl_path}")
+        if collision and surface.GetNumberOfPolys():
+            with instrument.stage("bvh"):
+                self.needle_checker = NeedleChecker(surface)
+                self.bvh = self.needle_checker.bvh
+
         # mapper
-        mapper = vtk.vtkPolyDataMapper()
-        mapper.SetInputConnection(smooth.GetOutputPort())
+        mapper = vtkPolyDataMapper()
+        mapper.SetInputData(surface)
         mapper.ScalarVisibilityOff()
-        
+
         # actor
-        actor = vtk.vtkActor()
+        actor = vtkActor()
         actor.SetMapper(mapper)
         actor.GetProperty().SetColor(1, 1, 0.9)
-        
+
         # renderer
-        renderer = vtk.vtkRenderer()
+        renderer = vtkRenderer()
         renderer.AddActor(actor)
         renderer.SetBackground(0.1, 0.1, 0.2)
-        
+        self.renderer = renderer
+
         # render_win
-        ren_win = vtk.vtkRenderWindow()
+        ren_win = vtkRenderWindow()
         ren_win.AddRenderer(renderer)
         ren_win.SetSize(1000, 1000)
-        
+        self.ren_win = ren_win
+
         # iren
-        iren = vtk.vtkRenderWindowInteractor()
+        iren = vtkRenderWindowInteractor()
         iren.SetRenderWindow(ren_win)
-        iren.SetInteractorStyle(vtk.vtkInteractorStyleMultiTouchCamera())
-        
-        # start
-        renderer.ResetCamera()
-        ren_win.Render()
-        iren.Start()
-    
-    
+        iren.SetInteractorStyle(vtkInteractorStyleMultiTouchCamera())
+        self.iren = iren
+
+        # 表面的减面级别和表面一起按序列缓存；旋转缩放时按15fps预算降级，停下来后按2fps预算(一般就是全分辨率)
+        if lod and surface.GetNumberOfPolys():
+            key = extractor.key(pipeline.series_key) if pipeline.series_key else None
+            self.lod = MeshLOD(renderer, target_fps=15.0, interactor=iren)
+            self.lod.add(actor, MeshPyramid(surface, key=key))
+
+        # 针: 跟踪器给了位置才显示，碰到骨头时变红
+        self._needle_line = vtkLineSource()
+        needle_mapper = vtkPolyDataMapper()
+        needle_mapper.SetInputConnection(self._needle_line.GetOutputPort())
+        self._needle_actor = vtkActor()
+        self._needle_actor.SetMapper(needle_mapper)
+        self._needle_actor.GetProperty().SetLineWidth(3)
+        self._needle_actor.VisibilityOff()
+        renderer.AddActor(self._needle_actor)
+        self._trackers = []
+
+    def track_needle(self, source, radius=0.6, interval_ms=20, callback=None):
+        """
+        start()之前调用: 窗口打开后每interval_ms毫秒调用source()取针的当前位置 (tail, tip)，
+        没有新位置时source返回None；每个新位置都check_needle一次，结果放在needle_state，
+        给了callback时调用 callback(是否碰到, 针尖距离, 进入位置)
+        """
+        if self.needle_checker is None:
+            raise RuntimeError("没有骨表面的BVH，不能检查碰撞(collision=False、表面为空或没有读到DICOM)")
+        self._trackers.append((source, radius, interval_ms, callback))
+
+    def _on_tracker(self, source, radius, callback):
+        position = source()
+        if position is None:
+            return
+        tail, tip = position
+        self.needle_state = self.check_needle(tail, tip, radius)
+        hit = self.needle_state[0]
+        self._needle_line.SetPoint1(*map(float, tail))
+        self._needle_line.SetPoint2(*map(float, tip))
+        self._needle_actor.GetProperty().SetColor((1.0, 0.2, 0.2) if hit else (0.2, 1.0, 0.4))
+        self._needle_actor.VisibilityOn()
+        if callback is not None:
+            callback(*self.needle_state)
+        self.ren_win.Render()
+
+    def start(self):
+        """显示窗口，关闭窗口后返回"""
+        if self.iren is None:
+            return
+        self.renderer.ResetCamera()
+        with instrument.stage("first_render"):
+            self.ren_win.Render()
+        self.iren.Initialize()  # 创建定时器之前必须初始化
+        # 每个跟踪器一个定时器
+        self._timers = {self.iren.CreateRepeatingTimer(interval_ms): (source, radius, callback)
+                        for source, radius, interval_ms, callback in self._trackers}
+        if self._timers:
+            self.iren.AddObserver("TimerEvent", self._on_timer)
+        self.iren.Start()
+        # SPINE_VIEWER_INSTRUMENT=1 时关闭窗口后打印各阶段耗时和内存
+        instrument.report()
+
+    def _on_timer(self, iren, event):
+        tracker = self._timers.get(iren.GetTimerEventId())
+        if tracker is not None:
+            self._on_tracker(*tracker)
+
+    def check_needle(self, tail, tip, radius=0.6):
+        """
+        针(tail -> tip，图像坐标mm，radius是针的半径)和骨表面
+        返回 (是否碰到骨头, 针尖到骨表面的距离, 针从tail进入骨头的位置或None)
+        没有BVH(collision=False、表面为空或没有读到数据)时抛出RuntimeError，不会当成没碰到
+        """
+        if self.needle_checker is None:
+            raise RuntimeError("没有骨表面的BVH，不能检查碰撞(collision=False、表面为空或没有读到DICOM)")
+        return self.needle_checker.check(tail, tip, radius)
+
+
 if __name__ == "__main__":
-    load_dcm = LoadPydicom()
+    # 用法: python LoadDCM1.py [DICOM目录] [导出的STL路径]
+    load_dcm = LoadPydicom(
+        path=sys.argv[1] if len(sys.argv) > 1 else dicom_path,
+        stl_path=sys.argv[2] if len(sys.argv) > 2 else None,
+    )
+    load_dcm.start()
@@ -1,78 +1,89 @@
 import os
+import sys
 import vtk
 
-path = os.path.join(os.path.dirname(__file__), "STL")
+# 仓库根目录加到路径里，才能导入spine_viewer
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from spine_viewer.mesh_cache import load_stl
+from spine_viewer.mesh_lod import MeshLOD
+from spine_viewer.render_scheduler import RenderScheduler
+from spine_viewer.scene import SceneLoader, load_manifest
+
+# 场景清单: 模型文件、颜色、放置规则(汽车和房子放在地板上)
+manifest_path = os.path.join(os.path.dirname(__file__), "scene.json")
+# 汽车每秒移动的距离(原来是每30ms移动0.01)
+CAR_SPEED = 0.01 / 0.03
 
 
 class LoadSTL:
-    def __init__(self):
-        self._car_actor = self.load_stl(stl_path=path + "/BMW_X3.stl")
-        floor_actor = self.load_stl(stl_path=path + "/Floor.stl")
-        house_actor = self.load_stl(stl_path=path + "/House.stl")
-        
+    def __init__(self, manifest=manifest_path):
         # 渲染
-        render = vtk.vtkRenderer()
-        render.AddActor(self._car_actor)
-        render.AddActor(floor_actor)
-        render.AddActor(house_actor)
-        
-        # 模型对齐
-        car_center = self._car_actor.GetCenter()
-        floor_center = floor_actor.GetCenter()
-        house_center = house_actor.GetCenter()
-        car_bounds = self._car_actor.GetBounds()
-        floor_bounds = floor_actor.GetBounds()
-        house_bounds = house_actor.GetBounds()
-        
-        # 汽车和地板对齐
-        c_x = floor_center[0] - car_center[0]  # 计算平移是对的
-        c_y = floor_bounds[3] - car_bounds[2] # Y要用地板的最高-车的最低计算平移
-        c_z = floor_center[2] - car_center[2]
-        self._car_actor.SetPosition(c_x, c_y, c_z)
-        
-        # 房子和地板对齐
-        h_x = floor_center[0] - house_center[0]
-        h_y = floor_bounds[3] - house_bounds[2]
-        h_z = floor_center[2] - house_center[2]
-        house_actor.SetPosition(h_x, h_y, h_z)
-        
+        self._render = vtk.vtkRenderer()
+        self._camera_reset = False
+
         # REN_WIN
         ren_win = vtk.vtkRenderWindow()
-        ren_win.AddRenderer(render)
+        ren_win.AddRenderer(self._render)
         ren_win.SetSize(2000, 2000)
         # I_REN
         i_ren = vtk.vtkRenderWindowInteractor()
         i_ren.SetInteractorStyle(vtk.vtkInteractorStyleMultiTouchCamera())
         i_ren.SetRenderWindow(ren_win)
-        # TIMER
-        i_ren.Initialize()  # 必须初始化，不然不动, 此方法在使用鼠标交互的时候 汽车就不动了
-        ren_win.Render()
-        i_ren.AddObserver("TimerEvent", self._render_timer)
-        i_ren.CreateRepeatingTimer(30)  # 改成一次性定时器
 
+        # 模型在后台线程并行读取，定时器里读完一个加一个，窗口马上就能显示
+        # 找不到或读取失败的模型只打印错误，不影响其他模型
+        # 每个模型同时生成减面级别(缓存到磁盘)，每帧按33ms预算和模型在屏幕上的大小选一级
+        self._lod = MeshLOD(self._render, target_fps=30.0)
+        self._loader = SceneLoader(load_manifest(manifest), self._render, lod=self._lod).start()
+
+        # TIMER
+        # 按需渲染: 只有模型加进来、汽车在动或者鼠标交互时才画，最多60帧/秒
+        # 汽车按真实时间移动，鼠标交互时interactor自己触发的渲染也会推进，汽车不会停
+        i_ren.Initialize()  # 必须初始化，不然不动
+        self._scheduler = RenderScheduler(i_ren, max_fps=60.0)
+        self._scheduler.add_tick(self._poll_scene)
+        self._scheduler.start()
 
         i_ren.Start()
-        
+        self._scheduler.stop()
+        self._loader.shutdown()
+
     def load_stl(self, stl_path: str):
-        # READER
-        reader = vtk.vtkSTLReader()
-        reader.SetFileName(stl_path)
-        reader.Update()
+        """单独读取一个STL得到actor(经过网格缓存)；场景清单里的模型由SceneLoader在后台读取"""
+        try:
+            polydata = load_stl(stl_path)
+        except FileNotFoundError:
+            print(f"找不到STL文件: {stl_path}")
+            polydata = vtk.vtkPolyData()
         # MAPPER
         mapper = vtk.vtkPolyDataMapper()
-        mapper.SetInputConnection(reader.GetOutputPort())
+        mapper.SetInputData(polydata)
         # ACTOR
         actor = vtk.vtkActor()
         actor.SetMapper(mapper)
         return actor
-    
-    def car_move(self):
-        pass
-        
-    def _render_timer(self, obj, event):
-        self._car_actor.AddPosition(0.01, 0, 0)
-        obj.GetRenderWindow().Render()
+
+    def car_move(self, dt):
+        car_actor = self._loader.actors.get("car")
+        car_actor.AddPosition(CAR_SPEED * dt, 0, 0)
+
+    def _poll_scene(self):
+        if self._loader.done:
+            return
+        added = self._loader.poll()
+        if added:
+            # 只在第一批模型到达时重置相机，之后用户调过的视角不会被后来的模型打断
+            if not self._camera_reset:
+                self._render.ResetCamera()
+                self._camera_reset = True
+            else:
+                self._render.ResetCameraClippingRange()
+            self._scheduler.invalidate()
+            if "car" in added:
+                self._scheduler.add_animation(self.car_move)
 
 
 if __name__ == "__main__":
-    load_stl = LoadSTL()
+    # 用法: python load_stl.py [场景清单.json]
+    load_stl = LoadSTL(*sys.argv[1:2])
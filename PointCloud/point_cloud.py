@@ -1,21 +1,58 @@
+import os
+import sys
+import time
 import vtk
 import numpy as np
+from vtk.util import numpy_support
+
+# 仓库根目录加到路径里，才能导入spine_viewer
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from spine_viewer.ingest import PointBatchQueue, PointProducer, random_source
+from spine_viewer.needle import NeedleRecording, NeedleTrajectory
+from spine_viewer.render_scheduler import RenderScheduler
+from spine_viewer.spatial_index import PointIndex
+from spine_viewer.voxel_grid import VoxelGrid
 
 
 class PointCloud:
-    def __init__(self, max_points=10000):
+    """
+    max_points: 最多显示的点数，满了之后新点覆盖最早的点(环形缓冲区)
+    voxel_size: 给了就用体素网格降采样，每个体素显示一个平均点，max_points是体素数上限，
+                满了之后按eviction("lru"/"age")淘汰体素，长时间扫描内存也不会增长
+    max_pending: 后台采集的点在队列里最多积压多少个，超过时丢掉最早的批次
+    max_fps: 渲染帧率上限，没有新点、也没有鼠标交互时不渲染
+    点坐标、深度(z)和顶点连接都预先分配成numpy数组，零拷贝交给VTK，每批点只标记一次Modified
+    """
+
+    def __init__(self, max_points=10000, voxel_size=None, eviction="lru", max_pending=100000, max_fps=30.0):
         self.max_points = max_points
+        self._count = 0  # 已有的点数
+        self._head = 0   # 满了之后下一个要覆盖的位置
+
+        # 预分配的缓冲区，体素模式下点坐标直接用体素网格的平均点数组
+        self._grid = None
+        if voxel_size:
+            self._grid = VoxelGrid(voxel_size, max_voxels=max_points, eviction=eviction)
+            self._points = self._grid.means
+        else:
+            self._points = np.zeros((max_points, 3), dtype=np.float32)
+        self._depth = np.zeros(max_points, dtype=np.float32)
+        # 空间索引(最近点/半径/包围盒查询)，和缓冲区同步，查询时才按需重建
+        self.index = PointIndex(self._points, count=0)
+        # 每个点一个顶点单元，连接关系固定是 0,1,2...
+        self._offsets = np.arange(max_points + 1, dtype=np.int64)
+        self._connectivity = np.arange(max_points, dtype=np.int64)
 
         # VTK 数据结构
         self._vtk_points = vtk.vtkPoints()
         self._vtk_cells = vtk.vtkCellArray()
-        self._vtk_depth = vtk.vtkDoubleArray()
 
         # POLYDATA
         self._poly_data = vtk.vtkPolyData()
         self._poly_data.SetPoints(self._vtk_points)
         self._poly_data.SetVerts(self._vtk_cells)
-        self._poly_data.GetPointData().SetScalars(self._vtk_depth)
+        self._wrap(0)
 
         # MAPPER
         mapper = vtk.vtkPolyDataMapper()
@@ -39,39 +76,163 @@ class PointCloud:
         self._interactor = vtk.vtkRenderWindowInteractor()
         self._interactor.SetRenderWindow(self._ren_win)
 
+        # 采集(后台线程) -> 队列 -> 渲染定时器每次合并取出，有新点才渲染
+        self._queue = PointBatchQueue(max_pending=max_pending)
+        self._producer = None
+        self._listeners = []
+        self._last_title = 0.0
+
         # 定时回调
-        self._interactor.AddObserver("TimerEvent", self._timer_callback)
         self._interactor.Initialize()
-        self._interactor.CreateRepeatingTimer(50)  # 每 50ms 更新一次
-
-    def add_point(self, point):
-        if self._vtk_points.GetNumberOfPoints() < self.max_points:
-            point_id = self._vtk_points.InsertNextPoint(point)
-            self._vtk_depth.InsertNextValue(point[2])
-            self._vtk_cells.InsertNextCell(1)
-            self._vtk_cells.InsertCellPoint(point_id)
+        self._scheduler = RenderScheduler(self._interactor, max_fps=max_fps)
+        self._scheduler.add_tick(self._timer_callback)
+
+    def _wrap(self, count):
+        """把缓冲区的前count个点零拷贝包装成VTK数组，点数变化时才需要重新包装"""
+        self._vtk_points.SetData(numpy_support.numpy_to_vtk(self._points[:count], deep=False))
+        self._vtk_depth = numpy_support.numpy_to_vtk(self._depth[:count], deep=False)
+        self._vtk_depth.SetName("depth")
+        self._poly_data.GetPointData().SetScalars(self._vtk_depth)
+        self._vtk_cells.SetData(numpy_support.numpy_to_vtk(self._offsets[:count + 1], deep=False),
+                                numpy_support.numpy_to_vtk(self._connectivity[:count], deep=False))
+
+    def _write(self, start, points):
+        stop = start + len(points)
+        self._points[start:stop] = points
+        self._depth[start:stop] = points[:, 2]
+        self.index.update(slice(start, stop))
+
+    def add_points(self, points):
+        """一次加入一批点 (N, 3)，没满时追加，满了之后从最早的点开始覆盖"""
+        if self._grid is not None:
+            self._add_voxels(points)
+            return
+        points = np.asarray(points, dtype=np.float32).reshape(-1, 3)
+        if len(points) >= self.max_points:
+            # 一批就超过容量时只有最后max_points个点会留下
+            points = points[-self.max_points:]
+
+        count = self._count
+        free = min(len(points), self.max_points - count)
+        if free:
+            self._write(count, points[:free])
+            self._count += free
+            points = points[free:]
+        if len(points):
+            # 环形覆盖，跨过数组末尾时分两段写
+            first = min(len(points), self.max_points - self._head)
+            self._write(self._head, points[:first])
+            self._write(0, points[first:])
+            self._head = (self._head + len(points)) % self.max_points
+
+        self._modified(count)
+
+    def _add_voxels(self, points):
+        # 体素网格直接更新平均点数组，这里只同步深度
+        count = self._count
+        touched = self._grid.add(points)
+        self._depth[touched] = self._points[touched, 2]
+        self.index.update(touched)
+        self._count = self._grid.count
+        self._modified(count)
+
+    def _modified(self, previous_count):
+        self.index.update(count=self._count)
+        # 标记数据更新，每批一次
+        if self._count != previous_count:
+            self._wrap(self._count)
         else:
-            # 随机更新已有点
-            r = np.random.randint(0, self.max_points)
-            self._vtk_points.SetPoint(r, point)
-
-        # 标记数据更新
-        self._vtk_cells.Modified()
-        self._vtk_depth.Modified()
+            self._vtk_points.GetData().Modified()
+            self._vtk_depth.Modified()
         self._vtk_points.Modified()
+        self._poly_data.Modified()
 
-    def _timer_callback(self, obj, event):
-        for _ in range(200):  # 一次加 200 个点
-            point = 20 * (np.random.rand(3) - 0.5)
-            self.add_point(point)
-        obj.GetRenderWindow().Render()
+    def add_point(self, point):
+        self.add_points(np.asarray(point).reshape(1, 3))
+
+    def points(self):
+        """目前显示的点 (count, 3)，是缓冲区的视图，例如给SurfaceRegistration.register配准"""
+        return self._points[:self._count]
+
+    def set_transform(self, matrix):
+        """显示时对点云施加4x4变换(例如配准结果)，缓冲区里的点坐标不变"""
+        vtk_matrix = vtk.vtkMatrix4x4()
+        vtk_matrix.DeepCopy(np.asarray(matrix, dtype=np.float64).ravel().tolist())
+        self._actor.SetUserMatrix(vtk_matrix)
+
+    def add_actor(self, actor):
+        """在点云的窗口里再显示一个actor(例如NeedleTrajectory.actor)"""
+        self._renderer.AddActor(actor)
+        self._scheduler.invalidate()
+
+    def on_points(self, callback):
+        """每批新到的点(合并后的)也交给 callback(points)，例如NeedleTrajectory.add_points"""
+        self._listeners.append(callback)
+
+    def start_producer(self, source, interval=0.0):
+        """
+        在后台线程里反复调用 source() 取点(跟踪器驱动、file_source回放、random_source)，
+        采集速度不再受渲染速度限制
+        """
+        self.stop_producer()
+        self._producer = PointProducer(source, self._queue, interval).start()
+        return self._producer
+
+    def stop_producer(self):
+        if self._producer is not None:
+            self._producer.stop()
+            self._producer = None
+
+    def stats(self):
+        """采集速度(点/秒)、累计点数、丢弃的点数，以及渲染的帧率和帧时间(RenderScheduler.stats)"""
+        stats = {
+            "points_per_sec": self._queue.received.rate(),
+            "points_received": self._queue.received.total,
+            "points_dropped": self._queue.dropped,
+            "points_pending": self._queue.pending,
+        }
+        stats.update(self._scheduler.stats())
+        return stats
+
+    def _timer_callback(self):
+        # 上一帧以来到达的所有批次合并成一次更新
+        points = self._queue.drain()
+        if points is not None:
+            self.add_points(points)
+            for callback in self._listeners:
+                callback(points)
+            self._scheduler.invalidate()
+
+        now = time.perf_counter()
+        if now - self._last_title >= 1.0:
+            self._last_title = now
+            stats = self.stats()
+            self._ren_win.SetWindowName(
+                f"PointCloud  {stats['fps']:.0f} fps  {stats['frame_ms_p95']:.0f} ms  "
+                f"{stats['points_per_sec']:.0f} pts/s  "
+                f"dropped {stats['points_dropped']}"
+            )
 
     def start(self):
         self._renderer.ResetCamera()
         self._ren_win.Render()
+        self._scheduler.start()
         self._interactor.Start()
+        self._scheduler.stop()
+        self.stop_producer()
 
 
 if __name__ == "__main__":
+    # 用法: python point_cloud.py [针的跟踪记录(tail_x/tail_p)] [套管长度mm]
     pc = PointCloud(max_points=10000)
+    if len(sys.argv) > 1:
+        # 回放记录: 针尖按块从mmap的记录里算出来，点云显示最近的针尖，折线显示整段轨迹
+        recording = NeedleRecording(sys.argv[1], sleeve_length=float(sys.argv[2]) if len(sys.argv) > 2 else 0.0)
+        trajectory = NeedleTrajectory()
+        pc.add_actor(trajectory.actor)
+        pc.on_points(trajectory.add_points)
+        pc.start_producer(recording.source(chunk_size=2000), interval=0.02)
+    else:
+        # 每 50ms 随机采集 200 个点，和原来的速度一样，但是在后台线程里
+        pc.start_producer(random_source(200), interval=0.05)
     pc.start()
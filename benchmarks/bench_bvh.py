@@ -0,0 +1,149 @@
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+# 网格BVH(spine_viewer.mesh_bvh.MeshBVH)基准测试：合成体模的骨表面和LoadSTL的STL模型，
+# 随机放置的穿刺针(线段，骨表面上150mm长)测 求交、胶囊体碰撞、点到表面距离 的单次延迟和批量速度，
+# 求交结果和vtkCellLocator逐条查询对比；每个跟踪器帧的完整检查(NeedleChecker.check，LoadDCM1.check_needle)
+# 测中位数和p95延迟，目标是1ms以内
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from vtkmodules.vtkCommonCore import mutable  # noqa: E402
+from vtkmodules.vtkCommonDataModel import vtkCellLocator  # noqa: E402
+
+from spine_viewer.mesh_bvh import MeshBVH, NeedleChecker  # noqa: E402
+from spine_viewer.mesh_cache import MeshCache  # noqa: E402
+
+
+def needles(bvh, count, length, rng):
+    """起点在网格包围盒里，方向随机"""
+    lo, hi = bvh.lo[1], bvh.hi[1]
+    starts = lo + rng.random((count, 3)) * (hi - lo)
+    directions = rng.normal(size=(count, 3))
+    directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+    return starts, starts + directions * length
+
+
+def latencies(func, count):
+    """每次查询的延迟(秒)"""
+    times = []
+    for i in range(count):
+        start = time.perf_counter()
+        func(i)
+        times.append(time.perf_counter() - start)
+    return np.array(times)
+
+
+def latency(func, count):
+    """单次查询的中位数延迟(秒)"""
+    return float(np.median(latencies(func, count)))
+
+
+def bench_mesh(name, polydata, queries, length, radius, rng):
+    result = {"mesh": name, "triangles": polydata.GetNumberOfPolys()}
+    start = time.perf_counter()
+    bvh = MeshBVH(polydata)
+    result["build_s"] = time.perf_counter() - start
+    starts, ends = needles(bvh, queries, length, rng)
+
+    # 单次查询(每个跟踪器帧一根针)
+    single = min(queries, 200)
+    result["segment_ms"] = latency(lambda i: bvh.intersect_segments(starts[i], ends[i]), single) * 1000
+    result["capsule_ms"] = latency(lambda i: bvh.capsule_hits(starts[i], ends[i], radius), single) * 1000
+    result["distance_ms"] = latency(lambda i: bvh.distance(ends[i]), single) * 1000
+    result["segment_distance_ms"] = latency(lambda i: bvh.segment_distance(starts[i], ends[i]), single) * 1000
+
+    # 每个跟踪器帧的完整检查: 是否碰到 + 针尖距离 + 进入位置
+    checker = NeedleChecker(polydata, bvh=bvh)
+    times = latencies(lambda i: checker.check(starts[i], ends[i], radius), min(queries, 1000)) * 1000
+    result["check_needle_ms"] = float(np.median(times))
+    result["check_needle_p95_ms"] = float(np.percentile(times, 95))
+
+    # 批量
+    start = time.perf_counter()
+    t, _ = bvh.intersect_segments(starts, ends)
+    result["segments_per_sec"] = queries / (time.perf_counter() - start)
+    start = time.perf_counter()
+    hits = bvh.capsule_hits(starts, ends, radius)
+    result["capsules_per_sec"] = queries / (time.perf_counter() - start)
+    start = time.perf_counter()
+    bvh.distance(ends)
+    result["distances_per_sec"] = queries / (time.perf_counter() - start)
+    result["segment_hit_fraction"] = float(np.isfinite(t).mean())
+    result["capsule_hit_fraction"] = float(hits.mean())
+
+    # vtkCellLocator逐条求交(从Python每次调用一次)
+    locator = vtkCellLocator()
+    locator.SetDataSet(polydata)
+    locator.BuildLocator()
+    check = min(queries, 500)
+    vtk_t = np.full(check, np.inf)
+    position, coords, sub_id, hit_t = [0.0] * 3, [0.0] * 3, mutable(0), mutable(0.0)
+    start = time.perf_counter()
+    for i in range(check):
+        if locator.IntersectWithLine(starts[i], ends[i], 1e-9, hit_t, position, coords, sub_id):
+            vtk_t[i] = float(hit_t)
+    result["vtk_cell_locator_ms"] = (time.perf_counter() - start) / check * 1000
+    hit = np.isfinite(vtk_t)
+    same_t = np.abs(np.where(hit, vtk_t, 0.0) - np.where(np.isfinite(t[:check]), t[:check], 0.0)) * length < 1e-3
+    result["matches_vtk"] = float(((hit == np.isfinite(t[:check])) & (~hit | same_t)).mean())
+
+    # vtkCellLocator逐点求最近点(点到表面距离)
+    cell_id, dist2 = mutable(0), mutable(0.0)
+    start = time.perf_counter()
+    for i in range(check):
+        locator.FindClosestPoint(ends[i], position, cell_id, sub_id, dist2)
+    result["vtk_closest_point_ms"] = (time.perf_counter() - start) / check * 1000
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="网格BVH基准测试")
+    parser.add_argument("--queries", type=int, default=10000)
+    parser.add_argument("--needle-length", type=float, default=150.0, help="骨表面上针的长度(mm)")
+    parser.add_argument("--radius", type=float, default=0.6, help="胶囊体(针)半径(mm)")
+    parser.add_argument("--skip-surface", action="store_true", help="不测合成体模的骨表面")
+    parser.add_argument("--output", default="", help="结果写入json文件")
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    meshes = []
+    if not args.skip_surface:
+        from bench_registration import phantom_surface
+        meshes.append(("phantom bone surface", phantom_surface(150, 512, 0.7, 1.0)[0], args.needle_length,
+                       args.radius))
+    cache = MeshCache()
+    stl_dir = os.path.join(ROOT, "LoadSTL", "STL")
+    for file_name in sorted(os.listdir(stl_dir)):
+        if file_name.lower().endswith(".stl"):
+            polydata = cache.load(os.path.join(stl_dir, file_name))
+            # STL模型没有单位，针长和半径按模型大小缩放
+            size = np.linalg.norm(np.subtract(polydata.GetBounds()[1::2], polydata.GetBounds()[::2]))
+            meshes.append((file_name, polydata, 0.3 * size, 0.002 * size))
+
+    results = []
+    for name, polydata, length, radius in meshes:
+        result = bench_mesh(name, polydata, args.queries, length, radius, rng)
+        results.append(result)
+        print(f"{name}: {result['triangles']} 三角形, 建树 {result['build_s'] * 1000:.0f}ms | "
+              f"单次 求交 {result['segment_ms']:.2f}ms 胶囊体 {result['capsule_ms']:.2f}ms "
+              f"点距离 {result['distance_ms']:.2f}ms 线段距离 {result['segment_distance_ms']:.2f}ms | "
+              f"每帧检查 {result['check_needle_ms']:.2f}ms (p95 {result['check_needle_p95_ms']:.2f}ms) | "
+              f"批量 求交 {result['segments_per_sec']:.0f}/s 胶囊体 {result['capsules_per_sec']:.0f}/s "
+              f"点距离 {result['distances_per_sec']:.0f}/s | "
+              f"vtkCellLocator 求交 {result['vtk_cell_locator_ms']:.3f}ms/条 最近点 {result['vtk_closest_point_ms']:.3f}ms/个, "
+              f"求交结果一致 {result['matches_vtk']:.1%}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
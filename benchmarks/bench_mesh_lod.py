@@ -0,0 +1,92 @@
+import os
+import sys
+import json
+import time
+import argparse
+
+# 网格LOD(spine_viewer.mesh_lod)基准测试：离屏渲染，测每一级减面的帧时间，
+# 以及MeshLOD按预算自动选级后的帧时间；网格是LoadSTL的STL和合成体模的骨表面
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import vtkmodules.vtkRenderingOpenGL2  # noqa: F401,E402
+from vtkmodules.vtkRenderingCore import vtkActor, vtkPolyDataMapper, vtkRenderer, vtkRenderWindow  # noqa: E402
+
+from spine_viewer.mesh_cache import MeshCache  # noqa: E402
+from spine_viewer.mesh_lod import MeshLOD, MeshPyramid  # noqa: E402
+
+
+def frame_time(render_window, frames):
+    render_window.Render()
+    start = time.perf_counter()
+    for _ in range(frames):
+        render_window.Render()
+    return (time.perf_counter() - start) / frames
+
+
+def bench_mesh(name, polydata, frames, size, target_fps):
+    start = time.perf_counter()
+    pyramid = MeshPyramid(polydata)
+    result = {"mesh": name, "build_s": time.perf_counter() - start, "levels": []}
+
+    renderer = vtkRenderer()
+    render_window = vtkRenderWindow()
+    render_window.SetOffScreenRendering(1)
+    render_window.AddRenderer(renderer)
+    render_window.SetSize(size, size)
+    mapper = vtkPolyDataMapper()
+    mapper.SetInputData(polydata)
+    actor = vtkActor()
+    actor.SetMapper(mapper)
+    renderer.AddActor(actor)
+    renderer.ResetCamera()
+
+    for fraction, level, triangles in pyramid.levels:
+        mapper.SetInputData(level)
+        result["levels"].append({"fraction": fraction, "triangles": triangles,
+                                 "frame_s": frame_time(render_window, frames)})
+
+    # 自动选级: 预算下的帧时间和选中的级别
+    lod = MeshLOD(renderer, target_fps=target_fps)
+    lod.add(actor, pyramid)
+    result["auto_frame_s"] = frame_time(render_window, frames)
+    result["auto_fraction"] = lod.levels()[actor]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="网格LOD基准测试")
+    parser.add_argument("--frames", type=int, default=20)
+    parser.add_argument("--size", type=int, default=1000, help="窗口大小(像素)")
+    parser.add_argument("--target-fps", type=float, default=30.0)
+    parser.add_argument("--skip-surface", action="store_true", help="不测合成体模的骨表面")
+    parser.add_argument("--output", default="", help="结果写入json文件")
+    args = parser.parse_args()
+
+    meshes = []
+    cache = MeshCache()
+    stl_dir = os.path.join(ROOT, "LoadSTL", "STL")
+    for file_name in sorted(os.listdir(stl_dir)):
+        if file_name.lower().endswith(".stl"):
+            meshes.append((file_name, cache.load(os.path.join(stl_dir, file_name))))
+    if not args.skip_surface:
+        from bench_registration import phantom_surface
+        meshes.append(("phantom bone surface", phantom_surface(150, 512, 0.7, 1.0)[0]))
+
+    results = []
+    for name, polydata in meshes:
+        result = bench_mesh(name, polydata, args.frames, args.size, args.target_fps)
+        results.append(result)
+        levels = ", ".join(f"{level['fraction']:.0%} {level['triangles']} 三角形 {level['frame_s'] * 1000:.1f}ms"
+                           for level in result["levels"])
+        print(f"{name}: 生成 {result['build_s']:.2f}s | {levels} | "
+              f"自动 {result['auto_fraction']:.0%} {result['auto_frame_s'] * 1000:.1f}ms")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+# 正交MPR(spine_viewer.mpr.OrthogonalMPR)基准测试：离屏渲染合成体模，
+# 测翻页(一个视图换切片)和拖动十字光标(三个视图都换切片)的帧时间，
+# 和原来LoadDCM2的vtkImageResliceMapper(每个视图都重采样)对比；
+# 以及窗宽窗位: GetScalarRange() 和 直方图(第一次计算/从缓存读)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from vtkmodules.vtkRenderingCore import vtkImageSlice  # noqa: E402
+from vtkmodules.vtkRenderingImage import vtkImageResliceMapper  # noqa: E402
+
+from synthetic_dicom import phantom_slice  # noqa: E402
+from spine_viewer.mpr import AXES, CAMERAS, OrthogonalMPR, VolumeHistogram  # noqa: E402
+from spine_viewer.rendering import create_renderer, create_render_window  # noqa: E402
+from spine_viewer.volume_cache import numpy_to_vtk_image  # noqa: E402
+
+
+def phantom_volume(slices, size, spacing):
+    volume = np.empty((slices, size, size), dtype=np.int16)
+    for k in range(slices):
+        volume[k] = phantom_slice(size, size, k * spacing[2], spacing[:2])
+    return volume
+
+
+def frame_ms(step, windows, frames):
+    """每一帧: step(k) 改切面，然后渲染windows；返回平均和95%帧时间(毫秒)"""
+    times = []
+    for k in range(frames):
+        start = time.perf_counter()
+        step(k)
+        for window in windows:
+            window.Render()
+        times.append(time.perf_counter() - start)
+    times = np.array(times) * 1000
+    return float(times.mean()), float(np.percentile(times, 95))
+
+
+def views(size):
+    result = {}
+    for name in AXES:
+        renderer = create_renderer(background=(0, 0, 0))
+        result[name] = (renderer, create_render_window(renderer, (size, size), offscreen=True))
+    return result
+
+
+def bench_empty(size, frames):
+    """空窗口的渲染时间: 软件渲染时窗口本身的开销，切片的开销要减掉它"""
+    windows = [window for _, window in views(size).values()]
+    for window in windows:
+        window.Render()
+    return frame_ms(lambda k: [window.GetRenderers().GetFirstRenderer().Modified() for window in windows],
+                    windows, frames)[0]
+
+
+def bench_mpr(vtk_image, size, frames):
+    mpr = OrthogonalMPR(vtk_image)
+    windows = {}
+    for name, (renderer, window) in views(size).items():
+        mpr.add_view(name, renderer)
+        windows[name] = window
+        window.Render()
+    center = np.array(mpr.position)
+    spacing = np.array(vtk_image.GetSpacing())
+    result = {}
+    result["scroll_ms"], result["scroll_p95_ms"] = frame_ms(
+        lambda k: mpr.scroll("axial", 1 if k % 40 < 20 else -1), [windows["axial"]], frames)
+    # 拖动光标: 在横断面里画圈，三个视图都要换切片
+    circle = lambda k: mpr.set_position(center + 40 * spacing * (np.cos(k / 5), np.sin(k / 5), 0.3 * np.sin(k / 7)))
+    result["crosshair_ms"], result["crosshair_p95_ms"] = frame_ms(circle, list(windows.values()), frames)
+    mpr.views["coronal"].set_oblique((0.0, 1.0, 0.4))
+    result["oblique_scroll_ms"], result["oblique_scroll_p95_ms"] = frame_ms(
+        lambda k: mpr.scroll("coronal", 1 if k % 40 < 20 else -1), [windows["coronal"]], frames)
+    return result
+
+
+def bench_reslice(vtk_image, size, frames):
+    """原来的做法: 每个视图一个vtkImageResliceMapper，切在相机焦点上"""
+    windows = {}
+    cameras = {}
+    for name, (renderer, window) in views(size).items():
+        mapper = vtkImageResliceMapper()
+        mapper.SetInputData(vtk_image)
+        mapper.SliceFacesCameraOn()
+        mapper.SliceAtFocalPointOn()
+        actor = vtkImageSlice()
+        actor.SetMapper(mapper)
+        actor.GetProperty().SetColorWindow(2000)
+        actor.GetProperty().SetColorLevel(0)
+        renderer.AddViewProp(actor)
+        camera = renderer.GetActiveCamera()
+        camera.ParallelProjectionOn()
+        direction, view_up = CAMERAS[name]
+        camera.SetPosition(*(-np.asarray(direction)))
+        camera.SetViewUp(*view_up)
+        renderer.ResetCamera()
+        windows[name] = window
+        cameras[name] = camera
+        window.Render()
+    spacing = np.array(vtk_image.GetSpacing())
+    center = {name: np.array(camera.GetFocalPoint()) for name, camera in cameras.items()}
+
+    def move(name, offset):
+        camera = cameras[name]
+        direction = np.asarray(CAMERAS[name][0])
+        focal = center[name] + offset
+        camera.SetFocalPoint(*focal)
+        camera.SetPosition(*(focal - 1000 * direction))
+
+    def scroll(k):
+        offset = np.zeros(3)
+        offset[2] = spacing[2] * (k % 20 if k % 40 < 20 else 20 - k % 20)
+        move("axial", offset)
+
+    def circle(k):
+        for name in cameras:
+            move(name, 40 * spacing * (np.cos(k / 5), np.sin(k / 5), 0.3 * np.sin(k / 7)))
+
+    result = {}
+    result["scroll_ms"], result["scroll_p95_ms"] = frame_ms(scroll, [windows["axial"]], frames)
+    result["crosshair_ms"], result["crosshair_p95_ms"] = frame_ms(circle, list(windows.values()), frames)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="正交MPR基准测试")
+    parser.add_argument("--slices", type=int, default=200)
+    parser.add_argument("--size", type=int, default=512, help="切片的行列数")
+    parser.add_argument("--window", type=int, default=400, help="每个视图的窗口大小(像素)")
+    parser.add_argument("--frames", type=int, default=60)
+    parser.add_argument("--output", default="", help="结果写入json文件")
+    args = parser.parse_args()
+
+    spacing = (0.7, 0.7, 1.0)
+    volume = phantom_volume(args.slices, args.size, spacing)
+    result = {"shape": list(volume.shape), "window": args.window}
+
+    vtk_image = numpy_to_vtk_image(volume, spacing)
+    start = time.perf_counter()
+    vtk_image.GetScalarRange()
+    result["scalar_range_s"] = time.perf_counter() - start
+    with tempfile.TemporaryDirectory() as cache_dir:
+        start = time.perf_counter()
+        VolumeHistogram(volume, key="bench", cache_dir=cache_dir)
+        result["histogram_s"] = time.perf_counter() - start
+        start = time.perf_counter()
+        VolumeHistogram(volume, key="bench", cache_dir=cache_dir)
+        result["histogram_cached_s"] = time.perf_counter() - start
+
+    result["empty_three_windows_ms"] = bench_empty(args.window, args.frames)
+    result["mpr"] = bench_mpr(vtk_image, args.window, args.frames)
+    result["reslice"] = bench_reslice(vtk_image, args.window, args.frames)
+
+    print(f"体数据 {volume.shape}, 视图 {args.window}x{args.window} | 窗宽窗位: GetScalarRange "
+          f"{result['scalar_range_s'] * 1000:.0f}ms, 直方图 {result['histogram_s'] * 1000:.0f}ms, "
+          f"缓存 {result['histogram_cached_s'] * 1000:.1f}ms | 三个空窗口 {result['empty_three_windows_ms']:.1f}ms")
+    for name in ("mpr", "reslice"):
+        r = result[name]
+        line = (f"{name}: 翻页 {r['scroll_ms']:.1f}ms (p95 {r['scroll_p95_ms']:.1f}) "
+                f"拖动光标(三个视图) {r['crosshair_ms']:.1f}ms (p95 {r['crosshair_p95_ms']:.1f})")
+        if "oblique_scroll_ms" in r:
+            line += f" 斜切面翻页 {r['oblique_scroll_ms']:.1f}ms (p95 {r['oblique_scroll_p95_ms']:.1f})"
+        print(line)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
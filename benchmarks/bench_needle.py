@@ -0,0 +1,131 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+# 针的跟踪记录(spine_viewer.needle.NeedleRecording)基准测试：合成一段长记录(默认1小时、250Hz)，
+# 测打开(mmap)、一次算完所有帧的针尖、按块流式计算的速度和内存，
+# 和逐帧用Python计算(原来手工解析的做法)对比
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from spine_viewer.instrument import current_rss  # noqa: E402
+from spine_viewer.needle import NeedleRecording, needle_tips, save_recording  # noqa: E402
+
+
+def synthetic_recording(path, frames, rate, rng):
+    """针在病人上方慢慢移动、转动，偶尔丢帧(NaN)，分块写，不需要整段都在内存里"""
+    record = None
+    chunk = 1 << 20
+    for first in range(0, frames, chunk):
+        n = min(chunk, frames - first)
+        t = (first + np.arange(n)) / rate
+        angle = 0.3 * np.sin(t / 7.0)
+        q = np.stack([np.cos(angle / 2), np.sin(angle / 2) * 0.6, np.sin(angle / 2) * 0.8, np.zeros(n)], axis=1)
+        p = np.stack([100 * np.sin(t / 60), 80 * np.cos(t / 45), 200 + 20 * np.sin(t / 13)], axis=1)
+        p += rng.normal(0, 0.1, p.shape)
+        q[rng.random(n) < 0.001] = np.nan
+        if record is None:
+            save_recording(path, tail_x=q[:1], tail_p=p[:1], time=t[:1])
+            dtype = np.load(path, mmap_mode="r").dtype
+            record = np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=(frames,))
+        record["tail_x"][first:first + n] = q
+        record["tail_p"][first:first + n] = p
+        record["time"][first:first + n] = t
+    record.flush()
+
+
+def anon_rss():
+    """匿名内存(字节)：mmap的文件页也算在RSS里，但系统随时可以丢掉，这里只看真正分配的内存；取不到时用RSS"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("RssAnon:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return current_rss()
+
+
+def per_frame_tips(tail_p, tail_x, length):
+    """逐帧计算(对比用)"""
+    tips = []
+    for p, q in zip(tail_p, tail_x):
+        w, x, y, z = q
+        direction = np.array([1 - 2 * (y * y + z * z), 2 * (x * y + w * z), 2 * (x * z - w * y)])
+        tips.append(p + length * direction / np.linalg.norm(direction))
+    return np.array(tips)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="针的跟踪记录读取基准测试")
+    parser.add_argument("--minutes", type=float, default=60.0)
+    parser.add_argument("--rate", type=float, default=250.0, help="跟踪器帧率(Hz)")
+    parser.add_argument("--sleeve", type=float, default=100.0, help="套管长度(mm)")
+    parser.add_argument("--chunk", type=int, default=1 << 16)
+    parser.add_argument("--output", default="", help="结果写入json文件")
+    args = parser.parse_args()
+
+    frames = int(args.minutes * 60 * args.rate)
+    work_dir = tempfile.mkdtemp(prefix="bench_needle_")
+    path = os.path.join(work_dir, "recording.npy")
+    try:
+        synthetic_recording(path, frames, args.rate, np.random.default_rng(0))
+        result = {"frames": frames, "file_mb": os.path.getsize(path) / 1e6}
+
+        memory = anon_rss()
+        start = time.perf_counter()
+        recording = NeedleRecording(path, sleeve_length=args.sleeve)
+        result["open_s"] = time.perf_counter() - start
+        result["open_memory_mb"] = (anon_rss() - memory) / 1e6
+
+        # 按块流式: 内存只和块大小有关
+        memory = anon_rss()
+        peak = 0
+        valid = 0
+        start = time.perf_counter()
+        for _, tips, _ in recording.chunks(args.chunk):
+            valid += int(np.isfinite(tips[:, 0]).sum())
+            peak = max(peak, anon_rss() - memory)
+        result["chunked_s"] = time.perf_counter() - start
+        result["chunked_frames_per_sec"] = frames / result["chunked_s"]
+        result["chunked_peak_memory_mb"] = peak / 1e6
+        result["valid_frames"] = valid
+
+        # 一次算完所有帧(结果本身要 frames * 48 字节)
+        start = time.perf_counter()
+        tips, _ = recording.tips()
+        result["full_pass_s"] = time.perf_counter() - start
+        del tips
+
+        # 逐帧Python计算，只算一部分再换算
+        sample = min(frames, 20000)
+        tail_p = np.array(recording.tail_p[:sample])
+        tail_x = np.array(recording.tail_x[:sample])
+        start = time.perf_counter()
+        slow = per_frame_tips(tail_p, tail_x, recording.length)
+        result["per_frame_frames_per_sec"] = sample / (time.perf_counter() - start)
+        fast, _ = needle_tips(tail_p, tail_x, recording.length)
+        result["matches_per_frame"] = bool(np.allclose(slow, fast, equal_nan=True))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"{frames} 帧 ({args.minutes:.0f} 分钟, {result['file_mb']:.0f}MB): 打开 {result['open_s'] * 1000:.1f}ms "
+          f"(+{result['open_memory_mb']:.1f}MB) | 按块 {result['chunked_s']:.2f}s "
+          f"{result['chunked_frames_per_sec'] / 1e6:.1f}M帧/s 内存峰值 +{result['chunked_peak_memory_mb']:.1f}MB | "
+          f"一次算完 {result['full_pass_s']:.2f}s | 逐帧 {result['per_frame_frames_per_sec']:.0f}帧/s "
+          f"(整段 {frames / result['per_frame_frames_per_sec']:.0f}s), 结果一致 {result['matches_per_frame']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+
+import numpy as np
+
+# 分阶段基准测试：合成CT序列 -> load_dicom_series / create_volume_data / create_vtk_image_data
+# -> marching cubes(原LoadDCM1) 和 flying edges(spine_viewer.surface) -> 离屏渲染N帧
+# 另外测 LoadSTL/STL/*.stl 的读取和 PointCloud 加点的速度
+# 结果写成json，不同提交之间可以对比
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_dicom import write_ct_series  # noqa: E402
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def summarize(samples):
+    return {
+        "median_s": statistics.median(samples),
+        "min_s": min(samples),
+        "max_s": max(samples),
+        "runs_s": samples,
+    }
+
+
+def git_commit():
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                capture_output=True, text=True, check=True)
+        return result.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_dicom(dicom_dir, repeat, frames, iso_value, size):
+    """DICOM流程各阶段，每次用新的体数据缓存目录，测的是冷启动(没有缓存)的时间"""
+    from vtkmodules.vtkFiltersCore import vtkMarchingCubes, vtkSmoothPolyDataFilter
+
+    from spine_viewer.pipeline import DicomVolumePipeline
+    from spine_viewer.rendering import create_renderer, create_render_window
+    from spine_viewer.surface import BoneSurfaceExtractor
+    from spine_viewer.volume_cache import VolumeCache
+
+    stages = {}
+
+    def add(name, seconds):
+        stages.setdefault(name, []).append(seconds)
+
+    for _ in range(repeat):
+        cache_dir = tempfile.mkdtemp(prefix="bench_volumes_")
+        try:
+            pipeline = DicomVolumePipeline(cache=VolumeCache(cache_dir))
+            series, seconds = timed(pipeline.load_dicom_series, dicom_dir, decode=False)
+            add("load_dicom_series", seconds)
+            volume, seconds = timed(pipeline.create_volume_data, series)
+            add("create_volume_data", seconds)
+            _, seconds = timed(pipeline.create_volume_data, series)
+            add("create_volume_data_cached", seconds)
+            vtk_image, seconds = timed(pipeline.create_vtk_image_data, volume, series)
+            add("create_vtk_image_data", seconds)
+
+            # 原LoadDCM1的做法: marching cubes + 20次光滑
+            start = time.perf_counter()
+            iso = vtkMarchingCubes()
+            iso.SetInputData(vtk_image)
+            iso.SetValue(0, iso_value)
+            iso.Update()
+            add("marching_cubes", time.perf_counter() - start)
+            smooth = vtkSmoothPolyDataFilter()
+            smooth.SetInputConnection(iso.GetOutputPort())
+            smooth.SetNumberOfIterations(20)
+            smooth.SetRelaxationFactor(0.1)
+            smooth.Update()
+            add("marching_cubes_smoothed", time.perf_counter() - start)
+
+            extractor = BoneSurfaceExtractor(iso_value=iso_value)
+            surface, seconds = timed(extractor.build, vtk_image)
+            add("bone_surface", seconds)
+
+            renderer = create_renderer()
+            renderer.AddVolume(pipeline.setup_volume_rendering(vtk_image))
+            renderer.ResetCamera()
+            render_window = create_render_window(renderer, size=size, offscreen=True)
+            _, seconds = timed(render_window.Render)
+            add("render_first_frame", seconds)
+            frame_times = []
+            for _ in range(frames):
+                renderer.GetActiveCamera().Azimuth(360.0 / frames)
+                _, seconds = timed(render_window.Render)
+                frame_times.append(seconds)
+            add("render_frame", statistics.median(frame_times))
+            render_window.Finalize()
+        finally:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+    info = {
+        "slices": len(series),
+        "shape": list(volume.shape),
+        "dtype": str(volume.dtype),
+        "triangles_marching_cubes": smooth.GetOutput().GetNumberOfPolys(),
+        "triangles_bone_surface": surface.GetNumberOfPolys(),
+        "frames": frames,
+    }
+    return {name: summarize(samples) for name, samples in stages.items()}, info
+
+
+def bench_stl(stl_dir, repeat):
+    """读取STL目录下的每个文件: 直接用vtkSTLReader，和经过网格缓存(MeshCache，LoadSTL.load_stl和SceneLoader都用它)第一次/之后的读取"""
+    import tempfile
+    from vtkmodules.vtkIOGeometry import vtkSTLReader
+    from spine_viewer.mesh_cache import MeshCache
+
+    results = {}
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = MeshCache(cache_dir=cache_dir)
+        for stl_path in sorted(glob.glob(os.path.join(stl_dir, "*.stl"))):
+            samples = []
+            for _ in range(repeat):
+                reader = vtkSTLReader()
+                reader.SetFileName(stl_path)
+                _, seconds = timed(reader.Update)
+                samples.append(seconds)
+            result = summarize(samples)
+            result["triangles"] = reader.GetOutput().GetNumberOfPolys()
+            result["bytes"] = os.path.getsize(stl_path)
+            result["memory_kb"] = reader.GetOutput().GetActualMemorySize()
+
+            _, result["cache_first_s"] = timed(cache.load, stl_path)
+            samples = []
+            for _ in range(repeat):
+                polydata, seconds = timed(cache.load, stl_path)
+                samples.append(seconds)
+            result["cache_hit"] = summarize(samples)
+            result["cache_memory_kb"] = polydata.GetActualMemorySize()
+            results[os.path.basename(stl_path)] = result
+    return results
+
+
+def bench_point_cloud(repeat, points, max_points):
+    """PointCloud加点的速度，有add_points时整批加，否则逐个add_point"""
+    sys.path.insert(0, os.path.join(ROOT, "PointCloud"))
+    from point_cloud import PointCloud
+
+    rng = np.random.default_rng(0)
+    data = 20 * (rng.random((points, 3)) - 0.5)
+    samples = []
+    for _ in range(repeat):
+        cloud = PointCloud(max_points=max_points)
+        cloud._ren_win.SetOffScreenRendering(1)
+        start = time.perf_counter()
+        if hasattr(cloud, "add_points"):
+            cloud.add_points(data)
+        else:
+            for point in data:
+                cloud.add_point(point)
+        samples.append(time.perf_counter() - start)
+        cloud._ren_win.Finalize()
+    result = summarize(samples)
+    result["points"] = points
+    result["max_points"] = max_points
+    result["points_per_sec"] = points / result["median_s"]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="spine_viewer分阶段基准测试")
+    parser.add_argument("--dicom", default="", help="DICOM目录，不给时生成合成CT序列")
+    parser.add_argument("--slices", type=int, default=100)
+    parser.add_argument("--size", type=int, default=512, help="合成切片的行数=列数")
+    parser.add_argument("--spacing", type=float, default=0.7)
+    parser.add_argument("--thickness", type=float, default=1.0)
+    parser.add_argument("--slope", type=float, default=1.0)
+    parser.add_argument("--intercept", type=float, default=-1024.0)
+    parser.add_argument("--iso", type=float, default=200.0)
+    parser.add_argument("--frames", type=int, default=30, help="离屏渲染帧数")
+    parser.add_argument("--window", type=int, default=800, help="渲染窗口边长")
+    parser.add_argument("--points", type=int, default=20000)
+    parser.add_argument("--max-points", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--skip", action="append", default=[], choices=["dicom", "stl", "pointcloud"])
+    parser.add_argument("--output", default="", help="结果写入json文件")
+    args = parser.parse_args()
+
+    import vtkmodules
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": np.__version__,
+        "vtk": vtkmodules.__version__,
+        "cpu_count": os.cpu_count(),
+        "args": vars(args),
+    }
+
+    if "dicom" not in args.skip:
+        tmp_dir = None
+        dicom_dir = args.dicom
+        if not dicom_dir:
+            tmp_dir = tempfile.mkdtemp(prefix="bench_dicom_")
+            dicom_dir = tmp_dir
+            _, seconds = timed(write_ct_series, dicom_dir, slices=args.slices, rows=args.size, cols=args.size,
+                               pixel_spacing=(args.spacing, args.spacing), slice_thickness=args.thickness,
+                               slope=args.slope, intercept=args.intercept)
+            print(f"合成CT序列: {args.slices} x {args.size}x{args.size}, {seconds:.2f}s")
+        try:
+            report["dicom"], report["dicom_info"] = bench_dicom(
+                dicom_dir, args.repeat, args.frames, args.iso, (args.window, args.window)
+            )
+        finally:
+            if tmp_dir:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+    if "stl" not in args.skip:
+        report["stl"] = bench_stl(os.path.join(ROOT, "LoadSTL", "STL"), args.repeat)
+    if "pointcloud" not in args.skip:
+        report["pointcloud"] = bench_point_cloud(args.repeat, args.points, args.max_points)
+
+    print()
+    for section in ("dicom", "stl"):
+        for name, result in report.get(section, {}).items():
+            line = f"{section:10s} {name:28s} {result['median_s'] * 1000:10.1f}ms"
+            if "cache_hit" in result:
+                line += (f"  (缓存 {result['cache_hit']['median_s'] * 1000:.1f}ms, "
+                         f"内存 {result['memory_kb']}KB -> {result['cache_memory_kb']}KB)")
+            print(line)
+    if "pointcloud" in report:
+        result = report["pointcloud"]
+        print(f"{'pointcloud':10s} {'add ' + str(result['points']) + ' points':28s} "
+              f"{result['median_s'] * 1000:10.1f}ms  ({result['points_per_sec']:.0f} 点/秒)")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
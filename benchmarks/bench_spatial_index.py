@@ -0,0 +1,111 @@
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+# 点云空间索引(spine_viewer.spatial_index.PointIndex)基准测试
+# 点是带噪声的椭球面(模拟扫描的病人体表，单位mm)，测10k/100k/1M个点时的
+# 建索引、插入、最近点、半径、包围盒查询速度，最近点和暴力计算对比结果
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from spine_viewer.spatial_index import PointIndex  # noqa: E402
+
+
+def surface_points(n, rng):
+    theta = rng.random(n) * 2 * np.pi
+    phi = np.arccos(1 - 2 * rng.random(n))
+    radius = np.array([180.0, 120.0, 300.0])
+    points = np.stack([np.sin(phi) * np.cos(theta), np.sin(phi) * np.sin(theta), np.cos(phi)], axis=1) * radius
+    return (points + rng.normal(0, 0.5, (n, 3))).astype(np.float32)
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def bench_size(n, queries, batch, rng):
+    points = surface_points(n, rng)
+    result = {"points": n}
+
+    # 建索引(第一次查询前)
+    index = PointIndex(points)
+    _, result["build_s"] = timed(index.rebuild)
+    result["cell_size"] = float(index.cell_size)
+
+    # 插入: 一批批写进缓冲区并标记，和PointCloud一样，不触发重建
+    buffer = np.zeros_like(points)
+    growing = PointIndex(buffer, count=0)
+    start = time.perf_counter()
+    for first in range(0, n, batch):
+        buffer[first:first + batch] = points[first:first + batch]
+        growing.update(slice(first, first + batch), count=min(n, first + batch))
+    elapsed = time.perf_counter() - start
+    result["insert_points_per_sec"] = n / elapsed
+
+    # 查询点在表面附近
+    query = points[rng.integers(0, n, queries)] + rng.normal(0, 2.0, (queries, 3)).astype(np.float32)
+    (distance, nearest), seconds = timed(index.nearest, query)
+    result["nearest_s"] = seconds
+    result["nearest_queries_per_sec"] = queries / seconds
+
+    # 插入后第一次查询(包含按需重建)
+    _, result["nearest_after_insert_s"] = timed(growing.nearest, query)
+
+    # 暴力计算对比(只取一部分查询点)
+    check = query[:200].astype(np.float64)
+    all_points = points.astype(np.float64)
+    start = time.perf_counter()
+    brute = np.array([np.sqrt(((all_points - q) ** 2).sum(axis=1).min()) for q in check])
+    result["brute_force_queries_per_sec"] = len(check) / (time.perf_counter() - start)
+    result["nearest_matches_brute_force"] = bool(np.allclose(distance[:200], brute, atol=1e-3))
+
+    centers = query[:100]
+    start = time.perf_counter()
+    found = sum(len(index.radius(c, 5.0)) for c in centers)
+    result["radius_5mm_s"] = (time.perf_counter() - start) / len(centers)
+    result["radius_5mm_mean_hits"] = found / len(centers)
+
+    start = time.perf_counter()
+    found = 0
+    for c in centers:
+        bounds = (c[0] - 20, c[0] + 20, c[1] - 20, c[1] + 20, c[2] - 20, c[2] + 20)
+        found += len(index.box(bounds))
+    result["box_40mm_s"] = (time.perf_counter() - start) / len(centers)
+    result["box_40mm_mean_hits"] = found / len(centers)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="点云空间索引基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--queries", type=int, default=10000)
+    parser.add_argument("--batch", type=int, default=1000, help="插入时每批点数")
+    parser.add_argument("--output", default="", help="结果写入json文件")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    results = []
+    for n in args.sizes:
+        result = bench_size(n, args.queries, args.batch, rng)
+        results.append(result)
+        print(f"{n:>8d} 点: 建索引 {result['build_s'] * 1000:7.1f}ms, "
+              f"插入 {result['insert_points_per_sec'] / 1e6:6.1f}M 点/秒, "
+              f"最近点 {result['nearest_queries_per_sec']:9.0f} 次/秒 "
+              f"(暴力 {result['brute_force_queries_per_sec']:7.0f} 次/秒, "
+              f"{'一致' if result['nearest_matches_brute_force'] else '不一致'}), "
+              f"半径 {result['radius_5mm_s'] * 1000:.2f}ms, 包围盒 {result['box_40mm_s'] * 1000:.2f}ms")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
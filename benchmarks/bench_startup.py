@@ -0,0 +1,105 @@
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+# 冷启动测试：每次在新的python进程里测 import spine_viewer -> 第一帧(离屏渲染) 的时间
+# 同时记录 import vtk 整包的时间做对比，以及启动后有没有意外导入vtk/pydicom/PyQt5整包
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import json, sys, time
+t0 = time.perf_counter()
+sys.path.insert(0, {root!r})
+import spine_viewer
+t_import = time.perf_counter()
+lazy = {{name: name in sys.modules for name in ("vtk", "pydicom", "PyQt5")}}
+
+import numpy as np
+from spine_viewer.pipeline import DicomVolumePipeline
+from spine_viewer.rendering import create_renderer, create_render_window
+from spine_viewer.volume_cache import numpy_to_vtk_image
+t_modules = time.perf_counter()
+
+pipeline = DicomVolumePipeline()
+dicom_dir = {dicom_dir!r}
+if dicom_dir:
+    vtk_image = pipeline.load_volume_image(dicom_dir, progressive={progressive})
+else:
+    # 没给DICOM目录时用一个合成的小体数据，只测启动开销
+    volume = np.full((64, 128, 128), -1000, dtype=np.int16)
+    volume[16:48, 32:96, 32:96] = 700
+    vtk_image = numpy_to_vtk_image(volume, (1.0, 1.0, 1.0))
+t_data = time.perf_counter()
+
+renderer = create_renderer()
+renderer.AddVolume(pipeline.setup_volume_rendering(vtk_image))
+renderer.ResetCamera()
+render_window = create_render_window(renderer, size=(400, 400), offscreen=True)
+render_window.Render()
+t_frame = time.perf_counter()
+
+print("@@" + json.dumps({{
+    "import_s": t_import - t0,
+    "modules_s": t_modules - t_import,
+    "data_s": t_data - t_modules,
+    "first_render_s": t_frame - t_data,
+    "import_to_first_frame_s": t_frame - t0,
+    "heavy_imports_after_import": lazy,
+}}))
+"""
+
+BASELINE = r"""
+import json, time
+t0 = time.perf_counter()
+import vtk
+print("@@" + json.dumps({"import_vtk_s": time.perf_counter() - t0}))
+"""
+
+
+def run_child(code):
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    wall = time.perf_counter() - start
+    for line in result.stdout.splitlines():
+        if line.startswith("@@"):
+            data = json.loads(line[2:])
+            data["process_wall_s"] = wall
+            return data
+    raise RuntimeError(result.stdout + result.stderr)
+
+
+def median_of(runs, key):
+    return statistics.median(run[key] for run in runs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="spine_viewer冷启动时间测试")
+    parser.add_argument("--dicom", default="", help="DICOM目录，不给时用合成体数据")
+    parser.add_argument("--progressive", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default="", help="结果写入json文件")
+    args = parser.parse_args()
+
+    code = CHILD.format(root=ROOT, dicom_dir=args.dicom, progressive=args.progressive)
+    runs = [run_child(code) for _ in range(args.repeat)]
+    baseline = [run_child(BASELINE) for _ in range(args.repeat)]
+
+    summary = {key: median_of(runs, key) for key in
+               ("import_s", "modules_s", "data_s", "first_render_s", "import_to_first_frame_s", "process_wall_s")}
+    summary["import_vtk_baseline_s"] = median_of(baseline, "import_vtk_s")
+    summary["heavy_imports_after_import"] = runs[0]["heavy_imports_after_import"]
+
+    for key, value in summary.items():
+        print(f"{key:32s} {value if isinstance(value, dict) else f'{value * 1000:.1f}ms'}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "runs": runs, "baseline": baseline}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import os
+import argparse
+import numpy as np
+
+# 合成CT序列：体模是椭圆形躯干(软组织+皮下脂肪) + 沿z方向排列的椎体(皮质骨外壳、松质骨、椎间盘)
+# + 椎弓根和棘突，用来在没有真实数据的机器(CI)上跑基准测试
+
+AIR, FAT, SOFT, DISC, CANCELLOUS, CORTICAL = -1000, -100, 40, 80, 250, 900
+
+
+def phantom_slice(rows, cols, z, spacing, vertebra_height=25.0, disc_height=5.0):
+    """z(mm)处一张切片的HU值，(rows, cols) int16"""
+    dy, dx = spacing
+    y = (np.arange(rows) - rows / 2) * dy
+    x = (np.arange(cols) - cols / 2) * dx
+    yy, xx = np.meshgrid(y, x, indexing="ij")
+    # 躯干占视野的大部分，椎体在后方
+    a, b = cols * dx * 0.42, rows * dy * 0.32
+    body = (xx / a) ** 2 + (yy / b) ** 2
+    hu = np.full((rows, cols), AIR, dtype=np.int16)
+    hu[body <= 1.0] = FAT
+    hu[body <= 0.85] = SOFT
+
+    period = vertebra_height + disc_height
+    cy = b * 0.35
+    r = min(a, b) * 0.22
+    dist = np.sqrt(xx ** 2 + (yy - cy) ** 2)
+    if z % period < vertebra_height:
+        hu[dist <= r] = CORTICAL
+        hu[dist <= r * 0.85] = CANCELLOUS
+        # 椎弓根: 椎体后方左右两根
+        for side in (-1, 1):
+            pedicle = (np.abs(xx - side * r * 0.6) <= r * 0.2) & (yy > cy + r * 0.7) & (yy < cy + r * 1.6)
+            hu[pedicle] = CORTICAL
+        # 棘突
+        spinous = (np.abs(xx) <= r * 0.15) & (yy > cy + r * 1.4) & (yy < cy + r * 2.4)
+        hu[spinous] = CORTICAL
+    else:
+        hu[dist <= r] = DISC
+    return hu
+
+
+def write_ct_series(out_dir, slices=100, rows=512, cols=512, pixel_spacing=(0.7, 0.7), slice_thickness=1.0,
+                    slope=1.0, intercept=-1024.0, bits_stored=12, noise=10.0, shuffle=True, seed=0):
+    """
+    写一个合成CT序列到out_dir，返回文件列表
+    pixel_spacing: (行间距, 列间距) mm，slice_thickness: 切片间距 mm
+    slope/intercept: 写进RescaleSlope/RescaleIntercept，像素值 = (HU - intercept) / slope
+    shuffle: 打乱文件名顺序，读取时必须按位置排序
+    """
+    import pydicom
+    from pydicom.dataset import Dataset, FileMetaDataset
+    from pydicom.uid import CTImageStorage, ExplicitVRLittleEndian, generate_uid
+
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    series_uid = generate_uid()
+    study_uid = generate_uid()
+    order = rng.permutation(slices) if shuffle else np.arange(slices)
+    raw_max = (1 << bits_stored) - 1
+
+    file_paths = []
+    for number, k in enumerate(order):
+        z = float(k) * slice_thickness
+        hu = phantom_slice(rows, cols, z, pixel_spacing).astype(np.float32)
+        if noise:
+            hu += rng.normal(0, noise, hu.shape).astype(np.float32)
+        raw = np.clip(np.rint((hu - intercept) / slope), 0, raw_max).astype(np.uint16)
+
+        meta = FileMetaDataset()
+        meta.MediaStorageSOPClassUID = CTImageStorage
+        meta.MediaStorageSOPInstanceUID = generate_uid()
+        meta.TransferSyntaxUID = ExplicitVRLittleEndian
+
+        ds = Dataset()
+        ds.file_meta = meta
+        ds.SOPClassUID = CTImageStorage
+        ds.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+        ds.StudyInstanceUID = study_uid
+        ds.SeriesInstanceUID = series_uid
+        ds.Modality = "CT"
+        ds.InstanceNumber = int(k) + 1
+        ds.Rows, ds.Columns = rows, cols
+        ds.PixelSpacing = [float(pixel_spacing[0]), float(pixel_spacing[1])]
+        ds.SliceThickness = float(slice_thickness)
+        ds.ImagePositionPatient = [-cols * pixel_spacing[1] / 2, -rows * pixel_spacing[0] / 2, z]
+        ds.ImageOrientationPatient = [1, 0, 0, 0, 1, 0]
+        ds.RescaleSlope = slope
+        ds.RescaleIntercept = intercept
+        ds.SamplesPerPixel = 1
+        ds.PhotometricInterpretation = "MONOCHROME2"
+        ds.BitsAllocated = 16
+        ds.BitsStored = bits_stored
+        ds.HighBit = bits_stored - 1
+        ds.PixelRepresentation = 0
+        ds.PixelData = raw.tobytes()
+
+        file_path = os.path.join(out_dir, f"IM{number:05d}.dcm")
+        pydicom.dcmwrite(file_path, ds, enforce_file_format=True)
+        file_paths.append(file_path)
+    return file_paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成合成CT序列")
+    parser.add_argument("out_dir")
+    parser.add_argument("--slices", type=int, default=100)
+    parser.add_argument("--size", type=int, default=512, help="行数=列数")
+    parser.add_argument("--spacing", type=float, default=0.7, help="像素间距 mm")
+    parser.add_argument("--thickness", type=float, default=1.0, help="切片间距 mm")
+    parser.add_argument("--slope", type=float, default=1.0)
+    parser.add_argument("--intercept", type=float, default=-1024.0)
+    args = parser.parse_args()
+
+    files = write_ct_series(args.out_dir, slices=args.slices, rows=args.size, cols=args.size,
+                            pixel_spacing=(args.spacing, args.spacing), slice_thickness=args.thickness,
+                            slope=args.slope, intercept=args.intercept)
+    print(f"已生成 {len(files)} 个切片: {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+脊柱DICOM读取、体数据构建和渲染
+
+子模块都是用到时才导入(PEP 562 __getattr__)，import spine_viewer 本身不会导入vtk、pydicom或PyQt5
+"""
+import importlib
+
+# 导出名 -> 所在子模块
+_EXPORTS = {
+    "DicomSeriesLoader": "dicom_loader",
+    "DicomIndex": "dicom_index",
+    "SliceRecord": "dicom_index",
+    "VolumeBuilder": "volume_builder",
+    "build_volume": "volume_builder",
+    "choose_dtype": "volume_builder",
+    "VolumeCache": "volume_cache",
+    "numpy_to_vtk_image": "volume_cache",
+    "VolumeROI": "roi",
+    "ProgressiveVolumeLoader": "progressive_loader",
+    "VolumePyramid": "volume_pyramid",
+    "InteractiveLOD": "volume_pyramid",
+    "TransferFunctionPresets": "tf_presets",
+    "OrthogonalMPR": "mpr",
+    "VolumeHistogram": "mpr",
+    "BoneSurfaceExtractor": "surface",
+    "load_polydata": "mesh_io",
+    "save_polydata": "mesh_io",
+    "export_stl": "mesh_io",
+    "MeshCache": "mesh_cache",
+    "MeshPyramid": "mesh_lod",
+    "MeshLOD": "mesh_lod",
+    "MeshBVH": "mesh_bvh",
+    "NeedleChecker": "mesh_bvh",
+    "SceneLoader": "scene",
+    "load_manifest": "scene",
+    "VoxelGrid": "voxel_grid",
+    "PointIndex": "spatial_index",
+    "SurfaceRegistration": "registration",
+    "NeedleRecording": "needle",
+    "NeedleTrajectory": "needle",
+    "RenderScheduler": "render_scheduler",
+    "PointBatchQueue": "ingest",
+    "PointProducer": "ingest",
+    "Instrumentation": "instrument",
+    "DicomVolumePipeline": "pipeline",
+    "ThumbnailBatch": "thumbnails",
+    "DicomVolumeWidget": "qt_viewer",
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module_name}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,143 @@
+import os
+import json
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+from .instrument import log
+from .dicom_loader import _read_header, list_files, group_series, sort_slices
+
+# DICOM目录索引：记录每个文件的大小、修改时间和排序/几何需要的头信息
+# 再次打开同一个目录时只重新读取新增或改动过的文件
+
+INDEX_NAME = ".dicom_index.json"
+INDEX_VERSION = 2
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "spine_viewer", "dicom_index")
+
+# 索引里保存的头信息，名字和DICOM关键字一致
+_HEADER_TAGS = (
+    "SeriesInstanceUID", "InstanceNumber", "ImagePositionPatient", "Rows", "Columns",
+    "PixelSpacing", "SliceThickness", "RescaleSlope", "RescaleIntercept",
+    "BitsAllocated", "BitsStored", "PixelRepresentation",
+)
+
+
+def _to_json_value(value):
+    # MultiValue / DSfloat / IS 转成普通的list、float、int
+    from pydicom.multival import MultiValue
+    if isinstance(value, (list, tuple, MultiValue)):
+        return [_to_json_value(v) for v in value]
+    if isinstance(value, int):
+        return int(value)
+    if isinstance(value, float):
+        return float(value)
+    return str(value)
+
+
+class SliceRecord:
+    """
+    索引中的一个切片，属性名和pydicom的Dataset一致
+    所以可以直接传给sort_slices、create_vtk_image_data等函数
+    """
+
+    def __init__(self, filename, header):
+        self.filename = filename
+        self.header = header
+        for tag, value in header.items():
+            setattr(self, tag, value)
+
+    @classmethod
+    def from_dataset(cls, filename, ds):
+        header = {tag: _to_json_value(ds.get(tag)) for tag in _HEADER_TAGS
+                  if ds.get(tag) not in (None, "")}
+        return cls(filename, header)
+
+    def __repr__(self):
+        return f"SliceRecord({self.filename!r})"
+
+
+class DicomIndex:
+    """
+    目录索引，默认保存在数据目录下的 .dicom_index.json
+    目录不可写时保存到 ~/.cache/spine_viewer/dicom_index
+    """
+
+    def __init__(self, directory_path, index_path=None, workers=None):
+        self.directory_path = os.path.abspath(directory_path)
+        self.index_path = index_path or self._default_index_path()
+        self.workers = workers or os.cpu_count() or 1
+        self.entries = {}
+        self.stats = {}
+
+    def _default_index_path(self):
+        if os.access(self.directory_path, os.W_OK):
+            return os.path.join(self.directory_path, INDEX_NAME)
+        key = hashlib.sha1(self.directory_path.encode("utf-8")).hexdigest()
+        return os.path.join(CACHE_DIR, key + ".json")
+
+    def _load(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if data.get("version") != INDEX_VERSION or data.get("directory") != self.directory_path:
+            return {}
+        return data.get("entries", {})
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        data = {"version": INDEX_VERSION, "directory": self.directory_path, "entries": self.entries}
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.index_path)
+
+    def update(self):
+        """扫描目录，只读取新增或改动过的文件，返回所有图像切片的SliceRecord"""
+        start = time.perf_counter()
+        old_entries = self._load()
+        entries = {}
+        stale = []
+        for file_path in list_files(self.directory_path):
+            rel_path = os.path.relpath(file_path, self.directory_path)
+            if os.path.basename(file_path) in (INDEX_NAME, INDEX_NAME + ".tmp"):
+                continue
+            st = os.stat(file_path)
+            entry = old_entries.get(rel_path)
+            if entry and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+                entries[rel_path] = entry
+            else:
+                stale.append((rel_path, file_path, st))
+
+        if stale:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                headers = pool.map(_read_header, [file_path for _, file_path, _ in stale])
+                for (rel_path, file_path, st), ds in zip(stale, headers):
+                    # 非图像文件也记下来(header为None)，下次不用再读
+                    header = SliceRecord.from_dataset(file_path, ds).header if ds is not None else None
+                    entries[rel_path] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "header": header}
+
+        changed = bool(stale) or len(entries) != len(old_entries)
+        self.entries = entries
+        if changed:
+            try:
+                self._save()
+            except OSError as e:
+                log(f"索引保存失败: {e}")
+
+        elapsed = time.perf_counter() - start
+        self.stats = {"files": len(entries), "reread": len(stale), "seconds": elapsed}
+        log(f"索引: {len(entries)} 个文件, 重新读取 {len(stale)} 个, {elapsed * 1000:.1f}ms")
+        return self.records()
+
+    def records(self):
+        return [SliceRecord(os.path.join(self.directory_path, rel_path), entry["header"])
+                for rel_path, entry in sorted(self.entries.items()) if entry["header"] is not None]
+
+    def series(self, series_uid=None):
+        """从索引直接得到排好序的切片序列"""
+        records = self.records()
+        if not records:
+            return []
+        return sort_slices(group_series(records, series_uid))
@@ -0,0 +1,182 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from .instrument import log, record, timed
+
+# 两阶段读取DICOM序列：
+# 1. 只读文件头（不读像素）完成过滤、分组、排序
+# 2. 在线程池/进程池里解码像素数据
+
+
+def _read_header(file_path):
+    """只读取文件头，不是图像切片返回None"""
+    # pydicom用到时才导入，import spine_viewer不需要等它
+    import pydicom
+
+    try:
+        ds = pydicom.dcmread(file_path, stop_before_pixels=True, force=True)
+    except Exception:
+        return None
+    # 没有行列信息的不是图像（DICOMDIR、报告等）
+    if "Rows" not in ds or "Columns" not in ds:
+        return None
+    return ds
+
+
+def _read_slice(file_path):
+    """读取完整切片并解码像素，解码结果缓存在ds上"""
+    import pydicom
+
+    ds = pydicom.dcmread(file_path, force=True)
+    ds.pixel_array
+    return ds
+
+
+def _slice_position(ds):
+    return float(ds.ImagePositionPatient[2])
+
+
+def sort_slices(headers):
+    """按切片位置排序，没有位置信息时按文件名排序"""
+    try:
+        return sorted(headers, key=_slice_position)
+    except (AttributeError, IndexError, TypeError, ValueError):
+        log("无法按位置排序，使用文件名排序")
+        return sorted(headers, key=lambda ds: str(ds.filename))
+
+
+def group_series(headers, series_uid=None):
+    """按SeriesInstanceUID分组，默认返回切片最多的序列"""
+    groups = {}
+    for ds in headers:
+        groups.setdefault(str(getattr(ds, "SeriesInstanceUID", "")), []).append(ds)
+    if series_uid is not None:
+        return groups.get(str(series_uid), [])
+    if len(groups) > 1:
+        log(f"目录中有 {len(groups)} 个序列，使用切片最多的序列")
+    return max(groups.values(), key=len)
+
+
+def list_files(directory_path):
+    file_paths = []
+    for root, _, files in os.walk(directory_path):
+        for file in sorted(files):
+            file_paths.append(os.path.join(root, file))
+    return file_paths
+
+
+class DicomSeriesLoader:
+    """
+    并行两阶段DICOM序列读取
+    executor: "thread" 或 "process"，决定像素解码用线程池还是进程池
+    workers: 并行数，None表示使用cpu核数
+    use_index: 使用目录索引(dicom_index)，只重新读取新增或改动的文件头
+    """
+
+    def __init__(self, workers=None, executor="thread", series_uid=None, use_index=False):
+        if executor not in ("thread", "process"):
+            raise ValueError(f"未知的executor: {executor}")
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = executor
+        self.series_uid = series_uid
+        self.use_index = use_index
+        self.stats = {}
+
+    def _decode_pool(self):
+        if self.executor == "process":
+            return ProcessPoolExecutor(max_workers=self.workers)
+        return ThreadPoolExecutor(max_workers=self.workers)
+
+    @timed("scan_headers")
+    def scan_headers(self, directory_path):
+        """第一阶段: 只读文件头，返回排好序的切片头信息"""
+        if self.use_index:
+            return self._scan_index(directory_path)
+
+        file_paths = list_files(directory_path)
+        start = time.perf_counter()
+        # 读文件头主要是IO，固定用线程池
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            headers = [ds for ds in pool.map(_read_header, file_paths) if ds is not None]
+        elapsed = time.perf_counter() - start
+
+        self.stats["files"] = len(file_paths)
+        self.stats["header_seconds"] = elapsed
+        self.stats["header_files_per_sec"] = len(file_paths) / elapsed if elapsed > 0 else 0.0
+        log(f"文件头: {len(file_paths)} 个文件, {elapsed:.2f}s, "
+            f"{self.stats['header_files_per_sec']:.0f} 文件/秒")
+
+        if not headers:
+            return []
+        return sort_slices(group_series(headers, self.series_uid))
+
+    def _scan_index(self, directory_path):
+        from .dicom_index import DicomIndex
+
+        index = DicomIndex(directory_path, workers=self.workers)
+        records = index.update()
+        self.stats["files"] = index.stats["files"]
+        self.stats["header_seconds"] = index.stats["seconds"]
+        self.stats["header_files_per_sec"] = (index.stats["files"] / index.stats["seconds"]
+                                              if index.stats["seconds"] > 0 else 0.0)
+        if not records:
+            return []
+        return sort_slices(group_series(records, self.series_uid))
+
+    def iter_decode(self, headers):
+        """
+        按顺序逐个产出解码好的切片，同时在途的切片数有上限，不会一次占满内存
+        "decode"阶段只算等待解码结果的时间，两次yield之间调用方做的事(组装体数据等)不算在里面
+        """
+        file_paths = [str(ds.filename) for ds in headers]
+        window = self.workers * 2
+        start = time.perf_counter()
+        waited = 0.0
+        count = 0
+        try:
+            with self._decode_pool() as pool:
+                futures = {}
+                for i in range(min(window, len(file_paths))):
+                    futures[i] = pool.submit(_read_slice, file_paths[i])
+                for i, file_path in enumerate(file_paths):
+                    future = futures.pop(i)
+                    if i + window < len(file_paths):
+                        futures[i + window] = pool.submit(_read_slice, file_paths[i + window])
+                    wait_start = time.perf_counter()
+                    try:
+                        ds = future.result()
+                    except Exception as e:
+                        log(f"解码失败: {file_path} ({e})")
+                        continue
+                    finally:
+                        waited += time.perf_counter() - wait_start
+                    count += 1
+                    yield ds
+        finally:
+            # 调用方提前停止(没有取完)时也记录
+            record("decode", waited)
+        elapsed = time.perf_counter() - start
+
+        self.stats["slices"] = count
+        self.stats["decode_seconds"] = elapsed
+        self.stats["decode_wait_seconds"] = waited
+        self.stats["decode_files_per_sec"] = count / elapsed if elapsed > 0 else 0.0
+        log(f"像素解码: {count} 个切片, {elapsed:.2f}s (等待解码 {waited:.2f}s), "
+            f"{self.stats['decode_files_per_sec']:.0f} 文件/秒 ({self.executor} x{self.workers})")
+
+    def decode(self, headers):
+        """第二阶段: 并行解码像素，保持输入顺序"""
+        return list(self.iter_decode(headers))
+
+    def load(self, directory_path, roi=None):
+        """
+        读取目录下的DICOM序列，返回按位置排好序的Dataset列表
+        roi: roi.VolumeROI，只解码和它相交的切片(像素裁剪在组装体数据时做)
+        """
+        headers = self.scan_headers(directory_path)
+        if not headers:
+            return []
+        if roi is not None:
+            headers, _ = roi.resolve(headers)
+        return self.decode(headers)
@@ -0,0 +1,148 @@
+import time
+import threading
+import collections
+import numpy as np
+
+# 点云采集和渲染分开：生产者(跟踪器驱动、文件回放、随机点)在后台线程把一批批点放进队列，
+# 渲染定时器每帧把上一帧以来到达的所有批次合并成一次更新
+# 队列里积压的点超过上限时丢掉最早的批次，并记录丢了多少点
+
+
+class RateCounter:
+    """按时间窗口统计速率(每秒多少)；生产者线程add、渲染线程rate，用自己的锁保护"""
+
+    def __init__(self, window=1.0):
+        self.window = window
+        self.total = 0
+        self._events = collections.deque()
+        self._lock = threading.Lock()
+
+    def add(self, n=1, now=None):
+        now = time.perf_counter() if now is None else now
+        with self._lock:
+            self.total += n
+            self._events.append((now, n))
+            self._trim(now)
+
+    def _trim(self, now):
+        # 调用方已经拿着锁
+        while self._events and now - self._events[0][0] > self.window:
+            self._events.popleft()
+
+    def rate(self, now=None):
+        now = time.perf_counter() if now is None else now
+        with self._lock:
+            self._trim(now)
+            return sum(n for _, n in self._events) / self.window
+
+
+class PointBatchQueue:
+    """
+    生产者线程put，渲染线程drain；锁只保护一次append/popleft，竞争很小
+    max_pending: 最多积压多少个点，超过时丢掉最早的批次
+    """
+
+    def __init__(self, max_pending=100000):
+        self.max_pending = max_pending
+        self.dropped = 0
+        self.received = RateCounter()
+        self._batches = collections.deque()
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def put(self, points):
+        points = np.asarray(points, dtype=np.float32).reshape(-1, 3)
+        if not len(points):
+            return
+        with self._lock:
+            self._batches.append(points)
+            self._pending += len(points)
+            self.received.add(len(points))
+            while self._pending > self.max_pending and len(self._batches) > 1:
+                old = self._batches.popleft()
+                self._pending -= len(old)
+                self.dropped += len(old)
+
+    def drain(self):
+        """取出目前所有的批次，合并成一个 (N, 3) 数组，没有数据返回None"""
+        with self._lock:
+            if not self._batches:
+                return None
+            batches = list(self._batches)
+            self._batches.clear()
+            self._pending = 0
+        if len(batches) == 1:
+            return batches[0]
+        return np.concatenate(batches)
+
+    @property
+    def pending(self):
+        return self._pending
+
+
+class PointProducer:
+    """
+    后台线程反复调用 source() 取一批点放进队列，source返回None时结束
+    interval: 两次调用之间的间隔(秒)，0表示不停地取(例如驱动自己会阻塞等数据)
+    """
+
+    def __init__(self, source, queue, interval=0.0):
+        self.source = source
+        self.queue = queue
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.is_set():
+            points = self.source()
+            if points is None:
+                break
+            self.queue.put(points)
+            if self.interval:
+                self._stop.wait(self.interval)
+
+    def stop(self, timeout=1.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+
+def random_source(count=200, scale=20.0, seed=None):
+    """随机点(原PointCloud定时器里的做法)，每次count个，范围 ±scale/2"""
+    rng = np.random.default_rng(seed)
+
+    def source():
+        return scale * (rng.random((count, 3), dtype=np.float32) - 0.5)
+    return source
+
+
+def file_source(path, batch_size=1000, loop=False):
+    """
+    回放记录下来的点，.npy 或文本文件(每行x y z)，按batch_size一批批给出
+    loop=True时播完从头再来
+    """
+    points = np.load(path, mmap_mode="r") if path.endswith(".npy") else np.loadtxt(path, ndmin=2)
+    points = points.reshape(-1, 3)
+    position = [0]
+
+    def source():
+        start = position[0]
+        if start >= len(points):
+            if not loop or not len(points):
+                return None
+            start = 0
+        position[0] = start + batch_size
+        return np.array(points[start:start + batch_size], dtype=np.float32)
+    return source
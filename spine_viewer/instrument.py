@@ -0,0 +1,211 @@
+import os
+import sys
+import time
+import threading
+import functools
+import contextlib
+
+# 分阶段计时和内存统计
+# 默认关闭，关闭时stage()返回同一个空的上下文管理器，timed装饰器只多一次属性判断
+# 环境变量:
+#   SPINE_VIEWER_INSTRUMENT=1     打开计时和峰值内存采样
+#   SPINE_VIEWER_CPROFILE=目录    同时用cProfile记录每个最外层阶段，写成 目录/阶段名-序号.prof
+#   SPINE_VIEWER_QUIET=1          不打印各阶段的提示信息(log)
+
+ENV_INSTRUMENT = "SPINE_VIEWER_INSTRUMENT"
+ENV_CPROFILE = "SPINE_VIEWER_CPROFILE"
+ENV_QUIET = "SPINE_VIEWER_QUIET"
+
+_NULL_CONTEXT = contextlib.nullcontext()
+_psutil_process = None
+
+
+def current_rss():
+    """当前进程占用的物理内存(字节)，取不到时返回0"""
+    if _psutil_process is not None:
+        return _psutil_process.memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+def _init_rss():
+    # 有psutil时用psutil(Windows也能取到)，没有时Linux读/proc
+    global _psutil_process
+    if _psutil_process is None and not os.path.exists("/proc/self/statm"):
+        try:
+            import psutil
+        except ImportError:
+            return
+        _psutil_process = psutil.Process()
+
+
+class Instrumentation:
+    """
+    记录每个阶段的调用次数、耗时和峰值内存
+    interval: 峰值内存的采样间隔(秒)，在后台线程里采样
+    profile_dir: 给了就用cProfile记录最外层的阶段
+    """
+
+    def __init__(self, enabled=False, profile_dir=None, interval=0.01):
+        self.enabled = False
+        self.profile_dir = None
+        self.interval = interval
+        self.stats = {}
+        self.callbacks = []
+        self._active = {}
+        self._lock = threading.Lock()
+        self._sampler = None
+        self._profiling = False
+        if enabled or profile_dir:
+            self.enable(profile_dir)
+
+    def enable(self, profile_dir=None):
+        _init_rss()
+        self.profile_dir = profile_dir or self.profile_dir
+        if self.profile_dir:
+            os.makedirs(self.profile_dir, exist_ok=True)
+        self.enabled = True
+        if self._sampler is None:
+            self._sampler = threading.Thread(target=self._sample, daemon=True)
+            self._sampler.start()
+
+    def disable(self):
+        self.enabled = False
+        self._sampler = None
+
+    def reset(self):
+        with self._lock:
+            self.stats = {}
+
+    def _sample(self):
+        while self.enabled:
+            rss = current_rss()
+            with self._lock:
+                for token, peak in self._active.items():
+                    if rss > peak:
+                        self._active[token] = rss
+            time.sleep(self.interval)
+
+    def stage(self, name):
+        """with instrument.stage("名字"): ... 关闭时没有额外开销"""
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return self._stage(name)
+
+    @contextlib.contextmanager
+    def _stage(self, name):
+        token = object()
+        start_rss = current_rss()
+        with self._lock:
+            self._active[token] = start_rss
+        profiler = self._start_profile()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            if profiler is not None:
+                self._stop_profile(profiler, name)
+            end_rss = current_rss()
+            with self._lock:
+                peak = max(self._active.pop(token), end_rss)
+            self.record(name, elapsed, peak_rss=peak, rss_delta=end_rss - start_rss)
+
+    def _start_profile(self):
+        # cProfile同一时间只能有一个，嵌套的阶段算在外层里
+        if not self.profile_dir or self._profiling:
+            return None
+        import cProfile
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            return None
+        self._profiling = True
+        return profiler
+
+    def _stop_profile(self, profiler, name):
+        profiler.disable()
+        self._profiling = False
+        count = self.stats.get(name, {}).get("calls", 0)
+        profiler.dump_stats(os.path.join(self.profile_dir, f"{name}-{count}.prof"))
+
+    def timed(self, name=None):
+        """装饰器版本的stage，name默认用函数名"""
+        def decorator(func):
+            stage_name = name or func.__name__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with self._stage(stage_name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def record(self, name, seconds, peak_rss=0, rss_delta=0):
+        """记录一次阶段耗时，也可以直接传入外部测到的时间"""
+        with self._lock:
+            stat = self.stats.setdefault(name, {"calls": 0, "total_s": 0.0, "max_s": 0.0,
+                                                "peak_rss_mb": 0.0, "rss_delta_mb": 0.0})
+            stat["calls"] += 1
+            stat["total_s"] += seconds
+            stat["max_s"] = max(stat["max_s"], seconds)
+            stat["peak_rss_mb"] = max(stat["peak_rss_mb"], peak_rss / 1e6)
+            stat["rss_delta_mb"] += rss_delta / 1e6
+
+    def add_callback(self, callback):
+        """report时调用 callback(summary)，例如交给导航软件写日志"""
+        self.callbacks.append(callback)
+
+    def summary(self):
+        with self._lock:
+            return {name: dict(stat) for name, stat in self.stats.items()}
+
+    def report(self, callback=None, file=None):
+        """打印各阶段统计并交给回调，返回统计字典；没有记录时什么都不做"""
+        summary = self.summary()
+        if not summary:
+            return summary
+        file = file or sys.stdout
+        print(f"{'阶段':24s} {'次数':>6s} {'总耗时':>10s} {'最长':>10s} {'峰值内存':>10s} {'内存增量':>10s}", file=file)
+        for name, stat in summary.items():
+            print(f"{name:26s} {stat['calls']:6d} {stat['total_s'] * 1000:10.1f}ms {stat['max_s'] * 1000:8.1f}ms "
+                  f"{stat['peak_rss_mb']:10.1f}MB {stat['rss_delta_mb']:10.1f}MB", file=file)
+        for cb in self.callbacks + ([callback] if callback else []):
+            cb(summary)
+        return summary
+
+
+recorder = Instrumentation(enabled=bool(os.environ.get(ENV_INSTRUMENT)),
+                           profile_dir=os.environ.get(ENV_CPROFILE) or None)
+quiet = bool(os.environ.get(ENV_QUIET))
+
+
+def stage(name):
+    return recorder.stage(name)
+
+
+def timed(name=None):
+    return recorder.timed(name)
+
+
+def record(name, seconds):
+    """记录外部测到的一段耗时(例如生成器里只算等待的时间)，关闭时什么都不做"""
+    if recorder.enabled:
+        recorder.record(name, seconds)
+
+
+def report(callback=None):
+    return recorder.report(callback)
+
+
+def log(message):
+    """各阶段的提示信息，SPINE_VIEWER_QUIET=1时不打印"""
+    if not quiet:
+        print(message)
@@ -0,0 +1,462 @@
+import numpy as np
+
+from .registration import transform_points
+from .spatial_index import _expand, _group_min
+
+# 三角网格的包围盒层次(BVH)：骨表面/STL模型建一次，之后对一批线段(穿刺针)、射线、点一起查询，
+# 全部用numpy向量化，不用每次从Python调用vtkOBBTree
+# 三角形按中心的Morton码排序后平均分到2^depth个叶子(每个叶子最多leaf_size个)，
+# 树是隐式的完全二叉树(堆的下标: 节点n的子节点是2n和2n+1)，包围盒自底向上合并，建树只有几次numpy操作
+# 查询时所有 (查询, 节点) 对一起往下走(一次两层，胶囊体一次三层)，每步一次向量化的包围盒测试，到叶子再精确计算三角形；
+# 求距离时每步用 到包围盒最远角的距离 收紧上限(盒子里的三角形不会比它更远)，剪掉更远的节点
+
+_QUERY_CHUNK = 1 << 14  # 每次最多一起遍历多少个查询，限制展开的 (查询, 三角形) 对的内存
+_START_PAIRS = 1 << 9  # 遍历从哪一层开始: 这一层的 (查询, 节点) 对不超过它，查询少时直接跳过上面几层
+
+
+def _morton(points):
+    """点 (N, 3) 在包围盒里量化成10位整数，三个轴交错成30位Morton码"""
+    lo = points.min(axis=0)
+    extent = np.maximum(points.max(axis=0) - lo, 1e-12)
+    cells = np.minimum(((points - lo) / extent * 1024).astype(np.int64), 1023)
+    codes = np.zeros(len(points), dtype=np.int64)
+    for bit in range(10):
+        for axis in range(3):
+            codes |= ((cells[:, axis] >> bit) & 1) << (3 * bit + axis)
+    return codes
+
+
+def _dot(a, b):
+    """最后一维的点积，前面的维度可以广播"""
+    return np.einsum("...j,...j->...", a, b)
+
+
+def _cross(a, b):
+    """最后一维的叉积，按分量写比np.cross快(np.cross每次都要挪轴)"""
+    a0, a1, a2 = a[..., 0], a[..., 1], a[..., 2]
+    b0, b1, b2 = b[..., 0], b[..., 1], b[..., 2]
+    return np.stack([a1 * b2 - a2 * b1, a2 * b0 - a0 * b2, a0 * b1 - a1 * b0], axis=-1)
+
+
+def _point_segment_d2(v, e, inv_ee):
+    """点到线段的距离平方，v = 点 - 线段起点，e = 线段向量"""
+    t = np.clip(_dot(v, e) * inv_ee, 0.0, 1.0)
+    return _dot(v - t[..., None] * e, v - t[..., None] * e)
+
+
+def _inverse(d):
+    """方向向量的倒数，分量为0时用一个很大的数代替inf，包围盒测试里不会出现 0 * inf = nan"""
+    return 1.0 / np.where(np.abs(d) < 1e-30, 1e-30, d)
+
+
+def _segment_segment_d2(p1, d1, p2, d2):
+    """两条线段 p1 + s*d1, p2 + t*d2 (s, t ∈ [0, 1]) 之间的最短距离平方，前面的维度可以广播"""
+    r = p1 - p2
+    a = _dot(d1, d1)
+    e = _dot(d2, d2)
+    b = _dot(d1, d2)
+    c = _dot(d1, r)
+    f = _dot(d2, r)
+    a_safe = np.maximum(a, 1e-30)
+    e_safe = np.maximum(e, 1e-30)
+    denom = a * e - b * b
+    with np.errstate(divide="ignore", invalid="ignore"):
+        s = np.where(denom > 1e-12 * a * e, np.clip((b * f - c * e) / denom, 0.0, 1.0), 0.0)
+    t = (b * s + f) / e_safe
+    s = np.where(t < 0, np.clip(-c / a_safe, 0.0, 1.0), np.where(t > 1, np.clip((b - c) / a_safe, 0.0, 1.0), s))
+    t = np.clip(t, 0.0, 1.0)
+    v = r + s[..., None] * d1 - t[..., None] * d2
+    return _dot(v, v)
+
+
+class MeshBVH:
+    """
+    polydata: 三角网格(BoneSurfaceExtractor的骨表面、MeshCache读的STL)，也可以直接给 (points, triangles)
+    leaf_size: 每个叶子最多几个三角形
+    查询的坐标默认就是网格的坐标；set_transform给了actor的4x4(刚体)变换后，查询用世界坐标
+    返回的三角形下标是网格里第几个三角形，没有命中时是-1
+    """
+
+    def __init__(self, polydata, leaf_size=8):
+        points, triangles = _mesh_arrays(polydata)
+        self.leaf_size = leaf_size
+        self.triangle_count = len(triangles)
+        self._to_model = None
+
+        if not len(triangles):
+            raise ValueError("网格没有三角形")
+        a, b, c = points[triangles[:, 0]], points[triangles[:, 1]], points[triangles[:, 2]]
+        self.order = np.argsort(_morton((a + b + c) / 3), kind="stable")
+        a, b, c = a[self.order], b[self.order], c[self.order]
+
+        # 叶子数是2的幂，三角形按排序平均分配，每个叶子至少一个三角形
+        self.depth = max(0, int(np.ceil(np.log2(max(1.0, len(triangles) / leaf_size)))))
+        while self.depth and (1 << self.depth) > len(triangles):
+            self.depth -= 1
+        leaves = 1 << self.depth
+        self.leaf_start = (np.arange(leaves + 1, dtype=np.int64) * len(triangles)) // leaves
+
+        # 节点包围盒，下标1是根，叶子从leaves开始
+        self.lo = np.empty((2 * leaves, 3))
+        self.hi = np.empty((2 * leaves, 3))
+        self.lo[leaves:] = np.minimum.reduceat(np.minimum(np.minimum(a, b), c), self.leaf_start[:-1])
+        self.hi[leaves:] = np.maximum.reduceat(np.maximum(np.maximum(a, b), c), self.leaf_start[:-1])
+        for level in range(self.depth - 1, -1, -1):
+            first, last = 1 << level, 2 << level
+            self.lo[first:last] = np.minimum(self.lo[2 * first:2 * last:2], self.lo[2 * first + 1:2 * last:2])
+            self.hi[first:last] = np.maximum(self.hi[2 * first:2 * last:2], self.hi[2 * first + 1:2 * last:2])
+        # 包围盒中心和半对角线长，线段到盒子里三角形的距离上限用
+        self._center = (self.lo + self.hi) / 2
+        self._half = np.linalg.norm(self.hi - self.lo, axis=1) / 2
+
+        # 精确计算用到的每个三角形的量，预先算好；三条边 (起点, 向量) 叠成 (M, 3, 3) 一起算
+        self._a = a
+        self._e1 = b - a
+        self._e2 = c - a
+        self._edge_start = np.stack([a, a, b], axis=1)
+        self._edges = np.stack([self._e1, self._e2, c - b], axis=1)
+        self._inv_edges = 1.0 / np.maximum(_dot(self._edges, self._edges), 1e-30)
+        self._d00 = _dot(self._e1, self._e1)
+        self._d01 = _dot(self._e1, self._e2)
+        self._d11 = _dot(self._e2, self._e2)
+        denom = self._d00 * self._d11 - self._d01 ** 2
+        # 退化(面积为0)的三角形只算到边的距离
+        self._inv_denom = np.where(denom > 1e-12 * self._d00 * self._d11, 1.0 / np.where(denom > 0, denom, 1.0), 0.0)
+
+    def set_transform(self, matrix):
+        """网格 -> 世界的4x4刚体变换(numpy或vtkMatrix4x4，例如actor.GetMatrix())，None表示不变换"""
+        if matrix is None:
+            self._to_model = None
+            return
+        if hasattr(matrix, "GetElement"):
+            matrix = [[matrix.GetElement(i, j) for j in range(4)] for i in range(4)]
+        self._to_model = np.linalg.inv(np.asarray(matrix, dtype=np.float64))
+
+    def _points(self, points):
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        if self._to_model is not None:
+            points = transform_points(self._to_model, points)
+        return points
+
+    def _traverse(self, count, test, step=2):
+        """
+        test(q, n)返回 查询q 是否需要进入 节点n 的布尔数组，q总是从小到大排好的
+        step: 每次往下走几层；不收紧上限的查询(胶囊体)走得越快，numpy调用越少
+        返回到达的 (查询, 叶子) 对，查询下标从小到大排好
+        """
+        level = min(self.depth, max(0, (_START_PAIRS // max(1, count)).bit_length() - 1))
+        nodes = np.arange(1 << level, 2 << level)
+        q = np.repeat(np.arange(count), len(nodes))
+        n = np.tile(nodes, count)
+        while True:
+            keep = test(q, n)
+            q, n = q[keep], n[keep]
+            if level == self.depth:
+                break
+            down = min(step, self.depth - level)
+            level += down
+            q = np.repeat(q, 1 << down)
+            n = ((n[:, None] << down) + np.arange(1 << down)).ravel()
+        return q, n - (1 << self.depth)
+
+    def _leaf_pairs(self, q, leaf):
+        """(查询, 叶子) 对展开成 (查询, 三角形) 对"""
+        triangles, owner = _expand(self.leaf_start[leaf], self.leaf_start[leaf + 1])
+        return q[owner], triangles
+
+    def _nearest_first(self, count, q, leaf, score, exact, bound, keep):
+        """
+        到达叶子后分两步精确计算: 先算每个查询score最小(最可能最近)的叶子，用结果收紧bound，
+        其他叶子里只算keep(q, leaf)还通过的；exact(q, 三角形)返回距离平方，返回 (距离平方, 三角形)
+        """
+        _, first = _group_min(q, score, leaf, count)
+        queries = np.flatnonzero(first >= 0)
+        q1, tri1 = self._leaf_pairs(queries, first[queries])
+        d2, best = _group_min(q1, exact(q1, tri1), tri1, count)
+        np.minimum(bound, d2, out=bound)
+        rest = (leaf != first[q]) & keep(q, leaf)
+        q2, tri2 = self._leaf_pairs(q[rest], leaf[rest])
+        d2_rest, best_rest = _group_min(q2, exact(q2, tri2), tri2, count)
+        closer = d2_rest < d2
+        return np.where(closer, d2_rest, d2), np.where(closer, best_rest, best)
+
+    def _box_d2(self, n, points):
+        """点到节点包围盒的 (最近距离平方, 最远角距离平方)"""
+        lo = self.lo[n] - points
+        hi = points - self.hi[n]
+        near = np.square(np.maximum(np.maximum(lo, hi), 0.0)).sum(axis=1)
+        far = np.square(np.minimum(lo, hi)).sum(axis=1)
+        return near, far
+
+    def _chunks(self, count):
+        for start in range(0, count, _QUERY_CHUNK):
+            yield start, min(count, start + _QUERY_CHUNK)
+
+    # ---------- 线段/射线和网格求交 ----------
+
+    def _ray_hits(self, origins, directions, q, tri, limit):
+        """Möller–Trumbore: (查询, 三角形) 对的交点参数t，0 <= t <= limit 以外是inf"""
+        o, d = origins[q], directions[q]
+        e1, e2 = self._e1[tri], self._e2[tri]
+        p = _cross(d, e2)
+        det = _dot(e1, p)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            inv_det = 1.0 / det
+            s = o - self._a[tri]
+            u = _dot(s, p) * inv_det
+            qv = _cross(s, e1)
+            v = _dot(d, qv) * inv_det
+            t = _dot(e2, qv) * inv_det
+            hit = (np.abs(det) > 1e-14 * np.sqrt(self._d00[tri] * self._d11[tri] * _dot(d, d))) & \
+                  (u >= 0) & (v >= 0) & (u + v <= 1) & (t >= 0) & (t <= limit[q])
+        return np.where(hit, t, np.inf)
+
+    def _slab(self, n, origins, inv, limit, pad=0.0):
+        """射线 origins + t/inv (0 <= t <= limit) 是否穿过节点包围盒(每边放大pad)，inv用_inverse算"""
+        t1 = (self.lo[n] - (origins + pad)) * inv
+        t2 = (self.hi[n] - (origins - pad)) * inv
+        near = np.minimum(t1, t2).max(axis=1)
+        far = np.maximum(t1, t2).min(axis=1)
+        return (near <= far) & (far >= 0) & (near <= limit)
+
+    def _intersect(self, origins, directions, limit):
+        """射线 origins + t*directions (0 <= t <= limit) 最近的交点，返回 (t, 三角形)"""
+        count = len(origins)
+        inv = _inverse(directions)
+        q, tri = self._leaf_pairs(*self._traverse(count, lambda q, n: self._slab(n, origins[q], inv[q], limit[q])))
+        t = self._ray_hits(origins, directions, q, tri, limit)
+        best_t, best_tri = _group_min(q, t, tri, count)
+        return best_t, np.where(np.isfinite(best_t), self.order[np.maximum(best_tri, 0)], -1)
+
+    def intersect_segments(self, starts, ends):
+        """
+        线段 (N, 3) -> (N, 3) 和网格的第一个交点(离起点最近)，
+        返回 (t, 三角形)，交点是 start + t * (end - start)，t ∈ [0, 1]；没有相交时t是inf
+        """
+        starts, ends = self._points(starts), self._points(ends)
+        t = np.full(len(starts), np.inf)
+        triangles = np.full(len(starts), -1, dtype=np.int64)
+        for lo, hi in self._chunks(len(starts)):
+            directions = ends[lo:hi] - starts[lo:hi]
+            t[lo:hi], triangles[lo:hi] = self._intersect(starts[lo:hi], directions, np.ones(hi - lo))
+        return t, triangles
+
+    def intersect_rays(self, origins, directions, max_length=np.inf):
+        """射线和网格的第一个交点，返回 (沿射线的距离, 三角形)，没有相交时距离是inf"""
+        origins = self._points(origins)
+        directions = np.asarray(directions, dtype=np.float64).reshape(-1, 3)
+        if self._to_model is not None:
+            directions = directions @ self._to_model[:3, :3].T
+        directions = directions / np.linalg.norm(directions, axis=1, keepdims=True)
+        distances = np.full(len(origins), np.inf)
+        triangles = np.full(len(origins), -1, dtype=np.int64)
+        for lo, hi in self._chunks(len(origins)):
+            distances[lo:hi], triangles[lo:hi] = self._intersect(
+                origins[lo:hi], directions[lo:hi], np.full(hi - lo, float(max_length)))
+        return distances, triangles
+
+    # ---------- 到网格的距离 ----------
+
+    def _point_triangle_d2(self, points, tri):
+        """
+        点到三角形的距离平方：投影在三角形内用到平面的距离，否则用到三条边的距离
+        points: (P, 3)，或者 (P, K, 3) 每个三角形同时算K个点，返回 (P,) / (P, K)
+        """
+        single = points.ndim == 2
+        if single:
+            points = points[:, None]
+        a, e1, e2 = self._a[tri][:, None], self._e1[tri][:, None], self._e2[tri][:, None]
+        v = points - a
+        d20 = _dot(v, e1)
+        d21 = _dot(v, e2)
+        inv_denom = self._inv_denom[tri][:, None]
+        u = (self._d11[tri][:, None] * d20 - self._d01[tri][:, None] * d21) * inv_denom
+        w = (self._d00[tri][:, None] * d21 - self._d01[tri][:, None] * d20) * inv_denom
+        inside = (inv_denom > 0) & (u >= 0) & (w >= 0) & (u + w <= 1)
+        plane = v - u[..., None] * e1 - w[..., None] * e2
+        edges = _point_segment_d2(points[:, :, None] - self._edge_start[tri][:, None], self._edges[tri][:, None],
+                                  self._inv_edges[tri][:, None]).min(axis=2)
+        d2 = np.where(inside, _dot(plane, plane), edges)
+        return d2[:, 0] if single else d2
+
+    def _distance(self, points, bound):
+        def test(q, n):
+            near, far = self._box_d2(n, points[q])
+            _tighten(bound, q, far)
+            return near <= bound[q]
+
+        def keep(q, leaf):
+            return self._box_d2(leaf + (1 << self.depth), points[q])[0] <= bound[q]
+
+        q, leaf = self._traverse(len(points), test)
+        near = self._box_d2(leaf + (1 << self.depth), points[q])[0]
+        return self._nearest_first(len(points), q, leaf, near, lambda q, tri: self._point_triangle_d2(points[q], tri),
+                                   bound, keep)
+
+    def distance(self, points, max_distance=None):
+        """
+        点 (N, 3) 到网格表面的最短距离，返回 (距离, 三角形)
+        max_distance: 给了的话更远的点只返回inf/-1，查询更快
+        """
+        points = self._points(points)
+        limit = np.inf if max_distance is None else float(max_distance) ** 2
+        distances = np.full(len(points), np.inf)
+        triangles = np.full(len(points), -1, dtype=np.int64)
+        for lo, hi in self._chunks(len(points)):
+            d2, best = self._distance(points[lo:hi], np.full(hi - lo, limit))
+            found = d2 <= limit
+            distances[lo:hi][found] = np.sqrt(d2[found])
+            triangles[lo:hi][found] = self.order[best[found]]
+        return distances, triangles
+
+    def _segment_triangle_d2(self, starts, ends, q, tri, crossing=True):
+        """线段到三角形的距离平方: 相交是0，否则是两个端点到三角形、线段到三条边的最小值；crossing=False时不检查相交"""
+        s, e = starts[q], ends[q]
+        d2 = self._point_triangle_d2(np.stack([s, e], axis=1), tri).min(axis=1)
+        edges = _segment_segment_d2(s[:, None], (e - s)[:, None], self._edge_start[tri], self._edges[tri])
+        d2 = np.minimum(d2, edges.min(axis=1))
+        if crossing:
+            d2[np.isfinite(self._ray_hits(starts, ends - starts, q, tri, np.ones(len(starts))))] = 0.0
+        return d2
+
+    def _segment_leaves(self, s, e, bound, tighten):
+        """
+        线段到达的 (查询, 叶子) 对: 线段和按sqrt(bound)放大的包围盒相交才可能更近；
+        tighten时用 线段上离盒子中心最近的点到中心的距离 + 半对角线 (盒子里三角形距离的上限)收紧bound
+        返回 (查询, 叶子, 叶子中心到线段的距离)
+        """
+        d = e - s
+        inv = _inverse(d)
+        with np.errstate(divide="ignore"):
+            inv_dd = 1.0 / _dot(d, d)
+        inv_dd[~np.isfinite(inv_dd)] = 0.0
+        ones = np.ones(len(s))
+
+        def center_distance(q, n):
+            sq, dq, center = s[q], d[q], self._center[n]
+            t = np.clip(_dot(center - sq, dq) * inv_dd[q], 0.0, 1.0)
+            x = sq + t[:, None] * dq - center
+            return np.sqrt(_dot(x, x))
+
+        def test(q, n):
+            if tighten:
+                _tighten(bound, q, np.square(center_distance(q, n) + self._half[n]))
+            return self._slab(n, s[q], inv[q], ones[q], np.sqrt(bound[q])[:, None])
+
+        q, leaf = self._traverse(len(s), test)
+        keep = lambda q, leaf: self._slab(leaf + (1 << self.depth), s[q], inv[q], ones[q],  # noqa: E731
+                                          np.sqrt(bound[q])[:, None])
+        return q, leaf, center_distance(q, leaf + (1 << self.depth)), keep
+
+    def segment_distance(self, starts, ends, max_distance=None):
+        """
+        线段 (N, 3) -> (N, 3) 到网格的最短距离(穿过网格时是0)，返回 (距离, 三角形)
+        max_distance: 给了的话更远的线段只返回inf/-1
+        """
+        starts, ends = self._points(starts), self._points(ends)
+        count = len(starts)
+        distances = np.full(count, np.inf)
+        triangles = np.full(count, -1, dtype=np.int64)
+        limit = np.inf if max_distance is None else float(max_distance) ** 2
+        for lo, hi in self._chunks(count):
+            s, e = starts[lo:hi], ends[lo:hi]
+            bound = np.full(hi - lo, limit)
+            # 给了max_distance时上限本来就很小，不用再收紧
+            q, leaf, score, keep = self._segment_leaves(s, e, bound, tighten=max_distance is None)
+            d2, best = self._nearest_first(hi - lo, q, leaf, score,
+                                           lambda q, tri: self._segment_triangle_d2(s, e, q, tri), bound, keep)
+            found = d2 <= limit
+            distances[lo:hi][found] = np.sqrt(d2[found])
+            triangles[lo:hi][found] = self.order[best[found]]
+        return distances, triangles
+
+    def capsule_hits(self, starts, ends, radius):
+        """
+        半径radius的胶囊体(有粗细的针)是否碰到网格，返回布尔数组
+        先用便宜的线段求交判断穿过网格的针，只有没穿过的才精确计算距离
+        """
+        starts, ends = self._points(starts), self._points(ends)
+        hits = np.zeros(len(starts), dtype=bool)
+        for lo, hi in self._chunks(len(starts)):
+            s, e = starts[lo:hi], ends[lo:hi]
+            # 上限固定是半径，不用收紧，一次往下走三层
+            inv, ones = _inverse(e - s), np.ones(hi - lo)
+            q, tri = self._leaf_pairs(*self._traverse(
+                hi - lo, lambda q, n: self._slab(n, s[q], inv[q], ones[q], float(radius)), step=3))
+            crossed = np.zeros(hi - lo, dtype=bool)
+            crossed[q[np.isfinite(self._ray_hits(s, e - s, q, tri, np.ones(hi - lo)))]] = True
+            rest = ~crossed[q]
+            q, tri = q[rest], tri[rest]
+            near = self._segment_triangle_d2(s, e, q, tri, crossing=False) <= float(radius) ** 2
+            crossed[q[near]] = True
+            hits[lo:hi] = crossed
+        return hits
+
+
+class NeedleChecker:
+    """
+    每个跟踪器帧检查一根针(tail -> tip)和网格，坐标就是网格的坐标
+    polydata: 三角网格(vtkPolyData)；bvh: 已经建好的MeshBVH，不给就新建(不要给设置了set_transform的)
+    单根针的直线求交和针尖到表面的最近点用vtkStaticCellLocator，C++里一次调用只要几十微秒；
+    只有直线没穿过表面时才用BVH判断胶囊体(有粗细的针)，整个检查在1ms以内
+    一批针(例如整段录制的轨迹)还是直接用MeshBVH的向量化查询
+    """
+
+    def __init__(self, polydata, bvh=None):
+        from vtkmodules.vtkCommonCore import mutable
+        from vtkmodules.vtkCommonDataModel import vtkStaticCellLocator
+        self.bvh = bvh if bvh is not None else MeshBVH(polydata)
+        self.locator = vtkStaticCellLocator()
+        self.locator.SetDataSet(polydata)
+        self.locator.BuildLocator()
+        # vtk的输出参数，每次查询复用
+        self._t, self._sub_id, self._cell_id, self._d2 = mutable(0.0), mutable(0), mutable(0), mutable(0.0)
+        self._x, self._pcoords, self._closest = [0.0] * 3, [0.0] * 3, [0.0] * 3
+
+    def check(self, tail, tip, radius=0.6):
+        """返回 (是否碰到, 针尖到表面的距离, 针从tail进入表面的位置或None)，radius是针的半径"""
+        tail = np.asarray(tail, dtype=np.float64).reshape(3)
+        tip = np.asarray(tip, dtype=np.float64).reshape(3)
+        entry = None
+        if self.locator.IntersectWithLine(tail, tip, 1e-9, self._t, self._x, self._pcoords, self._sub_id):
+            # 直线穿过表面时胶囊体一定碰到，不用再算
+            hit, entry = True, np.array(self._x)
+        else:
+            hit = bool(self.bvh.capsule_hits(tail, tip, radius)[0])
+        self.locator.FindClosestPoint(tip, self._closest, self._cell_id, self._sub_id, self._d2)
+        return hit, float(np.sqrt(float(self._d2))), entry
+
+
+def _tighten(bound, q, far):
+    """每个查询的上限取 min(原来的上限, 这一批节点里最小的far)，q必须从小到大排好"""
+    if len(q):
+        change = np.empty(len(q), dtype=bool)
+        change[0] = True
+        np.not_equal(q[1:], q[:-1], out=change[1:])
+        first = np.flatnonzero(change)
+        owners = q[first]
+        bound[owners] = np.minimum(bound[owners], np.minimum.reduceat(far, first))
+
+
+def _mesh_arrays(polydata):
+    """vtkPolyData 或 (points, triangles) -> 顶点 (N, 3) float64, 三角形 (M, 3) int64"""
+    if isinstance(polydata, (tuple, list)):
+        points, triangles = polydata
+        return np.asarray(points, dtype=np.float64).reshape(-1, 3), np.asarray(triangles, dtype=np.int64).reshape(-1, 3)
+
+    from vtkmodules.util import numpy_support
+    polys = polydata.GetPolys()
+    offsets = numpy_support.vtk_to_numpy(polys.GetOffsetsArray())
+    if len(offsets) > 1 and np.any(np.diff(offsets) != 3):
+        # 有多边形时先三角化(STL和marching cubes的输出本来就是三角形)
+        from vtkmodules.vtkFiltersCore import vtkTriangleFilter
+        triangle_filter = vtkTriangleFilter()
+        triangle_filter.SetInputData(polydata)
+        triangle_filter.PassVertsOff()
+        triangle_filter.PassLinesOff()
+        triangle_filter.Update()
+        polydata = triangle_filter.GetOutput()
+        polys = polydata.GetPolys()
+    points = numpy_support.vtk_to_numpy(polydata.GetPoints().GetData()).astype(np.float64)
+    triangles = numpy_support.vtk_to_numpy(polys.GetConnectivityArray()).astype(np.int64).reshape(-1, 3)
+    return points, triangles
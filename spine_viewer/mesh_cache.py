@@ -0,0 +1,89 @@
+import os
+import time
+import hashlib
+
+from vtkmodules.vtkFiltersCore import vtkPolyDataNormals
+from vtkmodules.vtkIOGeometry import vtkSTLReader
+
+from .instrument import log, timed
+from .mesh_io import load_polydata, polydata_to_arrays, save_mesh
+
+# STL网格缓存：STL每个三角形单独存三个顶点，vtkSTLReader每次都要合并重复的点
+# 第一次读取时转成带索引的二进制网格(去重的float32顶点 + int32三角形 + 可选法向)，
+# 按 路径 + 文件大小 + 修改时间 缓存，之后直接mmap零拷贝成vtkPolyData
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "spine_viewer", "meshes")
+MESH_CACHE_VERSION = 1
+
+
+class MeshCache:
+    """
+    normals: 缓存里带顶点法向(按feature_angle在尖锐的边上分裂顶点)，显示更光滑，
+             但顶点会变多；默认不带，和直接读STL一样由渲染时按面片着色
+    """
+
+    def __init__(self, cache_dir=None, normals=False, feature_angle=30.0):
+        self.cache_dir = cache_dir or CACHE_DIR
+        self.normals = normals
+        self.feature_angle = feature_angle
+
+    def key(self, stl_path):
+        """路径 + 大小 + 修改时间，文件改过之后自动失效"""
+        stat = os.stat(stl_path)
+        text = (f"v{MESH_CACHE_VERSION}:{os.path.abspath(stl_path)}:{stat.st_size}:{stat.st_mtime_ns}:"
+                f"{self.normals}:{self.feature_angle if self.normals else ''}")
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def path(self, stl_path):
+        return os.path.join(self.cache_dir, self.key(stl_path) + ".mesh")
+
+    @timed("load_stl")
+    def load(self, stl_path):
+        """读取STL得到vtkPolyData，文件不存在时抛FileNotFoundError"""
+        if not os.path.isfile(stl_path):
+            raise FileNotFoundError(stl_path)
+        start = time.perf_counter()
+        path = self.path(stl_path)
+        polydata = load_polydata(path)
+        if polydata is not None:
+            log(f"{os.path.basename(stl_path)}: 缓存命中 {polydata.GetNumberOfPolys()} 个三角形, "
+                f"{time.perf_counter() - start:.3f}s")
+            return polydata
+
+        polydata = self.convert(stl_path)
+        save_mesh(path, *polydata_to_arrays(polydata))
+        log(f"{os.path.basename(stl_path)}: {polydata.GetNumberOfPoints()} 个顶点, "
+            f"{polydata.GetNumberOfPolys()} 个三角形, 转换 {time.perf_counter() - start:.3f}s")
+        # 返回mmap的版本，和缓存命中时一样不占额外内存
+        return load_polydata(path)
+
+    def convert(self, stl_path):
+        """不查缓存，vtkSTLReader读取(合并重复顶点)，需要时算法向"""
+        reader = vtkSTLReader()
+        reader.SetFileName(stl_path)
+        reader.MergingOn()
+        reader.Update()
+        polydata = reader.GetOutput()
+        if self.normals and polydata.GetNumberOfPolys():
+            normals = vtkPolyDataNormals()
+            normals.SetInputData(polydata)
+            normals.SetFeatureAngle(self.feature_angle)
+            normals.SplittingOn()
+            normals.ComputePointNormalsOn()
+            normals.ComputeCellNormalsOff()
+            normals.Update()
+            polydata = normals.GetOutput()
+        return polydata
+
+
+_default_cache = None
+
+
+def load_stl(stl_path, cache=None):
+    """用默认缓存(~/.cache/spine_viewer/meshes)读取STL"""
+    global _default_cache
+    if cache is None:
+        if _default_cache is None:
+            _default_cache = MeshCache()
+        cache = _default_cache
+    return cache.load(stl_path)
@@ -0,0 +1,134 @@
+import os
+import numpy as np
+
+from vtkmodules.vtkCommonCore import vtkPoints
+from vtkmodules.vtkCommonDataModel import vtkCellArray, vtkPolyData
+from vtkmodules.vtkIOGeometry import vtkSTLWriter
+from vtkmodules.util import numpy_support
+
+from .instrument import log
+
+# 三角网格的二进制文件格式，读的时候直接mmap，零拷贝包装成vtkPolyData
+# 文件结构: 8字节魔数 + int64[3](点数, 三角形数, 是否有法向) + float32点 + float32法向 + int32三角形
+
+MESH_MAGIC = b"SPMESH01"
+HEADER_SIZE = 32
+
+
+def polydata_to_arrays(polydata):
+    """vtkPolyData(只含三角形) -> points (N,3) float32, triangles (M,3) int32, normals (N,3) float32或None"""
+    points = numpy_support.vtk_to_numpy(polydata.GetPoints().GetData()).astype(np.float32, copy=False)
+    polys = polydata.GetPolys()
+    offsets = numpy_support.vtk_to_numpy(polys.GetOffsetsArray())
+    if len(offsets) > 1 and np.any(np.diff(offsets) != 3):
+        raise ValueError("网格里有非三角形的面片，先用vtkTriangleFilter三角化")
+    triangles = numpy_support.vtk_to_numpy(polys.GetConnectivityArray()).astype(np.int32, copy=False)
+    normals = polydata.GetPointData().GetNormals()
+    if normals is not None:
+        normals = numpy_support.vtk_to_numpy(normals).astype(np.float32, copy=False)
+    return points.reshape(-1, 3), triangles.reshape(-1, 3), normals
+
+
+def arrays_to_polydata(points, triangles, normals=None):
+    """把numpy数组零拷贝包装成vtkPolyData，数组要保持引用直到polydata不再使用"""
+    points = np.ascontiguousarray(points, dtype=np.float32)
+    connectivity = np.ascontiguousarray(triangles, dtype=np.int32).reshape(-1)
+    offsets = np.arange(0, len(connectivity) + 1, 3, dtype=np.int32)
+
+    vtk_points = vtkPoints()
+    vtk_points.SetData(numpy_support.numpy_to_vtk(points, deep=False))
+    cells = vtkCellArray()
+    cells.SetData(numpy_support.numpy_to_vtk(offsets, deep=False),
+                  numpy_support.numpy_to_vtk(connectivity, deep=False))
+
+    polydata = vtkPolyData()
+    polydata.SetPoints(vtk_points)
+    polydata.SetPolys(cells)
+    if normals is not None:
+        vtk_normals = numpy_support.numpy_to_vtk(np.ascontiguousarray(normals, dtype=np.float32), deep=False)
+        vtk_normals.SetName("Normals")
+        polydata.GetPointData().SetNormals(vtk_normals)
+    # offsets是这里新建的，挂在polydata上防止被回收
+    polydata._arrays = (points, connectivity, offsets, normals)
+    return polydata
+
+
+def save_mesh(path, points, triangles, normals=None):
+    """写入网格文件，先写临时文件再改名，写到一半中断不会留下坏文件"""
+    points = np.ascontiguousarray(points, dtype=np.float32).reshape(-1, 3)
+    triangles = np.ascontiguousarray(triangles, dtype=np.int32).reshape(-1, 3)
+    header = np.array([len(points), len(triangles), normals is not None], dtype=np.int64)
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MESH_MAGIC)
+        f.write(header.tobytes())
+        f.write(points.tobytes())
+        if normals is not None:
+            f.write(np.ascontiguousarray(normals, dtype=np.float32).tobytes())
+        f.write(triangles.tobytes())
+    os.replace(tmp_path, path)
+
+
+def load_mesh(path):
+    """mmap读取网格文件，返回 (points, triangles, normals)，文件不存在、格式不对或大小和头信息不符返回None"""
+    try:
+        with open(path, "rb") as f:
+            magic = f.read(len(MESH_MAGIC))
+            header = f.read(HEADER_SIZE - len(MESH_MAGIC))
+            file_size = os.fstat(f.fileno()).st_size
+    except OSError:
+        return None
+    # 头信息被截断时长度不是8的倍数，先检查长度再转换
+    if magic != MESH_MAGIC or len(header) != HEADER_SIZE - len(MESH_MAGIC):
+        return None
+    header = np.frombuffer(header, dtype=np.int64)
+
+    n_points, n_triangles, has_normals = map(int, header)
+    # 文件被截断或头信息被改坏时当作没有缓存，由调用方重新生成
+    expected = HEADER_SIZE + n_points * 12 * (2 if has_normals else 1) + n_triangles * 12
+    if n_points < 0 or n_triangles < 0 or has_normals not in (0, 1) or file_size != expected:
+        log(f"网格缓存损坏，重新生成: {path} ({file_size} 字节，应为 {expected} 字节)")
+        return None
+
+    offset = HEADER_SIZE
+    try:
+        # mode="c": 写时复制，vtk那边拿到的是可写指针，但不会改到文件
+        points = np.memmap(path, dtype=np.float32, mode="c", offset=offset, shape=(n_points, 3))
+        offset += points.nbytes
+        normals = None
+        if has_normals:
+            normals = np.memmap(path, dtype=np.float32, mode="c", offset=offset, shape=(n_points, 3))
+            offset += normals.nbytes
+        triangles = np.memmap(path, dtype=np.int32, mode="c", offset=offset, shape=(n_triangles, 3))
+    except (OSError, ValueError) as e:
+        log(f"网格缓存损坏，重新生成: {path} ({e})")
+        return None
+    return points, triangles, normals
+
+
+def save_polydata(path, polydata):
+    save_mesh(path, *polydata_to_arrays(polydata))
+
+
+def load_polydata(path):
+    """读取网格文件得到vtkPolyData，没有缓存时返回None"""
+    arrays = load_mesh(path)
+    if arrays is None:
+        return None
+    return arrays_to_polydata(*arrays)
+
+
+def export_stl(polydata, path, binary=True):
+    """导出STL，LoadSTL的场景可以直接读取"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    writer = vtkSTLWriter()
+    writer.SetFileName(path)
+    writer.SetInputData(polydata)
+    if binary:
+        writer.SetFileTypeToBinary()
+    else:
+        writer.SetFileTypeToASCII()
+    writer.Write()
+    return path
@@ -0,0 +1,246 @@
+import os
+import math
+import time
+import hashlib
+
+from vtkmodules.vtkFiltersCore import vtkPolyDataNormals, vtkQuadricDecimation
+from vtkmodules.vtkRenderingCore import vtkPolyDataMapper
+
+from .instrument import log
+from .mesh_io import load_polydata, save_polydata
+
+# 网格的多级细节(LOD)：每个网格预先用二次误差减面生成几级(例如保留50%/20%/5%的三角形)，缓存到磁盘
+# MeshLOD在每次渲染前按帧时间预算和每个actor在屏幕上的大小给它选一级，
+# 和vtkLODProp3D类似，但预算是整个场景一起算的(三角形越多渲染越慢，纯CPU渲染时尤其明显)
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "spine_viewer", "lod")
+LOD_VERSION = 1
+
+
+class MeshPyramid:
+    """
+    polydata: 全分辨率网格
+    fractions: 每一级保留的三角形比例，每一级从上一级减面得到
+    key: 网格的缓存键(MeshCache.key / BoneSurfaceExtractor.key)，给了就把每一级缓存到磁盘
+    min_triangles: 三角形少于它的级别不再生成
+    levels: [(比例, vtkPolyData, 三角形数)]，从细到粗，第一项是全分辨率
+    """
+
+    def __init__(self, polydata, fractions=(0.5, 0.2, 0.05), key=None, cache_dir=None, min_triangles=200):
+        self.key = key
+        self.cache_dir = cache_dir or CACHE_DIR
+        self.levels = [(1.0, polydata, polydata.GetNumberOfPolys())]
+
+        previous, previous_fraction = polydata, 1.0
+        for fraction in sorted(fractions, reverse=True):
+            if fraction >= previous_fraction or self.levels[0][2] * fraction < min_triangles:
+                continue
+            level = self._load_level(fraction)
+            if level is None:
+                level = self._decimate(previous, 1.0 - fraction / previous_fraction)
+                self._save_level(fraction, level)
+            if level.GetNumberOfPolys() > 0.8 * self.levels[-1][2]:
+                # 边界多的网格减不下去了，再往下的级别也没有意义
+                break
+            self.levels.append((fraction, level, level.GetNumberOfPolys()))
+            previous, previous_fraction = level, fraction
+
+        log("网格LOD: " + ", ".join(f"{fraction:.0%} {triangles}" for fraction, _, triangles in self.levels))
+
+    def _decimate(self, polydata, reduction):
+        decimate = vtkQuadricDecimation()
+        decimate.SetInputData(polydata)
+        decimate.SetTargetReduction(reduction)
+        decimate.Update()
+        level = decimate.GetOutput()
+        if polydata.GetPointData().GetNormals() is not None:
+            # 减面之后原来的法向作废，和BoneSurfaceExtractor一样重新算，不分裂顶点
+            normals = vtkPolyDataNormals()
+            normals.SetInputData(level)
+            normals.SplittingOff()
+            normals.ConsistencyOff()
+            normals.ComputePointNormalsOn()
+            normals.ComputeCellNormalsOff()
+            normals.Update()
+            level = normals.GetOutput()
+        return level
+
+    def _level_path(self, fraction):
+        text = f"v{LOD_VERSION}:{self.key}:{fraction}"
+        return os.path.join(self.cache_dir, hashlib.sha1(text.encode("utf-8")).hexdigest() + ".mesh")
+
+    def _load_level(self, fraction):
+        if self.key is None:
+            return None
+        return load_polydata(self._level_path(fraction))
+
+    def _save_level(self, fraction, polydata):
+        if self.key is None:
+            return
+        try:
+            save_polydata(self._level_path(fraction), polydata)
+        except (OSError, ValueError) as e:
+            log(f"LOD缓存保存失败: {e}")
+
+
+class MeshLOD:
+    """
+    renderer: 每次渲染前(StartEvent)给所有加进来的actor选一级
+    target_fps: 帧时间预算；interactor给了的话只在交互时用这个预算，静止时用still_fps
+    pixels_per_triangle: 屏幕上每个三角形至少占多少像素，再细也看不出来
+    每一级用自己的mapper，切换时只换actor的mapper，不会重新上传数据
+    帧时间按整个窗口的一次Render计时(包括交换缓冲区)，拟合成 固定开销 + 每个三角形的时间，
+    软件渲染时清屏/交换的固定开销很大，不能都算到三角形头上
+    """
+
+    def __init__(self, renderer, target_fps=30.0, interactor=None, still_fps=2.0, pixels_per_triangle=2.0):
+        self.renderer = renderer
+        self.target_fps = target_fps
+        self.still_fps = still_fps if interactor is not None else target_fps
+        self.pixels_per_triangle = pixels_per_triangle
+        self.entries = []  # [actor, pyramid, mappers, 当前级别]
+        self.fixed_seconds = 0.0
+        self.seconds_per_triangle = None
+        self._interacting = False
+        self._drawn = 0
+        self._frame_start = None
+        self._window = None
+        # 指数加权的最小二乘累加量: 权重, 三角形数, 帧时间, 三角形数^2, 三角形数*帧时间
+        self._sums = [0.0] * 5
+        self._fitted = False
+
+        renderer.AddObserver("StartEvent", self._on_render_start)
+        if interactor is not None:
+            style = interactor.GetInteractorStyle()
+            style.AddObserver("StartInteractionEvent", self._on_start_interaction)
+            style.AddObserver("EndInteractionEvent", self._on_end_interaction)
+
+    def add(self, actor, pyramid):
+        """actor以后按pyramid的级别切换mapper，mapper的设置(标量显示等)从actor原来的mapper复制"""
+        template = actor.GetMapper()
+        mappers = []
+        for _, polydata, _ in pyramid.levels:
+            mapper = vtkPolyDataMapper()
+            mapper.SetInputData(polydata)
+            if template is not None:
+                mapper.SetScalarVisibility(template.GetScalarVisibility())
+            mappers.append(mapper)
+        actor.SetMapper(mappers[0])
+        self.entries.append([actor, pyramid, mappers, 0])
+
+    def remove(self, actor):
+        self.entries = [entry for entry in self.entries if entry[0] is not actor]
+
+    def levels(self):
+        """每个actor现在用的级别(保留的三角形比例)"""
+        return {entry[0]: entry[1].levels[entry[3]][0] for entry in self.entries}
+
+    def screen_size(self, actor):
+        """actor包围球在屏幕上的半径(像素)，在相机后面时返回0"""
+        bounds = actor.GetBounds()
+        if bounds[0] > bounds[1]:
+            return 0.0
+        center = [(bounds[i] + bounds[i + 1]) / 2 for i in (0, 2, 4)]
+        radius = 0.5 * math.sqrt(sum((bounds[i + 1] - bounds[i]) ** 2 for i in (0, 2, 4)))
+        camera = self.renderer.GetActiveCamera()
+        height = self.renderer.GetSize()[1] or 1
+        if camera.GetParallelProjection():
+            return radius / camera.GetParallelScale() * height / 2
+        position = camera.GetPosition()
+        direction = camera.GetDirectionOfProjection()
+        depth = sum((c - p) * d for c, p, d in zip(center, position, direction))
+        if depth + radius <= 0:
+            return 0.0
+        if depth <= radius:
+            return float(height)  # 相机在包围球里面
+        return radius / (depth * math.tan(math.radians(camera.GetViewAngle()) / 2)) * height / 2
+
+    def choose_levels(self):
+        """
+        先按屏幕大小给每个actor选够用的最粗一级，再按预算从三角形/像素最多的actor开始降级
+        返回 [级别下标]，和entries一一对应
+        """
+        chosen = []
+        for actor, pyramid, _, _ in self.entries:
+            if not actor.GetVisibility():
+                chosen.append(len(pyramid.levels) - 1)
+                continue
+            radius = self.screen_size(actor)
+            needed = math.pi * radius * radius / self.pixels_per_triangle
+            level = 0
+            while level + 1 < len(pyramid.levels) and pyramid.levels[level + 1][2] >= needed:
+                level += 1
+            chosen.append(level)
+
+        if self.seconds_per_triangle:
+            fps = self.target_fps if self._interacting else self.still_fps
+            budget = (1.0 / fps - self.fixed_seconds) / self.seconds_per_triangle
+            triangles = [entry[1].levels[level][2] for entry, level in zip(self.entries, chosen)]
+            areas = [max(1.0, self.screen_size(entry[0]) ** 2) for entry in self.entries]
+            total = sum(triangles)
+            while total > budget:
+                # 能降级的actor里三角形密度最高的先降
+                candidates = [i for i, entry in enumerate(self.entries) if chosen[i] + 1 < len(entry[1].levels)]
+                if not candidates:
+                    break
+                i = max(candidates, key=lambda i: triangles[i] / areas[i])
+                chosen[i] += 1
+                new = self.entries[i][1].levels[chosen[i]][2]
+                total += new - triangles[i]
+                triangles[i] = new
+        return chosen
+
+    def use_levels(self, chosen):
+        self._drawn = 0
+        for entry, level in zip(self.entries, chosen):
+            actor, pyramid, mappers, current = entry
+            if level != current:
+                actor.SetMapper(mappers[level])
+                entry[3] = level
+            if actor.GetVisibility():
+                self._drawn += pyramid.levels[level][2]
+
+    def _on_render_start(self, obj, event):
+        window = self.renderer.GetRenderWindow()
+        if window is not None and window is not self._window:
+            # renderer加进窗口之后才能拿到窗口，第一次渲染时再挂上
+            self._window = window
+            window.AddObserver("EndEvent", self._on_frame_end)
+        self._frame_start = time.perf_counter()
+        if self.entries:
+            self.use_levels(self.choose_levels())
+
+    def _on_frame_end(self, obj, event):
+        if self._frame_start is None or not self._drawn:
+            return
+        self.update_cost(self._drawn, time.perf_counter() - self._frame_start)
+        self._frame_start = None
+
+    def update_cost(self, triangles, seconds, decay=0.9):
+        """加入一帧的 (三角形数, 帧时间)，更新 帧时间 = fixed_seconds + seconds_per_triangle * 三角形数"""
+        sums = [value * decay for value in self._sums]
+        for i, value in enumerate((1.0, triangles, seconds, triangles * triangles, triangles * seconds)):
+            sums[i] += value
+        self._sums = sums
+        weight, sx, sy, sxx, sxy = sums
+        variance = sxx / weight - (sx / weight) ** 2
+        if variance <= (0.05 * sx / weight) ** 2:
+            # 三角形数一直差不多时分不出固定开销: 拟合过就保留斜率只调整固定开销，
+            # 没拟合过就保守地全算到三角形上
+            if self._fitted:
+                self.fixed_seconds = max(0.0, sy / weight - self.seconds_per_triangle * sx / weight)
+            else:
+                self.fixed_seconds = 0.0
+                self.seconds_per_triangle = sy / sx
+            return
+        slope = (sxy / weight - sx / weight * sy / weight) / variance
+        self.seconds_per_triangle = max(slope, 1e-12)
+        self.fixed_seconds = max(0.0, sy / weight - self.seconds_per_triangle * sx / weight)
+        self._fitted = True
+
+    def _on_start_interaction(self, obj, event):
+        self._interacting = True
+
+    def _on_end_interaction(self, obj, event):
+        self._interacting = False
+        self.renderer.GetRenderWindow().Render()
@@ -0,0 +1,375 @@
+import os
+
+import numpy as np
+
+from vtkmodules.vtkCommonCore import vtkPoints
+from vtkmodules.vtkCommonDataModel import vtkCellArray, vtkPlane, vtkPolyData
+from vtkmodules.vtkInteractionStyle import vtkInteractorStyleImage
+from vtkmodules.vtkRenderingCore import (vtkActor, vtkImageProperty, vtkImageSlice, vtkImageSliceMapper,
+                                         vtkPolyDataMapper)
+from vtkmodules.vtkRenderingImage import vtkImageResliceMapper
+
+from . import rendering  # noqa: F401  注册OpenGL2实现
+from .instrument import log, timed
+from .volume_pyramid import vtk_image_to_numpy
+
+# 正交多平面重建(MPR)：横断面(axial)、冠状面(coronal)、矢状面(sagittal)三个视图共用同一个vtkImageData，
+# 不复制体数据；和坐标轴对齐的切面用vtkImageSliceMapper直接取体数据的一层(只换切片号)，
+# 只有斜切面才用vtkImageResliceMapper重采样
+# 三个视图共用一个十字光标位置(世界坐标)和一个vtkImageProperty(窗宽窗位)，改一处三个视图一起更新
+# 窗宽窗位从体数据的直方图算(按百分位)，直方图只算一次，有序列指纹时存在体数据缓存目录里
+
+# 视图 -> 切面法向对应的坐标轴(x=0, y=1, z=2)
+AXES = {"axial": 2, "coronal": 1, "sagittal": 0}
+# 视图 -> (相机看的方向, 相机向上)，和阅片习惯一致: 横断面从脚往头看、冠状面从前往后看、矢状面从左往右看
+CAMERAS = {
+    "axial": ((0.0, 0.0, 1.0), (0.0, -1.0, 0.0)),
+    "coronal": ((0.0, 1.0, 0.0), (0.0, 0.0, 1.0)),
+    "sagittal": ((-1.0, 0.0, 0.0), (0.0, 0.0, 1.0)),
+}
+# 十字线颜色: 每个视图里画另外两个切面的位置，颜色是那个切面的颜色
+COLORS = {"axial": (1.0, 0.3, 0.3), "coronal": (0.3, 1.0, 0.3), "sagittal": (0.3, 0.5, 1.0)}
+# 常用的窗宽窗位 (窗宽, 窗位)，名字和传输函数预设一致
+WINDOW_PRESETS = {"bone": (2000.0, 400.0), "soft_tissue": (400.0, 40.0)}
+
+HIST_VERSION = 1
+MAX_BINCOUNT = 1 << 16  # 整数值范围比这个小时每个值一个格子，否则用np.histogram
+
+
+class VolumeHistogram:
+    """
+    体数据的灰度直方图，用来算窗宽窗位，代替GetScalarRange()(受少数极端值影响，而且每次都要扫描整个体数据)
+    volume: (slices, rows, cols) 数组，stride: 每个方向隔几个体素取一个
+    key / cache_dir: 有序列指纹时直方图存成 <cache_dir>/<key>.hist.npz，下次直接读
+    """
+
+    def __init__(self, volume, stride=2, bins=4096, key=None, cache_dir=None):
+        self.path = os.path.join(cache_dir, f"{key}.hist.npz") if key and cache_dir else None
+        loaded = self._load()
+        if loaded is None:
+            self.counts, self.edges = self._compute(volume, stride, bins)
+            self._save()
+        else:
+            self.counts, self.edges = loaded
+        self._cumulative = np.cumsum(self.counts) / max(1, self.counts.sum())
+
+    @staticmethod
+    @timed("volume_histogram")
+    def _compute(volume, stride, bins):
+        sample = np.asarray(volume[::stride, ::stride, ::stride]).reshape(-1)
+        if sample.dtype.kind in "iub" and sample.dtype.itemsize <= 2 and len(sample):
+            # 整数体数据(HU一般是int16)按每个值一个格子计数，bincount比np.histogram快得多
+            # 先转成intp再减，int16里相减会溢出(例如-32768的填充值和骨头)
+            low, high = int(sample.min()), int(sample.max())
+            if high - low < MAX_BINCOUNT:
+                counts = np.bincount(sample.astype(np.intp) - low)
+                return counts, np.arange(low, low + len(counts) + 1, dtype=np.float64) - 0.5
+        return np.histogram(sample, bins=bins)
+
+    def _load(self):
+        if self.path is None or not os.path.exists(self.path):
+            return None
+        try:
+            with np.load(self.path) as data:
+                if int(data["version"]) == HIST_VERSION:
+                    return data["counts"], data["edges"]
+        except (OSError, ValueError, KeyError) as e:
+            log(f"直方图缓存损坏，重新计算: {e}")
+        return None
+
+    def _save(self):
+        if self.path is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path + ".tmp", "wb") as f:
+                np.savez(f, counts=self.counts, edges=self.edges, version=HIST_VERSION)
+            os.replace(self.path + ".tmp", self.path)
+        except OSError as e:
+            log(f"直方图缓存写入失败: {e}")
+
+    def percentile(self, q):
+        """q (0~1) 分位数对应的灰度值"""
+        index = min(int(np.searchsorted(self._cumulative, q)), len(self.counts) - 1)
+        return float((self.edges[index] + self.edges[index + 1]) / 2)
+
+    def window_level(self, low=0.01, high=0.99):
+        """灰度在 [low, high] 分位数之间的窗宽窗位"""
+        lo, hi = self.percentile(low), self.percentile(high)
+        return max(hi - lo, 1.0), (hi + lo) / 2
+
+
+class MPRView:
+    """一个切面视图: 一个renderer里放切片和十字线，orientation是 axial/coronal/sagittal"""
+
+    def __init__(self, mpr, orientation, renderer):
+        self.mpr = mpr
+        self.orientation = orientation
+        self.axis = AXES[orientation]
+        self.renderer = renderer
+        self.oblique = None  # 斜切面的法向，None时是正交切面
+        self.index = 0
+
+        self._slice_mapper = vtkImageSliceMapper()
+        self._slice_mapper.SetInputData(mpr.vtk_image)
+        self._slice_mapper.SetOrientation(self.axis)
+        self._reslice_mapper = None
+        self.actor = vtkImageSlice()
+        self.actor.SetMapper(self._slice_mapper)
+        self.actor.SetProperty(mpr.image_property)
+        renderer.AddViewProp(self.actor)
+
+        # 十字线: 两条线段(另外两个切面和这个切面的交线)
+        self._line_points = vtkPoints()
+        self._line_points.SetNumberOfPoints(4)
+        self.lines = {}
+        for other in AXES:
+            if other == orientation:
+                continue
+            polydata = vtkPolyData()
+            polydata.SetPoints(self._line_points)
+            cells = vtkCellArray()
+            first = 2 * len(self.lines)
+            cells.InsertNextCell(2, (first, first + 1))
+            polydata.SetLines(cells)
+            mapper = vtkPolyDataMapper()
+            mapper.SetInputData(polydata)
+            actor = vtkActor()
+            actor.SetMapper(mapper)
+            actor.GetProperty().SetColor(*COLORS[other])
+            actor.PickableOff()
+            renderer.AddActor(actor)
+            self.lines[other] = actor
+
+        camera = renderer.GetActiveCamera()
+        camera.ParallelProjectionOn()
+        self.reset_camera()
+
+    def reset_camera(self):
+        """相机对准切面，平行投影，整个切面放进视野"""
+        direction, view_up = self._camera_axes()
+        camera = self.renderer.GetActiveCamera()
+        center = np.array(self.mpr.position)
+        camera.SetFocalPoint(*center)
+        camera.SetPosition(*(center - 1000.0 * np.asarray(direction)))
+        camera.SetViewUp(*view_up)
+        self.renderer.ResetCamera(self.mpr.vtk_image.GetBounds())
+
+    def _camera_axes(self):
+        if self.oblique is None:
+            return CAMERAS[self.orientation]
+        normal = np.asarray(self.oblique, dtype=np.float64)
+        _, view_up = CAMERAS[self.orientation]
+        # 向上方向取原来的向上方向在斜切面上的投影
+        view_up = np.asarray(view_up) - np.dot(view_up, normal) * normal
+        if np.linalg.norm(view_up) < 1e-6:
+            view_up = np.cross(normal, (1.0, 0.0, 0.0))
+        return normal, view_up / np.linalg.norm(view_up)
+
+    def update(self):
+        """按共享的光标位置更新切片号(或斜切面的原点)和十字线"""
+        position = self.mpr.position
+        if self.oblique is not None:
+            self._reslice_mapper.GetSlicePlane().SetOrigin(*position)
+            for actor in self.lines.values():
+                actor.VisibilityOff()
+            return
+        self.index = self.mpr.index_of(position)[self.axis]
+        self._slice_mapper.SetSliceNumber(self.index)
+
+        lo, hi = self.mpr.bounds()
+        # 十字线稍微往相机方向挪一点，不被切片挡住
+        direction, _ = CAMERAS[self.orientation]
+        offset = -0.5 * np.asarray(direction) * self.mpr.vtk_image.GetSpacing()[self.axis]
+        for k, (other, actor) in enumerate(self.lines.items()):
+            along = 3 - self.axis - AXES[other]  # 交线的方向
+            a = np.array(position, dtype=np.float64)
+            b = a.copy()
+            a[along], b[along] = lo[along], hi[along]
+            self._line_points.SetPoint(2 * k, *(a + offset))
+            self._line_points.SetPoint(2 * k + 1, *(b + offset))
+            actor.VisibilityOn()
+        self._line_points.Modified()
+
+    def set_oblique(self, normal):
+        """切面改成过光标、法向为normal的斜切面(vtkImageResliceMapper)；normal为None时回到正交切面"""
+        if normal is None:
+            self.oblique = None
+            self.actor.SetMapper(self._slice_mapper)
+        else:
+            normal = np.asarray(normal, dtype=np.float64)
+            self.oblique = normal / np.linalg.norm(normal)
+            if self._reslice_mapper is None:
+                self._reslice_mapper = vtkImageResliceMapper()
+                self._reslice_mapper.SetInputData(self.mpr.vtk_image)
+                self._reslice_mapper.SliceFacesCameraOff()
+                self._reslice_mapper.SliceAtFocalPointOff()
+                self._reslice_mapper.SetSlicePlane(vtkPlane())
+            self._reslice_mapper.GetSlicePlane().SetNormal(*self.oblique)
+            self.actor.SetMapper(self._reslice_mapper)
+        self.update()
+        self.reset_camera()
+
+    def slice_array(self):
+        """当前正交切片，直接是体数据的NumPy视图(不复制)，形状是 (行, 列)"""
+        volume = vtk_image_to_numpy(self.mpr.vtk_image)
+        index = [slice(None)] * 3
+        index[2 - self.axis] = self.index
+        return volume[tuple(index)]
+
+    def world_point(self, x, y):
+        """窗口像素坐标 -> 切面上的世界坐标"""
+        renderer = self.renderer
+        renderer.SetDisplayPoint(x, y, 0.0)
+        renderer.DisplayToWorld()
+        world = np.array(renderer.GetWorldPoint()[:3]) / (renderer.GetWorldPoint()[3] or 1.0)
+        if self.oblique is None:
+            # 平行投影: 深度方向的坐标换成当前切面的位置
+            world[self.axis] = self.mpr.position[self.axis]
+        else:
+            world -= np.dot(world - self.mpr.position, self.oblique) * self.oblique
+        return world
+
+
+class OrthogonalMPR:
+    """
+    vtk_image: 体数据(和体绘制共用同一个对象)，渐进加载细化后切片号会按光标的世界坐标重新算
+    histogram: VolumeHistogram，None时从vtk_image算(key / cache_dir传给VolumeHistogram)
+    三个视图用add_view放进各自的renderer；attach把视图的interactor接上:
+        左键拖动移动十字光标，滚轮翻页，右键缩放，中键平移
+    """
+
+    def __init__(self, vtk_image, histogram=None, key=None, cache_dir=None):
+        self.vtk_image = vtk_image
+        self.histogram = histogram or VolumeHistogram(vtk_image_to_numpy(vtk_image), key=key, cache_dir=cache_dir)
+        self.image_property = vtkImageProperty()
+        self.image_property.SetInterpolationTypeToLinear()
+        self.views = {}
+        self._listeners = []
+        self._schedulers = {}
+        self.set_window_level(*self.histogram.window_level())
+        lo, hi = self.bounds()
+        self.position = tuple(float(v) for v in (lo + hi) / 2)
+        vtk_image.AddObserver("ModifiedEvent", self._on_image_modified)
+
+    def bounds(self):
+        """体数据的世界坐标范围 (lo, hi)"""
+        b = np.array(self.vtk_image.GetBounds())
+        return b[::2], b[1::2]
+
+    def index_of(self, position):
+        """世界坐标 -> 最近的体素下标 (i, j, k)，限制在体数据范围内"""
+        origin = np.array(self.vtk_image.GetOrigin())
+        spacing = np.array(self.vtk_image.GetSpacing())
+        dims = np.array(self.vtk_image.GetDimensions())
+        index = np.rint((np.asarray(position) - origin) / spacing).astype(int)
+        return tuple(int(v) for v in np.clip(index, 0, dims - 1))
+
+    def value(self, position=None):
+        """光标(或position)处的灰度值，直接从体数据的NumPy视图里读"""
+        i, j, k = self.index_of(self.position if position is None else position)
+        return vtk_image_to_numpy(self.vtk_image)[k, j, i]
+
+    def add_view(self, orientation, renderer):
+        view = MPRView(self, orientation, renderer)
+        self.views[orientation] = view
+        view.update()
+        return view
+
+    def on_change(self, callback):
+        """光标移动或窗宽窗位改变后调用 callback(mpr)"""
+        self._listeners.append(callback)
+
+    def _changed(self):
+        for scheduler in self._schedulers.values():
+            scheduler.invalidate()
+        for callback in self._listeners:
+            callback(self)
+
+    def set_position(self, position):
+        """移动十字光标(世界坐标，限制在体数据范围内)，三个视图一起更新"""
+        lo, hi = self.bounds()
+        self.position = tuple(float(v) for v in np.clip(np.asarray(position, dtype=np.float64), lo, hi))
+        for view in self.views.values():
+            view.update()
+        self._changed()
+
+    def scroll(self, orientation, steps):
+        """视图沿法向翻steps张切片"""
+        view = self.views[orientation]
+        position = np.array(self.position)
+        if view.oblique is None:
+            position[view.axis] += steps * self.vtk_image.GetSpacing()[view.axis]
+        else:
+            position += steps * min(self.vtk_image.GetSpacing()) * view.oblique
+        self.set_position(position)
+
+    def set_window_level(self, window, level):
+        self.window_level = (float(window), float(level))
+        self.image_property.SetColorWindow(window)
+        self.image_property.SetColorLevel(level)
+        if self.views:
+            self._changed()
+
+    def set_preset(self, name):
+        """按名字设置窗宽窗位(WINDOW_PRESETS)，"auto"按直方图；有这个名字返回True"""
+        if name == "auto":
+            self.set_window_level(*self.histogram.window_level())
+            return True
+        if name not in WINDOW_PRESETS:
+            return False
+        self.set_window_level(*WINDOW_PRESETS[name])
+        return True
+
+    def _on_image_modified(self, obj, event):
+        # 渐进加载换了标量数组(尺寸、间距会变)，按光标的世界坐标重新算切片号
+        if self.views:
+            self.set_position(self.position)
+
+    def attach(self, orientation, interactor, max_fps=60.0, scheduler=None):
+        """
+        把视图接到它的interactor上，返回这个视图的RenderScheduler(光标移动时只标记重画，按帧率合并)
+        scheduler: 已有的RenderScheduler，None时新建(要由外部start()或定时调用tick())
+        """
+        from .render_scheduler import RenderScheduler
+
+        view = self.views[orientation]
+        style = vtkInteractorStyleImage()
+        interactor.SetInteractorStyle(style)
+        dragging = [False]
+
+        def pick(obj, event):
+            x, y = interactor.GetEventPosition()
+            self.set_position(view.world_point(x, y))
+
+        def on_press(obj, event):
+            dragging[0] = True
+            pick(obj, event)
+
+        def on_release(obj, event):
+            dragging[0] = False
+
+        def on_move(obj, event):
+            if dragging[0]:
+                pick(obj, event)
+            else:
+                style.OnMouseMove()
+
+        # 在style上加了观察者的事件不再走默认处理(vtkInteractorStyleImage左键是调窗宽窗位)
+        style.AddObserver("LeftButtonPressEvent", on_press)
+        style.AddObserver("LeftButtonReleaseEvent", on_release)
+        style.AddObserver("MouseMoveEvent", on_move)
+        style.AddObserver("MouseWheelForwardEvent", lambda obj, event: self.scroll(orientation, 1))
+        style.AddObserver("MouseWheelBackwardEvent", lambda obj, event: self.scroll(orientation, -1))
+
+        scheduler = scheduler or RenderScheduler(interactor, max_fps=max_fps)
+        scheduler.watch(view.renderer.GetActiveCamera())
+        self._schedulers[orientation] = scheduler
+        return scheduler
+
+    def render(self):
+        """立即重画所有视图(没有用RenderScheduler时)"""
+        windows = {id(view.renderer.GetRenderWindow()): view.renderer.GetRenderWindow()
+                   for view in self.views.values() if view.renderer.GetRenderWindow() is not None}
+        for window in windows.values():
+            window.Render()
@@ -0,0 +1,244 @@
+import os
+import zipfile
+
+import numpy as np
+
+from vtkmodules.vtkCommonCore import vtkPoints
+from vtkmodules.vtkCommonDataModel import vtkCellArray, vtkPolyData
+from vtkmodules.vtkRenderingCore import vtkActor, vtkPolyDataMapper
+from vtkmodules.util import numpy_support
+
+from .instrument import log
+
+# 穿刺针(套管 + 光球一体)的跟踪记录：每一帧 tail_p 是尾部(光球/套管顶端)的位置，tail_x 是姿态，
+# 针尖 = tail_p + (套管长度 + 针长) * 针的方向，针长默认15cm
+# 记录文件用mmap打开，几小时的记录也不会整个读进内存；针尖和方向对所有帧(或一段)一次向量化算完，
+# 也可以按块流式给出，送进PointCloud或者NeedleTrajectory
+#
+# 支持的记录格式:
+#   结构化数组的.npy (字段 tail_x, tail_p, 可选 time)
+#   np.savez保存的.npz (不压缩的成员直接mmap)
+#   目录，每个字段一个 .npy (tail_x.npy, tail_p.npy, ...)
+#   np.save保存的dict(需要pickle，不能mmap，只能整个读进来)
+# tail_x 可以是: (N, 3) 针的方向向量；(N, 4) 四元数；(N, 3, 3) 旋转矩阵；(N, 4, 4) 位姿矩阵
+
+NEEDLE_LENGTH = 150.0  # 针长(mm)，从套管顶端算起
+TIME_FIELDS = ("time", "timestamp", "t")
+
+
+def _npz_fields(path):
+    """npz里不压缩的成员按偏移mmap，压缩的只能读出来"""
+    fields = {}
+    with zipfile.ZipFile(path) as archive, open(path, "rb") as f:
+        for info in archive.infolist():
+            name = info.filename[:-4] if info.filename.endswith(".npy") else info.filename
+            if info.compress_type != zipfile.ZIP_STORED:
+                with archive.open(info) as member:
+                    fields[name] = np.lib.format.read_array(member)
+                continue
+            # 本地文件头: 30字节 + 文件名 + 扩展字段，后面就是.npy的内容
+            f.seek(info.header_offset + 26)
+            name_length, extra_length = np.frombuffer(f.read(4), dtype="<u2")
+            f.seek(info.header_offset + 30 + int(name_length) + int(extra_length))
+            if np.lib.format.read_magic(f) == (1, 0):
+                shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran, dtype = np.lib.format.read_array_header_2_0(f)
+            fields[name] = np.memmap(path, dtype=dtype, mode="r", offset=f.tell(), shape=shape,
+                                     order="F" if fortran else "C")
+    return fields
+
+
+def open_recording(path):
+    """打开记录文件，返回 字段名 -> 数组(尽量是mmap)"""
+    if os.path.isdir(path):
+        return {name[:-4]: np.load(os.path.join(path, name), mmap_mode="r")
+                for name in sorted(os.listdir(path)) if name.endswith(".npy")}
+    if path.endswith(".npz"):
+        return _npz_fields(path)
+    try:
+        data = np.load(path, mmap_mode="r")
+    except ValueError:
+        # 保存的是dict等Python对象，只能整个读进来
+        log(f"{path} 需要pickle，不能mmap，整个读入内存；长记录建议用save_recording转存")
+        data = np.load(path, allow_pickle=True)
+        data = data.item() if data.dtype == object and data.shape == () else data
+        return {name: np.asarray(value) for name, value in data.items()}
+    if data.dtype.names is None:
+        raise ValueError(f"{path} 不是结构化数组，找不到tail_x/tail_p字段")
+    return {name: data[name] for name in data.dtype.names}
+
+
+def save_recording(path, **fields):
+    """把各字段(tail_x=..., tail_p=..., time=...)保存成结构化数组的.npy(可以mmap)，先写临时文件再替换"""
+    frames = {len(value) for value in fields.values()}
+    if len(frames) != 1:
+        raise ValueError("各字段的帧数不一样")
+    arrays = {name: np.asarray(value) for name, value in fields.items()}
+    dtype = [(name, value.dtype, value.shape[1:]) for name, value in arrays.items()]
+    record = np.lib.format.open_memmap(path + ".tmp.npy", mode="w+", dtype=dtype, shape=(frames.pop(),))
+    for name, value in arrays.items():
+        record[name] = value
+    record.flush()
+    del record
+    os.replace(path + ".tmp.npy", path)
+
+
+def _quaternion_rotate(q, v):
+    """单位四元数 q (N, 4) (w, x, y, z) 旋转向量 v (3,)"""
+    w, xyz = q[:, :1], q[:, 1:]
+    t = 2.0 * np.cross(xyz, v)
+    return v + w * t + np.cross(xyz, t)
+
+
+def needle_directions(tail_x, axis=(1.0, 0.0, 0.0), scalar_first=True):
+    """
+    tail_x -> 针的方向(单位向量) (N, 3)
+    axis: 工具坐标系里针的方向(tail_x是四元数/矩阵时用)
+    scalar_first: 四元数是 (w, x, y, z)，False时是 (x, y, z, w)
+    缺失的帧(NaN)结果也是NaN
+    """
+    tail_x = np.asarray(tail_x, dtype=np.float64)
+    axis = np.asarray(axis, dtype=np.float64)
+    if tail_x.ndim == 2 and tail_x.shape[1] == 3:
+        directions = tail_x
+    elif tail_x.ndim == 2 and tail_x.shape[1] == 4:
+        q = tail_x if scalar_first else tail_x[:, [3, 0, 1, 2]]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            q = q / np.linalg.norm(q, axis=1, keepdims=True)
+        directions = _quaternion_rotate(q, axis)
+    elif tail_x.ndim == 3 and tail_x.shape[1:] in ((3, 3), (4, 4)):
+        directions = tail_x[:, :3, :3] @ axis
+    else:
+        raise ValueError(f"不认识的tail_x形状: {tail_x.shape}")
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return directions / np.linalg.norm(directions, axis=1, keepdims=True)
+
+
+def needle_tips(tail_p, tail_x, length, axis=(1.0, 0.0, 0.0), scalar_first=True):
+    """针尖 = tail_p + length * 方向，返回 (针尖 (N, 3), 方向 (N, 3))"""
+    directions = needle_directions(tail_x, axis, scalar_first)
+    return np.asarray(tail_p, dtype=np.float64) + length * directions, directions
+
+
+class NeedleRecording:
+    """
+    path: 记录文件(格式见上面)
+    needle_length: 针长(mm)，sleeve_length: 套管长度(mm)，针尖 = tail_p + (套管长度 + 针长) * 方向
+    axis / scalar_first: 见needle_directions
+    tail_x / tail_p: 字段名不一样时可以改
+    frames: 帧数，times: 时间戳字段(time/timestamp/t)，没有时是None
+    """
+
+    def __init__(self, path, needle_length=NEEDLE_LENGTH, sleeve_length=0.0, axis=(1.0, 0.0, 0.0),
+                 scalar_first=True, tail_x="tail_x", tail_p="tail_p"):
+        self.path = path
+        self.needle_length = needle_length
+        self.sleeve_length = sleeve_length
+        self.axis = axis
+        self.scalar_first = scalar_first
+        self.fields = open_recording(path)
+        for name in (tail_x, tail_p):
+            if name not in self.fields:
+                raise ValueError(f"{path} 里没有 {name} 字段，只有 {sorted(self.fields)}")
+        self.tail_x = self.fields[tail_x]
+        self.tail_p = self.fields[tail_p].reshape(-1, 3)
+        if len(self.tail_x) != len(self.tail_p):
+            raise ValueError(f"{tail_x} 和 {tail_p} 的帧数不一样")
+        self.frames = len(self.tail_p)
+        self.times = next((self.fields[name] for name in TIME_FIELDS if name in self.fields), None)
+
+    @property
+    def length(self):
+        """针尖到tail_p的距离"""
+        return self.sleeve_length + self.needle_length
+
+    def tips(self, start=0, stop=None, step=1):
+        """一段帧(默认全部)的 (针尖, 方向)，一次向量化算完，只读这一段的数据"""
+        frames = slice(start, stop, step)
+        return needle_tips(self.tail_p[frames], self.tail_x[frames], self.length, self.axis, self.scalar_first)
+
+    def chunks(self, chunk_size=1 << 16, start=0, stop=None, step=1):
+        """按块给出 (第一帧的下标, 针尖, 方向)，每次只有一块在内存里"""
+        stop = self.frames if stop is None else min(stop, self.frames)
+        for first in range(start, stop, chunk_size * step):
+            tips, directions = self.tips(first, min(stop, first + chunk_size * step), step)
+            yield first, tips, directions
+
+    def source(self, chunk_size=1000, step=1, loop=False):
+        """
+        PointCloud.start_producer用的数据源: 每次给出一块针尖(float32)，缺失的帧跳过
+        loop=True时播完从头再来
+        """
+        chunks = [self.chunks(chunk_size, step=step)]
+
+        def source():
+            for _ in range(2):
+                for _, tips, _ in chunks[0]:
+                    tips = tips[np.isfinite(tips).all(axis=1)]
+                    if len(tips):
+                        return tips.astype(np.float32)
+                if not loop:
+                    return None
+                chunks[0] = self.chunks(chunk_size, step=step)
+            return None
+        return source
+
+
+class NeedleTrajectory:
+    """
+    针尖轨迹的折线actor，点按块追加(add_points，和PointCloud一样)
+    capacity: 最多保留的点数；满了之后已有的点隔一个丢一个，以后的点也按同样的间隔取，
+              整段记录(几小时)都留在轨迹里，只是变稀
+    """
+
+    def __init__(self, capacity=100000, color=(1.0, 0.3, 0.3)):
+        self.capacity = capacity
+        self.stride = 1  # 每stride个输入点留一个
+        self._seen = 0   # 一共收到过多少个点
+        self._count = 0
+        self._points = np.zeros((capacity, 3), dtype=np.float32)
+        self._connectivity = np.arange(capacity, dtype=np.int64)
+
+        self._vtk_points = vtkPoints()
+        self._lines = vtkCellArray()
+        self.polydata = vtkPolyData()
+        self.polydata.SetPoints(self._vtk_points)
+        self.polydata.SetLines(self._lines)
+        self._wrap()
+
+        mapper = vtkPolyDataMapper()
+        mapper.SetInputData(self.polydata)
+        self.actor = vtkActor()
+        self.actor.SetMapper(mapper)
+        self.actor.GetProperty().SetColor(*color)
+
+    def _wrap(self):
+        count = self._count
+        self._vtk_points.SetData(numpy_support.numpy_to_vtk(self._points[:count], deep=False))
+        # 一条折线: offsets [0, count]
+        self._offsets = np.array([0, count] if count else [0], dtype=np.int64)
+        self._lines.SetData(numpy_support.numpy_to_vtk(self._offsets, deep=False),
+                            numpy_support.numpy_to_vtk(self._connectivity[:count], deep=False))
+        self.polydata.Modified()
+
+    def add_points(self, points):
+        points = np.asarray(points, dtype=np.float32).reshape(-1, 3)
+        points = points[np.isfinite(points).all(axis=1)]
+        # 第i个输入点(从开始算)在 i % stride == 0 时保留
+        index = self._seen + np.arange(len(points))
+        self._seen += len(points)
+        kept = points[index % self.stride == 0]
+        while self._count + len(kept) > self.capacity:
+            # 满了: 已有的点隔一个丢一个(留下的正好是新间隔的倍数)，这一批按新间隔重新取
+            self._count = (self._count + 1) // 2
+            self._points[:self._count] = self._points[:2 * self._count:2]
+            self.stride *= 2
+            kept = points[index % self.stride == 0]
+        self._points[self._count:self._count + len(kept)] = kept
+        self._count += len(kept)
+        self._wrap()
+
+    @property
+    def count(self):
+        return self._count
@@ -0,0 +1,190 @@
+import queue
+import threading
+
+from vtkmodules.vtkRenderingCore import vtkVolume
+from vtkmodules.vtkRenderingVolumeOpenGL2 import vtkSmartVolumeMapper
+
+from . import rendering  # noqa: F401  注册OpenGL2实现
+from .dicom_loader import DicomSeriesLoader
+from .instrument import log, stage, timed
+from .mpr import OrthogonalMPR, VolumeHistogram
+from .progressive_loader import ProgressiveVolumeLoader
+from .tf_presets import TransferFunctionPresets
+from .volume_cache import VolumeCache, numpy_to_vtk_image, series_spacing, series_origin
+from .volume_pyramid import VolumePyramid, InteractiveLOD, build_levels, vtk_image_to_numpy
+
+# DICOM -> 体数据 -> vtkImageData -> 体绘制，LoadDCM2/3/4Qt共用
+
+
+class DicomVolumePipeline:
+    """
+    workers / executor / use_index: 传给DicomSeriesLoader
+    cache: 体数据缓存(VolumeCache)，presets: 传输函数预设(TransferFunctionPresets)
+    """
+
+    def __init__(self, workers=None, executor="thread", use_index=True, cache=None, presets=None):
+        self.loader = DicomSeriesLoader(workers=workers, executor=executor, use_index=use_index)
+        self.volume_cache = cache or VolumeCache()
+        self.presets = presets or TransferFunctionPresets()
+        self.volume = None
+        self.series_key = None
+        self.crop = None
+        self.progressive = None
+        self.lod = None
+        self.mpr = None
+
+    @timed("load_dicom_series")
+    def load_dicom_series(self, directory_path, decode=True, roi=None):
+        """
+        加载DICOM系列文件（先读文件头排序，再并行解码像素）
+        decode=False 时只返回排好序的头信息，像素留给create_volume_data按需解码
+        roi: roi.VolumeROI，只保留和它相交的切片，切片内的像素范围存在self.crop
+        """
+        log("正在读取DICOM文件...")
+        dicom_series = self.loader.scan_headers(directory_path)
+        if not dicom_series:
+            log("未找到有效的DICOM文件!")
+            return None
+
+        self.crop = None
+        if roi is not None:
+            dicom_series, self.crop = roi.resolve(dicom_series)
+        if decode:
+            dicom_series = self.loader.decode(dicom_series)
+
+        log(f"成功加载 {len(dicom_series)} 个DICOM切片")
+        return dicom_series
+
+    @timed("create_volume_data")
+    def create_volume_data(self, dicom_series, crop=None):
+        """
+        创建体积数据，按VTK内存顺序 (slices, rows, cols) 存放，已缓存的序列直接mmap
+        crop: (row0, row1, col0, col1)，只保存ROI框内的像素
+        """
+        rows, cols, slices = dicom_series[0].Rows, dicom_series[0].Columns, len(dicom_series)
+        if crop is not None:
+            rows, cols = crop[1] - crop[0], crop[3] - crop[2]
+        log(f"图像尺寸: {rows} x {cols} x {slices}")
+        # 缓存没命中时才解码像素并转换为Hounsfield单位
+        return self.volume_cache.get(dicom_series, decode=self.loader.iter_decode, crop=crop)
+
+    @timed("create_vtk_image_data")
+    def create_vtk_image_data(self, volume_array, dicom_series, crop=None):
+        """创建VTK图像数据（零拷贝引用volume_array），有crop时原点偏移到ROI框的第一个像素"""
+        if not hasattr(dicom_series[0], "PixelSpacing"):
+            log("警告: 未找到像素间距信息，使用默认值1.0")
+        dx, dy, dz = series_spacing(dicom_series)
+        log(f"像素间距: X={dx}, Y={dy}, Z={dz}")
+        return numpy_to_vtk_image(volume_array, (dx, dy, dz), series_origin(dicom_series, crop))
+
+    def load_volume_image(self, directory_path, progressive=0, roi=None):
+        """
+        读取目录得到vtkImageData，找不到DICOM返回None
+        progressive>1 时先返回每隔progressive张的低分辨率体数据，之后由start_refinement补齐
+        roi: roi.VolumeROI，只解码相交的切片、只保存框内的像素，世界坐标不变
+        """
+        dicom_series = self.load_dicom_series(directory_path, decode=False, roi=roi)
+        if not dicom_series:
+            return None
+        self.series_key = self.volume_cache.key(dicom_series, self.crop)
+
+        if progressive > 1:
+            self.progressive = ProgressiveVolumeLoader(
+                dicom_series, step=progressive, loader=self.loader, cache=self.volume_cache, crop=self.crop
+            )
+            return self.progressive.load_coarse()
+        volume_array = self.create_volume_data(dicom_series, self.crop)
+        return self.create_vtk_image_data(volume_array, dicom_series, self.crop)
+
+    @timed("setup_volume_rendering")
+    def setup_volume_rendering(self, vtk_image, preset="bone"):
+        """创建体绘制的vtkVolume，默认骨骼模式"""
+        volume_mapper = vtkSmartVolumeMapper()
+        volume_mapper.SetInputData(vtk_image)
+
+        self.volume = vtkVolume()
+        self.volume.SetMapper(volume_mapper)
+        self.presets.apply(self.volume, preset)
+        return self.volume
+
+    @property
+    def volume_property(self):
+        """体绘制当前用的vtkVolumeProperty，切换预设时会换成另一个对象；还没有体绘制时是默认的骨骼预设"""
+        if self.volume is None:
+            return self.presets.property("bone")
+        return self.volume.GetProperty()
+
+    def set_preset(self, name):
+        """切换传输函数预设，有切换返回True"""
+        if self.volume is None:
+            return False
+        return self.presets.apply(self.volume, name)
+
+    def histogram(self, vtk_image):
+        """体数据的直方图(窗宽窗位用)；全分辨率时按序列指纹缓存，渐进加载的粗一级只在内存里算"""
+        full = self.progressive is None or self.progressive.level == 1
+        key = self.series_key if full else None
+        return VolumeHistogram(vtk_image_to_numpy(vtk_image), key=key, cache_dir=self.volume_cache.cache_dir)
+
+    @timed("setup_mpr")
+    def setup_mpr(self, vtk_image):
+        """三个正交切面(OrthogonalMPR)，和体绘制共用同一个vtkImageData，视图由调用方add_view/attach"""
+        self.mpr = OrthogonalMPR(vtk_image, histogram=self.histogram(vtk_image))
+        return self.mpr
+
+    @timed("volume_pyramid")
+    def enable_lod(self, vtk_image, interactor, renderer, levels=None):
+        """
+        建立体数据金字塔，旋转/缩放时自动渲染粗一级，停下后切回全分辨率
+        levels: 后台算好的各级数组(build_levels)，不给就在这里算，没有缓存时要几秒
+        """
+        pyramid = VolumePyramid(vtk_image, key=self.series_key, cache_dir=self.volume_cache.cache_dir, levels=levels)
+        self.lod = InteractiveLOD(self.volume, pyramid, interactor, renderer)
+        return self.lod
+
+    def enable_lod_async(self, vtk_image, interactor, renderer, interval=100):
+        """
+        在后台线程里算金字塔各级，算完后在主线程(interactor定时器)里建mapper和InteractiveLOD，
+        降采样整个体数据时界面不会卡住
+        """
+        volume = vtk_image_to_numpy(vtk_image)
+        result = queue.Queue()
+
+        def run():
+            try:
+                with stage("volume_pyramid_levels"):
+                    result.put(build_levels(volume, key=self.series_key, cache_dir=self.volume_cache.cache_dir))
+            except Exception as e:
+                log(f"体数据金字塔生成失败: {e}")
+                result.put(None)
+
+        def timer_callback(obj, event):
+            try:
+                levels = result.get_nowait()
+            except queue.Empty:
+                return
+            interactor.DestroyTimer(timer_id)
+            interactor.RemoveObserver(observer)
+            if levels is not None:
+                self.enable_lod(vtk_image, interactor, renderer, levels=levels)
+
+        if not interactor.GetInitialized():
+            interactor.Initialize()
+        observer = interactor.AddObserver("TimerEvent", timer_callback)
+        timer_id = interactor.CreateRepeatingTimer(interval)
+        threading.Thread(target=run, daemon=True).start()
+
+    def start_refinement(self, interactor, render_window, renderer, lod=True):
+        """
+        窗口显示之后调用：渐进加载时在后台补齐切片，
+        全分辨率体数据就绪后(lod=True且有体绘制时)在后台线程建立金字塔
+        """
+        on_done = None
+        if lod and self.volume is not None:
+            def on_done(vtk_image):
+                self.enable_lod_async(vtk_image, interactor, renderer)
+
+        if self.progressive is not None:
+            self.progressive.attach(interactor, render_window, on_done=on_done)
+        elif on_done is not None:
+            on_done(self.volume.GetMapper().GetInput())
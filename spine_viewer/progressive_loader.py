@@ -0,0 +1,196 @@
+import time
+import queue
+import threading
+import numpy as np
+
+from vtkmodules.util import numpy_support
+
+from .instrument import log, stage, timed
+from .dicom_loader import DicomSeriesLoader
+from .volume_builder import VolumeBuilder, choose_dtype, crop_slices, fill_missing
+from .volume_cache import (VolumeCache, numpy_to_vtk_image, series_fingerprint,
+                          series_spacing, series_origin)
+
+# 由粗到细的渐进加载：
+# 1. 先解码每隔step张的切片，得到z方向间距为step*dz的低分辨率体数据，马上显示
+# 2. 后台线程补齐剩下的切片，每补完一级(step/2, step/4 ... 1)就原地更新mapper的输入
+# VTK对象只在主线程(interactor定时器)里修改，后台线程只写numpy缓冲区
+
+
+class ProgressiveVolumeLoader:
+    """
+    headers: 排好序的头信息(DicomSeriesLoader.scan_headers的结果)
+    step: 第一次显示时每隔多少张取一张切片
+    crop: 只保存切片内 (row0, row1, col0, col1) 的像素(roi.VolumeROI)
+    """
+
+    def __init__(self, headers, step=8, loader=None, cache=None, crop=None):
+        self.headers = headers
+        self.step = max(1, int(step))
+        self.loader = loader or DicomSeriesLoader()
+        self.cache = cache or VolumeCache()
+        self.crop = crop
+        self.spacing = series_spacing(headers)
+        self.origin = series_origin(headers, crop)
+        self.vtk_image = None
+        self.level = None
+        self.done = False
+
+        self._dtype = self.cache.dtype if self.cache.dtype is not None else choose_dtype(headers)
+        self._key = series_fingerprint(headers, self._dtype, crop)
+        self._volume = None
+        self._builder = None
+        self._decoded = np.zeros(len(headers), dtype=bool)
+        self._ready = queue.Queue()
+        self._thread = None
+        self._timer_id = None
+        self._start = time.perf_counter()
+
+    def _levels(self):
+        levels = []
+        level = self.step // 2
+        while level > 1:
+            levels.append(level)
+            level //= 2
+        levels.append(1)
+        return levels
+
+    def _decode(self, indices):
+        # 解码失败的切片会被跳过，用文件名对应回切片位置
+        positions = {str(self.headers[i].filename): i for i in indices}
+        for ds in self.loader.iter_decode([self.headers[i] for i in indices]):
+            index = positions[str(ds.filename)]
+            self._builder.put(index, ds)
+            self._decoded[index] = True
+
+    def _wrap(self, array, level):
+        spacing = (self.spacing[0], self.spacing[1], self.spacing[2] * level)
+        return numpy_to_vtk_image(array, spacing, self.origin)
+
+    @timed("load_coarse")
+    def load_coarse(self):
+        """解码粗一级的切片并返回可以直接显示的vtkImageData，缓存命中时直接返回全分辨率"""
+        volume = self.cache.load(self._key)
+        if volume is not None:
+            log(f"体数据缓存命中: {self.cache.path(self._key)}")
+            self._volume = volume
+            self.level = 1
+            self.done = True
+            self.vtk_image = self._wrap(volume, 1)
+            return self.vtk_image
+
+        self._builder = VolumeBuilder(self.headers, dtype=self._dtype, crop=self.crop,
+                                      out=self._volume_buffer())
+
+        indices = list(range(0, len(self.headers), self.step))
+        self._decode(indices)
+        self.level = self.step
+        self.vtk_image = self._wrap(self._level_array(self.step), self.step)
+        log(f"低分辨率体数据: {len(indices)}/{len(self.headers)} 个切片, "
+            f"{time.perf_counter() - self._start:.2f}s")
+        return self.vtk_image
+
+    def _volume_buffer(self):
+        rows, cols = crop_slices(self.headers, self.crop)
+        shape = (len(self.headers), rows.stop - rows.start, cols.stop - cols.start)
+        self._volume = self.cache.create(self._key, shape, self._dtype)
+        return self._volume
+
+    def _level_array(self, level):
+        if level == 1:
+            return self._volume
+        # 隔level张取一张，拷成连续数组才能给VTK
+        return np.ascontiguousarray(self._volume[::level])
+
+    def _run(self):
+        try:
+            with stage("refine"):
+                self._refine()
+        except Exception as e:
+            log(f"后台加载失败: {e}")
+            self._ready.put(None)
+
+    def _refine(self):
+        for level in self._levels():
+            indices = [i for i in range(0, len(self.headers), level) if not self._decoded[i]]
+            self._decode(indices)
+            if level == 1:
+                self._finish()
+            self._ready.put((level, self._level_array(level)))
+
+    def _finish(self):
+        # 全部切片都解码成功才放进缓存；有失败的切片时体数据不完整，不能以后当成完整的序列读出来
+        missing = np.flatnonzero(~self._decoded)
+        if not len(missing):
+            self.cache.commit(self._key, self._volume)
+            return
+        log(f"警告: {len(missing)}/{len(self.headers)} 个切片解码失败，这些位置显示为空白，体数据不缓存: "
+            f"{missing[:20].tolist()}{' ...' if len(missing) > 20 else ''}")
+        if len(missing) < len(self.headers):
+            fill_missing(self._volume, missing)
+        # Linux下删掉文件后mmap仍然可以继续用
+        self.cache.discard(self._key)
+
+    def start(self):
+        """启动后台线程补齐剩下的切片"""
+        if self.done or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def poll(self):
+        """主线程调用：把后台已经完成的最细一级更新到vtkImageData，有更新返回True"""
+        latest = None
+        while True:
+            try:
+                item = self._ready.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self.done = True
+                return False
+            latest = item
+        if latest is None:
+            return False
+
+        level, array = latest
+        self.vtk_image.SetDimensions(array.shape[2], array.shape[1], array.shape[0])
+        self.vtk_image.SetSpacing(self.spacing[0], self.spacing[1], self.spacing[2] * level)
+        vtk_data = numpy_support.numpy_to_vtk(
+            array.reshape(-1), deep=False,
+            array_type=numpy_support.get_vtk_array_type(array.dtype)
+        )
+        self.vtk_image.GetPointData().SetScalars(vtk_data)
+        self.vtk_image.Modified()
+        self.level = level
+        if level == 1:
+            self.done = True
+            log(f"全分辨率体数据加载完成: {time.perf_counter() - self._start:.2f}s")
+        else:
+            log(f"体数据细化到每 {level} 张取一张")
+        return True
+
+    def attach(self, interactor, render_window, interval=100, on_done=None):
+        """
+        用interactor的定时器轮询后台进度，每次细化后重新渲染，完成后停掉定时器
+        on_done: 全分辨率加载完成后在主线程调用 on_done(vtk_image)
+        """
+        if self.done:
+            if on_done is not None:
+                on_done(self.vtk_image)
+            return
+
+        def timer_callback(obj, event):
+            if self.poll():
+                render_window.Render()
+            if self.done and self._timer_id is not None:
+                interactor.DestroyTimer(self._timer_id)
+                self._timer_id = None
+                if on_done is not None and self.level == 1:
+                    on_done(self.vtk_image)
+
+        if not interactor.GetInitialized():
+            interactor.Initialize()
+        interactor.AddObserver("TimerEvent", timer_callback)
+        self._timer_id = interactor.CreateRepeatingTimer(interval)
+        self.start()
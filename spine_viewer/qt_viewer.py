@@ -0,0 +1,103 @@
+from PyQt5.QtCore import QTimer
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QGridLayout, QPushButton
+
+from vtkmodules.vtkInteractionStyle import vtkInteractorStyleMultiTouchCamera
+from vtkmodules.qt.QVTKRenderWindowInteractor import QVTKRenderWindowInteractor
+
+from .pipeline import DicomVolumePipeline
+from .rendering import create_renderer
+
+# 可以嵌入到其他Qt程序里的体绘制控件；只有用到时才会导入PyQt5
+
+# mpr=True时 2x2 排列: 3D体绘制 | 横断面 / 冠状面 | 矢状面
+MPR_LAYOUT = {"axial": (0, 1), "coronal": (1, 0), "sagittal": (1, 1)}
+
+
+class DicomVolumeWidget(QWidget):
+    """mpr: 在体绘制旁边显示横断面、冠状面、矢状面三个同步的切面视图(spine_viewer.mpr)"""
+
+    def __init__(self, parent=None, pipeline=None, mpr=False, max_fps=60):
+        super().__init__(parent)
+        layout = QVBoxLayout()
+        self.setLayout(layout)
+
+        # QVTK交互
+        views = QGridLayout()
+        layout.addLayout(views)
+        self._vtk_widget = QVTKRenderWindowInteractor(self)
+        views.addWidget(self._vtk_widget, 0, 0)
+
+        # 控制按钮
+        btn_layout = QHBoxLayout()
+        layout.addLayout(btn_layout)
+        self._btn_bone = QPushButton("BONE MODE")
+        self._btn_soft = QPushButton("SOFT MODE")
+        btn_layout.addWidget(self._btn_bone)
+        btn_layout.addWidget(self._btn_soft)
+        self._btn_bone.clicked.connect(lambda: self.set_preset("bone"))
+        self._btn_soft.clicked.connect(lambda: self.set_preset("soft_tissue"))
+
+        # VTK
+        self._render = create_renderer(background=(0, 0, 0))
+        self._vtk_widget.GetRenderWindow().AddRenderer(self._render)
+        self._interactor = self._vtk_widget.GetRenderWindow().GetInteractor()
+        self._interactor.SetInteractorStyle(vtkInteractorStyleMultiTouchCamera())
+
+        self.pipeline = pipeline or DicomVolumePipeline()
+
+        # 切面视图: 每个视图一个QVTK控件，光标移动时只标记重画，由一个QTimer按帧率统一渲染
+        self._mpr_widgets = {}
+        self._schedulers = []
+        self._mpr_timer = None
+        if mpr:
+            for name, (row, col) in MPR_LAYOUT.items():
+                widget = QVTKRenderWindowInteractor(self)
+                widget.GetRenderWindow().AddRenderer(create_renderer(background=(0, 0, 0)))
+                views.addWidget(widget, row, col)
+                self._mpr_widgets[name] = widget
+            self._mpr_timer = QTimer(self)
+            self._mpr_timer.setInterval(max(1, int(1000 / max_fps)))
+            self._mpr_timer.timeout.connect(self._tick)
+            self._max_fps = max_fps
+
+    def render_window(self):
+        return self._vtk_widget.GetRenderWindow()
+
+    # 预设的property只建一次，切换时直接换，重复点同一个按钮不会触发重新渲染
+    def set_preset(self, name):
+        if self.pipeline.set_preset(name):
+            self.render_window().Render()
+        # 切面视图的窗宽窗位跟着换(只是标记重画)
+        if self.pipeline.mpr is not None:
+            self.pipeline.mpr.set_preset(name)
+
+    def _tick(self):
+        for scheduler in self._schedulers:
+            scheduler.tick()
+
+    def _setup_mpr(self, vtk_image):
+        mpr = self.pipeline.setup_mpr(vtk_image)
+        for name, widget in self._mpr_widgets.items():
+            render_window = widget.GetRenderWindow()
+            mpr.add_view(name, render_window.GetRenderers().GetFirstRenderer())
+            self._schedulers.append(mpr.attach(name, render_window.GetInteractor(), max_fps=self._max_fps))
+        self._mpr_timer.start()
+        return mpr
+
+    def setup_volume_rendering(self, vtk_image):
+        """体绘制vtk_image并加到3D视图里，返回vtkVolume"""
+        volume = self.pipeline.setup_volume_rendering(vtk_image)
+        self._render.AddVolume(volume)
+        self._render.ResetCamera()
+        return volume
+
+    def load(self, path: str, progressive=8):
+        """读取DICOM目录并显示；progressive>1时先显示低分辨率，后台补齐后原地细化"""
+        vtk_image = self.pipeline.load_volume_image(path, progressive=progressive)
+        if vtk_image is None:
+            return None
+        self.setup_volume_rendering(vtk_image)
+        if self._mpr_widgets:
+            self._setup_mpr(vtk_image)
+        self.pipeline.start_refinement(self._interactor, self.render_window(), self._render)
+        return vtk_image
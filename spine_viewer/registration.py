@@ -0,0 +1,225 @@
+import time
+import numpy as np
+
+from . import instrument
+from .spatial_index import PointIndex
+from .voxel_grid import voxel_keys
+
+# 点云(跟踪器扫描的骨表面点)和DICOM骨表面的刚性配准(ICP)，全部用numpy向量化
+# 表面顶点建一次空间索引(PointIndex)，每次迭代对所有点一起查最近点；
+# 由粗到细: 粗的层级只用一部分点，表面也按体素降采样，最后一层才用全部点和完整表面
+# 离群点按距离的中位数+MAD剔除，也可以再给一个绝对距离上限
+
+
+def surface_arrays(surface):
+    """vtkPolyData 或 (points, normals) -> 表面顶点 (N, 3) float32, 法向 (N, 3) float32或None"""
+    if isinstance(surface, (tuple, list)):
+        points, normals = surface
+    else:
+        from vtkmodules.util import numpy_support
+        points = numpy_support.vtk_to_numpy(surface.GetPoints().GetData())
+        normals = surface.GetPointData().GetNormals()
+        if normals is not None:
+            normals = numpy_support.vtk_to_numpy(normals)
+    points = np.ascontiguousarray(points, dtype=np.float32).reshape(-1, 3)
+    if normals is not None:
+        normals = np.ascontiguousarray(normals, dtype=np.float32).reshape(-1, 3)
+    return points, normals
+
+
+def transform_points(matrix, points):
+    """4x4刚性变换作用到点 (N, 3)"""
+    return points @ matrix[:3, :3].T + matrix[:3, 3]
+
+
+def rotation_matrix(rotvec):
+    """旋转向量(轴 * 角度, 弧度) -> 3x3旋转矩阵"""
+    angle = float(np.linalg.norm(rotvec))
+    if angle < 1e-12:
+        return np.eye(3)
+    k = rotvec / angle
+    cross = np.array([[0, -k[2], k[1]], [k[2], 0, -k[0]], [-k[1], k[0], 0]])
+    return np.eye(3) + np.sin(angle) * cross + (1 - np.cos(angle)) * cross @ cross
+
+
+def rigid_fit(source, target):
+    """最小二乘刚性变换 source -> target (Kabsch/SVD)，返回4x4"""
+    source_center = source.mean(axis=0)
+    target_center = target.mean(axis=0)
+    h = (source - source_center).T @ (target - target_center)
+    u, _, vt = np.linalg.svd(h)
+    d = np.sign(np.linalg.det(vt.T @ u.T))
+    rotation = vt.T @ np.diag([1.0, 1.0, d]) @ u.T
+    matrix = np.eye(4)
+    matrix[:3, :3] = rotation
+    matrix[:3, 3] = target_center - rotation @ source_center
+    return matrix
+
+
+def _plane_fit(source, target, normals):
+    """点到面的线性化最小二乘(小角度)，返回4x4"""
+    a = np.concatenate([np.cross(source, normals), normals], axis=1)
+    b = ((target - source) * normals).sum(axis=1)
+    x = np.linalg.lstsq(a.T @ a, a.T @ b, rcond=None)[0]
+    matrix = np.eye(4)
+    matrix[:3, :3] = rotation_matrix(x[:3])
+    matrix[:3, 3] = x[3:]
+    return matrix
+
+
+class RegistrationResult:
+    """
+    matrix: 4x4刚性变换，点云坐标 -> 表面(图像)坐标
+    rmse: 最后一次迭代内点的残差均方根(mm)，点到面方法是沿法向的距离
+    inlier_fraction: 最后一次迭代没被剔除的点的比例
+    iterations: 每次迭代一项 {level, iteration, points, inliers, rmse, step, nearest_s, seconds}
+    """
+
+    def __init__(self, matrix, rmse, inlier_fraction, iterations, seconds, converged):
+        self.matrix = matrix
+        self.rmse = rmse
+        self.inlier_fraction = inlier_fraction
+        self.iterations = iterations
+        self.seconds = seconds
+        self.converged = converged
+
+    def vtk_matrix(self):
+        """vtkMatrix4x4，可以直接给actor.SetUserMatrix"""
+        from vtkmodules.vtkCommonMath import vtkMatrix4x4
+        matrix = vtkMatrix4x4()
+        matrix.DeepCopy(self.matrix.ravel().tolist())
+        return matrix
+
+    def __repr__(self):
+        return (f"RegistrationResult(rmse={self.rmse:.3f}mm, inliers={self.inlier_fraction:.1%}, "
+                f"iterations={len(self.iterations)}, {self.seconds * 1000:.0f}ms)")
+
+
+class SurfaceRegistration:
+    """
+    surface: 骨表面 vtkPolyData(BoneSurfaceExtractor.extract的结果) 或 (顶点, 法向)
+    method: "point_to_plane" 需要表面法向，收敛快；"point_to_point" 标准ICP
+    levels: 由粗到细的层级 (点云使用比例, 表面降采样体素大小mm)，体素大小0表示完整表面
+    max_iterations: 每个层级最多迭代几次
+    tolerance: 一次迭代的位移(平移 + 旋转角 * 点云半径)小于它(mm)时这一层收敛
+    max_distance: 最近点距离超过它(mm)的点不参与计算，None表示不限制
+    outlier_sigma: 距离超过 中位数 + outlier_sigma * 1.4826 * MAD 的点当作离群点
+    表面的空间索引在构造时建好，同一个表面可以反复配准
+    """
+
+    def __init__(self, surface, method="point_to_plane", levels=((0.1, 4.0), (0.3, 2.0), (1.0, 0.0)),
+                 max_iterations=20, tolerance=0.01, max_distance=None, outlier_sigma=3.0, min_points=50, seed=0):
+        if method not in ("point_to_plane", "point_to_point"):
+            raise ValueError(f"未知的配准方法: {method}")
+        self.points, self.normals = surface_arrays(surface)
+        if method == "point_to_plane" and self.normals is None:
+            instrument.log("表面没有法向，改用点到点配准")
+            method = "point_to_point"
+        if not len(self.points):
+            raise ValueError("表面没有顶点")
+        self.method = method
+        self.levels = tuple(levels)
+        self.max_iterations = max_iterations
+        self.tolerance = tolerance
+        self.max_distance = max_distance
+        self.outlier_sigma = outlier_sigma
+        self.min_points = min_points
+        self.seed = seed
+
+        # 每个不同的体素大小一套 (顶点下标, 索引)
+        self._surfaces = {}
+        with instrument.stage("registration_index"):
+            for _, voxel in self.levels:
+                self._surface(voxel)
+
+    def _surface(self, voxel):
+        if voxel not in self._surfaces:
+            if voxel:
+                # 每个体素保留一个顶点(和它的法向)
+                _, subset = np.unique(voxel_keys(self.points, voxel), return_index=True)
+            else:
+                subset = np.arange(len(self.points))
+            index = PointIndex(np.ascontiguousarray(self.points[subset]))
+            index.rebuild()
+            self._surfaces[voxel] = (subset, index)
+        return self._surfaces[voxel]
+
+    def _inliers(self, distance):
+        """返回 (内点, 距离上限)"""
+        keep = np.isfinite(distance)
+        cutoff = np.inf if self.max_distance is None else self.max_distance
+        if self.outlier_sigma and keep.any():
+            median = np.median(distance[keep])
+            mad = np.median(np.abs(distance[keep] - median))
+            cutoff = min(cutoff, median + self.outlier_sigma * 1.4826 * mad + 1e-9)
+        return keep & (distance <= cutoff), cutoff
+
+    @instrument.timed("registration")
+    def register(self, points, initial=None, callback=None):
+        """
+        points: 点云 (N, 3)，例如PointCloud.points()
+        initial: 初始4x4变换(例如手动选点或上一次配准的结果)，None是单位矩阵
+        callback: 每次迭代后调用 callback(info)，info和result.iterations里的一项一样
+        """
+        start = time.perf_counter()
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        if len(points) < 6:
+            raise ValueError("点云至少需要6个点")
+        matrix = np.eye(4) if initial is None else np.array(initial, dtype=np.float64).reshape(4, 4)
+        order = np.random.default_rng(self.seed).permutation(len(points))
+        # 用来把旋转角换算成位移
+        radius = float(np.sqrt(((points - points.mean(axis=0)) ** 2).sum(axis=1).mean())) or 1.0
+
+        iterations = []
+        rmse, inlier_fraction, converged = np.inf, 0.0, False
+        # 最近点只在这个距离内找，上一次迭代的离群点上限的两倍，离群点不用一圈圈扩大搜索
+        search = self.max_distance
+        for level, (fraction, voxel) in enumerate(self.levels):
+            count = min(len(points), max(self.min_points, int(np.ceil(fraction * len(points)))))
+            source = points[order[:count]]
+            subset, index = self._surface(voxel)
+            converged = False
+            for iteration in range(self.max_iterations):
+                tick = time.perf_counter()
+                moved = transform_points(matrix, source)
+                distance, nearest = index.nearest(moved, max_distance=search)
+                nearest_s = time.perf_counter() - tick
+                keep, cutoff = self._inliers(distance)
+                if np.isfinite(cutoff):
+                    search = 2.0 * cutoff
+                if keep.sum() < 6:
+                    instrument.log(f"配准: 内点太少({keep.sum()}个)，停止")
+                    break
+                moved = moved[keep]
+                target = index.points[nearest[keep]].astype(np.float64)
+                if self.method == "point_to_plane":
+                    normals = self.normals[subset[nearest[keep]]].astype(np.float64)
+                    residual = ((moved - target) * normals).sum(axis=1)
+                    step = _plane_fit(moved, target, normals)
+                else:
+                    residual = distance[keep]
+                    step = rigid_fit(moved, target)
+                matrix = step @ matrix
+
+                rmse = float(np.sqrt(np.mean(residual ** 2)))
+                inlier_fraction = float(keep.mean())
+                angle = np.arccos(np.clip((np.trace(step[:3, :3]) - 1) / 2, -1.0, 1.0))
+                size = float(np.linalg.norm(step[:3, 3]) + angle * radius)
+                info = {
+                    "level": level,
+                    "iteration": iteration,
+                    "points": count,
+                    "inliers": int(keep.sum()),
+                    "rmse": rmse,
+                    "step": size,
+                    "nearest_s": nearest_s,
+                    "seconds": time.perf_counter() - tick,
+                }
+                iterations.append(info)
+                if callback is not None:
+                    callback(info)
+                if size < self.tolerance:
+                    converged = True
+                    break
+
+        return RegistrationResult(matrix, rmse, inlier_fraction, iterations, time.perf_counter() - start, converged)
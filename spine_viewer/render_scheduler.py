@@ -0,0 +1,130 @@
+import time
+import collections
+
+import numpy as np
+
+from .ingest import RateCounter
+
+# 按需渲染：场景有变化(invalidate、被watch的对象Modified、有动画)才渲染，
+# 两帧之间的多次变化合并成一帧，帧率不超过max_fps；场景不动时定时器只检查一个标志，不渲染
+# 动画按真实时间(dt)推进，每一帧开始前(包括鼠标交互时interactor自己触发的渲染)都会推进，交互时动画不会停
+
+
+class RenderScheduler:
+    """
+    interactor: vtkRenderWindowInteractor，start()后用它的定时器驱动；
+                也可以不start，由外部(例如QTimer)定时调用tick()
+    max_fps: 帧率上限，也是定时器的间隔
+    history: 保留最近多少帧的帧时间做统计
+    invalidate()只设置一个标志，可以在任何线程调用；其他方法都要在主线程(渲染线程)调用
+    """
+
+    def __init__(self, interactor, max_fps=60.0, history=240):
+        self.interactor = interactor
+        self.render_window = interactor.GetRenderWindow()
+        self.max_fps = max_fps
+        self.frames = 0
+        self.invalidations = 0
+        self.idle_ticks = 0
+        self._dirty = True
+        self._pending = 0  # 上一帧以来的invalidate次数
+        self._animations = []
+        self._ticks = []
+        self._timer_id = None
+        self._last_frame = 0.0
+        self._last_step = None
+        self._frame_start = None
+        self._frame_times = collections.deque(maxlen=history)
+        self._coalesced = collections.deque(maxlen=history)
+        self._fps = RateCounter()
+
+        self.render_window.AddObserver("StartEvent", self._on_frame_start)
+        self.render_window.AddObserver("EndEvent", self._on_frame_end)
+
+    def start(self):
+        if self._timer_id is None:
+            self.interactor.AddObserver("TimerEvent", self._on_timer)
+            self._timer_id = self.interactor.CreateRepeatingTimer(max(1, int(1000 / self.max_fps)))
+        return self
+
+    def stop(self):
+        if self._timer_id is not None:
+            self.interactor.DestroyTimer(self._timer_id)
+            self._timer_id = None
+
+    def invalidate(self):
+        """标记需要重画，下一次tick时渲染(多次调用只画一帧)"""
+        self._dirty = True
+        self._pending += 1
+        self.invalidations += 1
+
+    def watch(self, *objects):
+        """这些vtk对象(actor、polydata、相机等)Modified时自动invalidate，渲染过程中的Modified不算"""
+        for obj in objects:
+            obj.AddObserver("ModifiedEvent", self._on_modified)
+
+    def _on_modified(self, obj, event):
+        # 渲染过程中vtk自己也会改相机(裁剪范围)等，这些不算新的变化
+        if self._frame_start is None:
+            self.invalidate()
+
+    def add_animation(self, callback):
+        """每一帧开始前调用 callback(dt)，dt是距离上一帧的秒数；返回False时动画结束"""
+        self._animations.append(callback)
+        self.invalidate()
+
+    def add_tick(self, callback):
+        """每次tick(定时器)先调用 callback()，例如从队列取新数据，有变化时自己invalidate"""
+        self._ticks.append(callback)
+
+    def _on_timer(self, obj, event):
+        if obj.GetTimerEventId() == self._timer_id:
+            self.tick()
+
+    def tick(self):
+        """检查是否需要渲染，需要且距离上一帧足够久就渲染一帧；返回是否渲染了"""
+        for callback in self._ticks:
+            callback()
+        if not (self._dirty or self._animations):
+            self.idle_ticks += 1
+            return False
+        if time.perf_counter() - self._last_frame < 0.95 / self.max_fps:
+            return False
+        self.render_window.Render()
+        return True
+
+    def _on_frame_start(self, obj, event):
+        # 不管是tick还是鼠标交互触发的渲染，都在这里清掉标志并推进动画
+        self._frame_start = time.perf_counter()
+        self._dirty = False
+        self._coalesced.append(self._pending)
+        self._pending = 0
+        dt = 0.0 if self._last_step is None else self._frame_start - self._last_step
+        self._last_step = self._frame_start
+        if self._animations:
+            self._animations = [callback for callback in self._animations if callback(dt) is not False]
+            if not self._animations:
+                self._last_step = None
+
+    def _on_frame_end(self, obj, event):
+        now = time.perf_counter()
+        if self._frame_start is not None:
+            self._frame_times.append(now - self._frame_start)
+            self._frame_start = None
+        self._last_frame = now
+        self.frames += 1
+        self._fps.add()
+
+    def stats(self):
+        """帧数、实际帧率、帧时间(平均/95%/最长, 毫秒)、每帧合并了几次invalidate、空闲的tick数"""
+        times = np.array(self._frame_times) * 1000 if self._frame_times else np.zeros(1)
+        return {
+            "frames": self.frames,
+            "fps": self._fps.rate(),
+            "frame_ms_mean": float(times.mean()),
+            "frame_ms_p95": float(np.percentile(times, 95)),
+            "frame_ms_max": float(times.max()),
+            "invalidations_per_frame": float(np.mean(self._coalesced)) if self._coalesced else 0.0,
+            "invalidations": self.invalidations,
+            "idle_ticks": self.idle_ticks,
+        }
@@ -0,0 +1,32 @@
+# 渲染后端：只导入需要的vtkmodules，不导入整个vtk
+# 这几个模块导入时会注册OpenGL2的实现(渲染窗口、体绘制mapper)和交互样式，必须在创建窗口前导入
+import vtkmodules.vtkInteractionStyle  # noqa: F401
+import vtkmodules.vtkRenderingOpenGL2  # noqa: F401
+import vtkmodules.vtkRenderingVolumeOpenGL2  # noqa: F401
+from vtkmodules.vtkRenderingCore import vtkRenderer, vtkRenderWindow, vtkRenderWindowInteractor
+
+
+def create_renderer(background=(0.1, 0.2, 0.3)):
+    renderer = vtkRenderer()
+    renderer.SetBackground(*background)
+    return renderer
+
+
+def create_render_window(renderer, size=(800, 600), title=None, offscreen=False):
+    """创建渲染窗口，offscreen=True时不需要显示器"""
+    render_window = vtkRenderWindow()
+    if offscreen:
+        render_window.SetOffScreenRendering(1)
+    render_window.AddRenderer(renderer)
+    render_window.SetSize(*size)
+    if title:
+        render_window.SetWindowName(title)
+    return render_window
+
+
+def create_interactor(render_window, style=None):
+    interactor = vtkRenderWindowInteractor()
+    interactor.SetRenderWindow(render_window)
+    if style is not None:
+        interactor.SetInteractorStyle(style)
+    return interactor
@@ -0,0 +1,82 @@
+import math
+
+from .instrument import log
+from .volume_cache import series_spacing
+
+# 感兴趣区域(ROI)：只解码和ROI相交的切片，只保存框内的像素
+# 解析结果是 (相交的切片头信息, crop)，crop = (row0, row1, col0, col1) 是切片内的像素范围(左闭右开)
+
+
+def _pixel_range(lo, hi, origin, spacing, size):
+    """[lo, hi](mm) 和像素 [i-0.5, i+0.5]*spacing 有交集的像素范围"""
+    lo, hi = min(lo, hi), max(lo, hi)
+    first = math.ceil((lo - origin) / spacing - 0.5)
+    last = math.floor((hi - origin) / spacing + 0.5)
+    return max(0, first), min(size, last + 1)
+
+
+class VolumeROI:
+    """
+    z: z方向范围 (起始, 结束)，None表示全部切片
+    box: 切片内的框 (x0, y0, x1, y1)，x对应列、y对应行，None表示整张切片
+    unit: "mm" 时是病人坐标(和ImagePositionPatient一致)，包含两端；
+          "index" 时是切片/像素下标，和python切片一样左闭右开
+    """
+
+    def __init__(self, z=None, box=None, unit="mm"):
+        if unit not in ("mm", "index"):
+            raise ValueError(f"未知的ROI单位: {unit}")
+        self.z = z
+        self.box = box
+        self.unit = unit
+
+    def _slice_range(self, headers):
+        if self.z is None:
+            return 0, len(headers)
+        if self.unit == "index":
+            start, stop, _ = slice(*self.z).indices(len(headers))
+            return start, stop
+        if not hasattr(headers[0], "ImagePositionPatient"):
+            raise ValueError("切片没有位置信息，不能按mm选择z范围")
+        # 切片按厚度dz算，和[lo, hi]有交集就要解码
+        half = series_spacing(headers)[2] / 2
+        lo, hi = min(self.z), max(self.z)
+        inside = [k for k, ds in enumerate(headers)
+                  if lo - half <= float(ds.ImagePositionPatient[2]) <= hi + half]
+        if not inside:
+            return 0, 0
+        return inside[0], inside[-1] + 1
+
+    def _crop(self, headers):
+        rows, cols = int(headers[0].Rows), int(headers[0].Columns)
+        if self.box is None:
+            return 0, rows, 0, cols
+        x0, y0, x1, y1 = self.box
+        if self.unit == "index":
+            col0, col1, _ = slice(x0, x1).indices(cols)
+            row0, row1, _ = slice(y0, y1).indices(rows)
+            return row0, row1, col0, col1
+        if not hasattr(headers[0], "ImagePositionPatient"):
+            raise ValueError("切片没有位置信息，不能按mm选择框")
+        dx, dy, _ = series_spacing(headers)
+        ox, oy = float(headers[0].ImagePositionPatient[0]), float(headers[0].ImagePositionPatient[1])
+        col0, col1 = _pixel_range(x0, x1, ox, dx, cols)
+        row0, row1 = _pixel_range(y0, y1, oy, dy, rows)
+        return row0, row1, col0, col1
+
+    def resolve(self, headers):
+        """
+        headers: 排好序的头信息
+        返回 (相交的头信息, crop)，crop覆盖整张切片时为None
+        """
+        start, stop = self._slice_range(headers)
+        row0, row1, col0, col1 = self._crop(headers)
+        if stop <= start or row1 <= row0 or col1 <= col0:
+            raise ValueError("ROI和序列没有交集")
+        crop = (row0, row1, col0, col1)
+        if crop == (0, int(headers[0].Rows), 0, int(headers[0].Columns)):
+            crop = None
+        selected = headers[start:stop]
+        log(f"ROI: 切片 {start}-{stop - 1} ({len(selected)}/{len(headers)}), "
+            f"像素 行{row0}-{row1 - 1} 列{col0}-{col1 - 1}")
+        return selected, crop
@@ -0,0 +1,240 @@
+import os
+import json
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from vtkmodules.vtkRenderingCore import vtkActor, vtkPolyDataMapper
+
+from .instrument import log
+from .mesh_bvh import MeshBVH
+from .mesh_cache import MeshCache
+from .mesh_lod import MeshPyramid
+
+# 场景清单(json)：要加载的模型、颜色、放置规则；SceneLoader在后台线程并行读取所有模型，
+# 主线程(渲染定时器里)调用poll()，读完一个就建actor加进renderer，窗口不用等所有模型都读完
+# 某个模型找不到或读取失败只记录错误，不影响其他模型
+#
+# 清单格式:
+# {
+#   "directory": "STL",                       模型目录，相对清单文件
+#   "models": [
+#     {"name": "floor", "file": "Floor.stl", "color": [0.6, 0.6, 0.6]},
+#     {"name": "car", "file": "BMW_X3.stl", "place": {"on_top_of": "floor"}},
+#     {"name": "cup", "file": "Cup.stl", "opacity": 0.5, "place": {"position": [0, 10, 0]}}
+#   ]
+# }
+# place.on_top_of: 放在另一个模型上面(x/z中心对齐，底面贴着它的顶面，y轴向上)
+# place.position: 直接平移；两个都给时position作为额外的偏移
+
+MODEL_KEYS = {"name", "file", "color", "opacity", "place"}
+PLACE_KEYS = {"on_top_of", "position"}
+
+
+class SceneModel:
+    def __init__(self, name, path, color=None, opacity=1.0, on_top_of=None, position=None):
+        self.name = name
+        self.path = path
+        self.color = color
+        self.opacity = opacity
+        self.on_top_of = on_top_of
+        self.position = position
+
+
+def load_manifest(manifest_path):
+    """读取场景清单，返回SceneModel列表，格式不对时抛ValueError"""
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    directory = os.path.join(os.path.dirname(os.path.abspath(manifest_path)), manifest.get("directory", "."))
+
+    models = []
+    for i, item in enumerate(manifest.get("models", [])):
+        unknown = set(item) - MODEL_KEYS
+        if unknown:
+            raise ValueError(f"场景清单第{i + 1}个模型有未知的字段: {sorted(unknown)}")
+        if "file" not in item:
+            raise ValueError(f"场景清单第{i + 1}个模型没有file")
+        place = item.get("place", {})
+        unknown = set(place) - PLACE_KEYS
+        if unknown:
+            raise ValueError(f"场景清单第{i + 1}个模型的放置规则有未知的字段: {sorted(unknown)}")
+        name = item.get("name") or os.path.splitext(os.path.basename(item["file"]))[0]
+        models.append(SceneModel(name, os.path.join(directory, item["file"]), color=item.get("color"),
+                                 opacity=item.get("opacity", 1.0), on_top_of=place.get("on_top_of"),
+                                 position=place.get("position")))
+
+    names = [model.name for model in models]
+    if len(set(names)) != len(names):
+        raise ValueError("场景清单里有重名的模型")
+    by_name = {model.name: model for model in models}
+    for model in models:
+        if model.on_top_of is not None and model.on_top_of not in by_name:
+            raise ValueError(f"{model.name}: 放置规则引用了不存在的模型 {model.on_top_of}")
+        # 沿着on_top_of往下找，回到走过的模型就是循环依赖
+        seen = {model.name}
+        target = model.on_top_of
+        while target is not None:
+            if target in seen:
+                raise ValueError(f"{model.name}: 放置规则循环依赖")
+            seen.add(target)
+            target = by_name[target].on_top_of
+    return models
+
+
+class SceneLoader:
+    """
+    models: load_manifest的结果
+    renderer: 读完的模型加到这里；poll()必须在主线程(渲染线程)里调用
+    workers: 读取线程数，None表示使用cpu核数
+    cache: MeshCache，默认 ~/.cache/spine_viewer/meshes
+    lod: MeshLOD，给了就在读取线程里同时生成(或读取缓存的)减面级别，actor交给它切换
+    bvh: 在读取线程里同时给每个模型建MeshBVH(碰撞检查用)，放在bvhs里
+    actors: 名字 -> vtkActor(已经放好并加进renderer的)，errors: 名字 -> 错误信息
+    """
+
+    def __init__(self, models, renderer, workers=None, cache=None, lod=None, lod_fractions=(0.5, 0.2, 0.05),
+                 bvh=False):
+        self.models = {model.name: model for model in models}
+        self.renderer = renderer
+        self.workers = workers or os.cpu_count() or 1
+        self.cache = cache or MeshCache()
+        self.lod = lod
+        self.lod_fractions = lod_fractions
+        self.bvh = bvh
+        self.bvhs = {}  # 名字 -> MeshBVH，查询前用 collisions() 或自己 set_transform(actor.GetMatrix())
+        self.actors = {}
+        self.errors = {}
+        self._loaded = {}  # 读完还没放置的 名字 -> actor
+        self._results = queue.Queue()
+        self._pool = None
+
+    def start(self):
+        """在后台线程开始读取所有模型，马上返回"""
+        self._pool = ThreadPoolExecutor(max_workers=min(self.workers, max(1, len(self.models))))
+        for model in self.models.values():
+            future = self._pool.submit(self._load, model.path)
+            future.add_done_callback(lambda f, name=model.name: self._results.put((name, f)))
+        return self
+
+    def _load(self, path):
+        """读取线程里执行: 读网格，需要时生成LOD和BVH"""
+        polydata = self.cache.load(path)
+        pyramid = bvh = None
+        if self.lod is not None and polydata.GetNumberOfPolys():
+            pyramid = MeshPyramid(polydata, self.lod_fractions, key=self.cache.key(path))
+        if self.bvh and polydata.GetNumberOfPolys():
+            bvh = MeshBVH(polydata)
+        return polydata, pyramid, bvh
+
+    @property
+    def done(self):
+        return len(self.actors) + len(self.errors) == len(self.models)
+
+    def poll(self, timeout=None):
+        """
+        处理已经读完的模型: 建actor、按规则放置、加进renderer；返回这一次新加的模型名字
+        timeout: 没有读完的模型时最多等多久(秒)，None不等
+        """
+        finished = []
+        try:
+            if timeout is not None and not self.done:
+                finished.append(self._results.get(timeout=timeout))
+            while True:
+                finished.append(self._results.get_nowait())
+        except queue.Empty:
+            pass
+
+        for name, future in finished:
+            try:
+                polydata, pyramid, bvh = future.result()
+                if not polydata.GetNumberOfPolys():
+                    raise ValueError("没有三角形(文件损坏或不是STL)")
+            except FileNotFoundError:
+                self._fail(name, "找不到文件")
+            except Exception as e:
+                self._fail(name, str(e))
+            else:
+                self._loaded[name] = self._actor(self.models[name], polydata, pyramid)
+                if bvh is not None:
+                    self.bvhs[name] = bvh
+        return self._place()
+
+    def wait(self):
+        """阻塞直到所有模型都处理完(批处理、截图时用)"""
+        while not self.done:
+            self.poll(timeout=0.1)
+        return self
+
+    def collisions(self, starts, ends, radius=0.0):
+        """
+        线段/胶囊体(穿刺针)碰到了哪些已经放好的模型，坐标是世界坐标(模型的当前位置)
+        返回 名字 -> 布尔数组(每条线段一个)，需要bvh=True
+        """
+        result = {}
+        for name, bvh in self.bvhs.items():
+            actor = self.actors.get(name)
+            if actor is None:
+                continue
+            bvh.set_transform(actor.GetMatrix())
+            if radius > 0:
+                result[name] = bvh.capsule_hits(starts, ends, radius)
+            else:
+                result[name] = np.isfinite(bvh.intersect_segments(starts, ends)[0])
+        return result
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _fail(self, name, message):
+        self.errors[name] = message
+        log(f"场景: {name} ({self.models[name].path}) 加载失败: {message}")
+
+    def _actor(self, model, polydata, pyramid=None):
+        mapper = vtkPolyDataMapper()
+        mapper.SetInputData(polydata)
+        actor = vtkActor()
+        actor.SetMapper(mapper)
+        if pyramid is not None:
+            self.lod.add(actor, pyramid)
+        if model.color is not None:
+            actor.GetProperty().SetColor(*model.color)
+        actor.GetProperty().SetOpacity(model.opacity)
+        return actor
+
+    def _place(self):
+        """放置依赖的模型已经放好(或者加载失败)的模型，可能连锁放置好几个"""
+        added = []
+        progress = True
+        while progress:
+            progress = False
+            for name in list(self._loaded):
+                model = self.models[name]
+                target = model.on_top_of
+                if target is not None and target not in self.actors and target not in self.errors:
+                    continue
+                actor = self._loaded.pop(name)
+                position = [0.0, 0.0, 0.0]
+                if target in self.actors:
+                    position = _on_top_of(actor, self.actors[target])
+                elif target is not None:
+                    log(f"场景: {target} 没有加载，{name} 保持原来的位置")
+                if model.position is not None:
+                    position = [p + offset for p, offset in zip(position, model.position)]
+                actor.SetPosition(*position)
+                self.renderer.AddActor(actor)
+                self.actors[name] = actor
+                added.append(name)
+                progress = True
+        return added
+
+
+def _on_top_of(actor, target):
+    """actor(还没平移)放到target上面需要的平移: x/z中心对齐，y方向底面贴着target的顶面"""
+    bounds = actor.GetBounds()
+    center = actor.GetCenter()
+    target_bounds = target.GetBounds()
+    target_center = target.GetCenter()
+    return [target_center[0] - center[0], target_bounds[3] - bounds[2], target_center[2] - center[2]]
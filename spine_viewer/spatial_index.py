@@ -0,0 +1,235 @@
+import numpy as np
+
+from .voxel_grid import pack_cells, voxel_cells
+
+# 点云的空间索引：均匀网格分桶(一层的八叉树)，点按格子键排序后用searchsorted按列取出
+# 索引只保存下标，点坐标直接读外部缓冲区(例如PointCloud的环形缓冲区)
+# 新写入/被覆盖的点先记为"改动"，查询时网格部分排除它们、另外暴力计算；
+# 改动的点多到一定比例才在下一次查询前重建，插入本身不重建
+
+_BRUTE_FORCE_PAIRS = 1 << 22  # 暴力计算时每块最多多少个 (查询, 点) 距离
+_GATHER_COLUMNS = 1 << 20  # 按网格查询时每块最多展开多少列
+
+
+def _expand(starts, ends):
+    """多个 [start, end) 区间展开成下标，同时返回每个下标属于第几个区间"""
+    counts = ends - starts
+    total = int(counts.sum())
+    owner = np.repeat(np.arange(len(starts)), counts)
+    first = np.cumsum(counts) - counts
+    positions = np.arange(total) - np.repeat(first - starts, counts)
+    return positions, owner
+
+
+def _group_min(owner, d2, index, groups):
+    """每组(owner)里d2最小的一项，没有候选的组返回inf/-1；owner必须已经从小到大排好(_gather的输出就是)"""
+    best_d2 = np.full(groups, np.inf)
+    best_index = np.full(groups, -1, dtype=np.int64)
+    if len(owner):
+        first = np.flatnonzero(np.r_[True, owner[1:] != owner[:-1]])
+        group_d2 = np.minimum.reduceat(d2, first)
+        # 每组里等于最小值的第一项
+        hit = np.flatnonzero(d2 == np.repeat(group_d2, np.diff(np.r_[first, len(owner)])))
+        hit = hit[np.r_[True, owner[hit[1:]] != owner[hit[:-1]]]]
+        best_d2[owner[hit]] = d2[hit]
+        best_index[owner[hit]] = index[hit]
+    return best_d2, best_index
+
+
+class PointIndex:
+    """
+    points: 点坐标缓冲区 (capacity, 3)，前count个点有效，索引不复制点
+    cell_size: 网格边长，None时每次重建按点的分布估计(非空格子平均8个点左右)
+    rebuild_fraction / min_rebuild: 改动的点超过 max(min_rebuild, rebuild_fraction * count) 时重建
+    """
+
+    def __init__(self, points, count=None, cell_size=None, rebuild_fraction=0.02, min_rebuild=4096):
+        self.points = points
+        self.count = 0
+        self.cell_size = cell_size
+        self.rebuild_fraction = rebuild_fraction
+        self.min_rebuild = min_rebuild
+        self.rebuilds = 0
+        self._auto_cell = cell_size is None
+        self._dirty = np.zeros(len(points), dtype=bool)
+        self._pending = None
+        self._keys = np.empty(0, dtype=np.int64)
+        self._order = np.empty(0, dtype=np.int64)
+        self._cell_range = None
+        self.update(count=len(points) if count is None else count)
+
+    def update(self, slots=None, count=None):
+        """
+        缓冲区改动后调用
+        slots: 新写入或被覆盖的下标(数组或slice)；count: 新的有效点数，增加的部分自动算作改动
+        """
+        if count is not None and count > self.count:
+            self._dirty[self.count:count] = True
+            self.count = count
+        if slots is not None:
+            self._dirty[slots] = True
+        self._pending = None
+
+    def _pending_slots(self):
+        if self._pending is None:
+            self._pending = np.flatnonzero(self._dirty[:self.count])
+        return self._pending
+
+    def _estimate_cell_size(self, points):
+        extent = float((points.max(axis=0) - points.min(axis=0)).max()) or 1.0
+        cell = extent / max(1.0, len(points) ** (1.0 / 3.0))
+        occupied = len(np.unique(pack_cells(voxel_cells(points, cell))))
+        # 扫描的表面点近似是二维分布，按面积比例调整
+        return cell * np.sqrt(8.0 / (len(points) / occupied))
+
+    def rebuild(self):
+        points = self.points[:self.count]
+        if self._auto_cell and len(points):
+            self.cell_size = self._estimate_cell_size(points)
+        if self.cell_size is None:
+            self.cell_size = 1.0
+        cells = voxel_cells(points, self.cell_size)
+        keys = pack_cells(cells)
+        self._order = np.argsort(keys, kind="stable")
+        self._keys = keys[self._order]
+        self._cell_range = (cells.min(axis=0), cells.max(axis=0)) if len(cells) else None
+        self._dirty[:] = False
+        self._pending = None
+        self.rebuilds += 1
+
+    def _ensure(self):
+        pending = self._pending_slots()
+        if len(pending) > max(self.min_rebuild, self.rebuild_fraction * self.count):
+            self.rebuild()
+
+    def _gather(self, lo_cells, hi_cells):
+        """
+        每个查询取格子范围 [lo, hi] 里的点: 按(x, y)列各做一次searchsorted
+        lo_cells/hi_cells: (Q, 3)，每个查询的列数必须相同
+        返回 (点下标, 所属查询)，已经去掉改动过的点
+        """
+        span = hi_cells[0, :2] - lo_cells[0, :2] + 1
+        dx, dy = np.meshgrid(np.arange(span[0]), np.arange(span[1]), indexing="ij")
+        columns = len(dx.ravel())
+        lo = np.repeat(lo_cells, columns, axis=0)
+        hi = np.repeat(hi_cells, columns, axis=0)
+        lo[:, 0] += np.tile(dx.ravel(), len(lo_cells))
+        lo[:, 1] += np.tile(dy.ravel(), len(lo_cells))
+        hi[:, :2] = lo[:, :2]
+        starts = np.searchsorted(self._keys, pack_cells(lo), side="left")
+        ends = np.searchsorted(self._keys, pack_cells(hi), side="right")
+        positions, owner = _expand(starts, ends)
+        index = self._order[positions]
+        keep = ~self._dirty[index]
+        return index[keep], owner[keep] // columns
+
+    def _columns_too_many(self, columns):
+        # 每个查询要查的列比点还多时不如直接暴力计算
+        return columns > max(64, len(self._keys))
+
+    def _brute_nearest(self, queries, candidates):
+        best_d2 = np.full(len(queries), np.inf)
+        best_index = np.full(len(queries), -1, dtype=np.int64)
+        if not len(candidates):
+            return best_d2, best_index
+        points = self.points[candidates].astype(np.float64)
+        chunk = max(1, _BRUTE_FORCE_PAIRS // len(candidates))
+        for start in range(0, len(queries), chunk):
+            q = queries[start:start + chunk]
+            d2 = ((q[:, None, :] - points[None, :, :]) ** 2).sum(axis=2)
+            nearest = np.argmin(d2, axis=1)
+            best_d2[start:start + chunk] = d2[np.arange(len(q)), nearest]
+            best_index[start:start + chunk] = candidates[nearest]
+        return best_d2, best_index
+
+    def _nearest_block(self, queries, todo, lo, hi, best_d2, best_index, limit):
+        """
+        查询todo在格子范围 [lo, hi] 里的最近点，更新best_d2/best_index
+        返回还不能确定的查询: 找到的最近点比查询点到搜索范围边界还远(范围外可能有更近的点)，
+        而且边界还没超过limit
+        """
+        index, owner = self._gather(lo, hi)
+        q = queries[todo]
+        d2 = ((self.points[index].astype(np.float64) - q[owner]) ** 2).sum(axis=1)
+        d2, index = _group_min(owner, d2, index, len(todo))
+        better = d2 < best_d2[todo]
+        best_d2[todo[better]], best_index[todo[better]] = d2[better], index[better]
+        # 到搜索范围边界的距离；整个网格都在范围里的方向不算边界
+        grid_lo, grid_hi = self._cell_range
+        below = np.where(lo <= grid_lo, np.inf, q - lo * self.cell_size)
+        above = np.where(hi >= grid_hi, np.inf, (hi + 1) * self.cell_size - q)
+        margin = np.minimum(below, above).min(axis=1)
+        return todo[(best_d2[todo] > margin ** 2) & (margin < limit)]
+
+    def nearest(self, queries, max_distance=None):
+        """
+        每个查询点最近的点，返回 (距离, 下标)，没有点时距离是inf、下标是-1
+        max_distance: 只找这个距离以内的点，更远的也返回inf/-1；离群的查询点多时(例如ICP)快很多
+        """
+        queries = np.asarray(queries, dtype=np.float64).reshape(-1, 3)
+        self._ensure()
+        best_d2 = np.full(len(queries), np.inf)
+        best_index = np.full(len(queries), -1, dtype=np.int64)
+
+        if len(self._keys):
+            cells = voxel_cells(queries, self.cell_size)
+            # 先查离查询点最近的2x2x2个格子(至少覆盖周围半个格子)，大多数查询在这一步就能确定
+            near = voxel_cells(queries - 0.5 * self.cell_size, self.cell_size)
+            limit = np.inf if max_distance is None else max_distance
+            todo = self._nearest_block(queries, np.arange(len(queries)), near, near + 1, best_d2, best_index, limit)
+            ring = 1
+            # 剩下的从周围一圈格子开始，找不到就扩大一倍
+            while len(todo):
+                columns = (2 * ring + 1) ** 2
+                if self._columns_too_many(columns):
+                    valid = np.flatnonzero(~self._dirty[:self.count])
+                    d2, index = self._brute_nearest(queries[todo], valid)
+                    better = d2 < best_d2[todo]
+                    best_d2[todo[better]], best_index[todo[better]] = d2[better], index[better]
+                    break
+                # 范围大时分块，控制一次展开的列数
+                chunk = max(1, _GATHER_COLUMNS // columns)
+                todo = np.concatenate([
+                    self._nearest_block(queries, part, cells[part] - ring, cells[part] + ring, best_d2, best_index, limit)
+                    for part in (todo[start:start + chunk] for start in range(0, len(todo), chunk))
+                ])
+                ring *= 2
+
+        pending = self._pending_slots()
+        if len(pending):
+            d2, index = self._brute_nearest(queries, pending)
+            better = d2 < best_d2
+            best_d2[better], best_index[better] = d2[better], index[better]
+        if max_distance is not None:
+            far = best_d2 > max_distance ** 2
+            best_d2[far], best_index[far] = np.inf, -1
+        return np.sqrt(best_d2), best_index
+
+    def _query_block(self, lo, hi):
+        """坐标范围 [lo, hi] 所在格子里的候选点(网格部分) + 所有改动过的点"""
+        if not len(self._keys):
+            return self._pending_slots()
+        lo = voxel_cells(lo[None], self.cell_size)[0]
+        hi = voxel_cells(hi[None], self.cell_size)[0]
+        if self._columns_too_many(int(np.prod(hi[:2] - lo[:2] + 1))):
+            candidates = np.flatnonzero(~self._dirty[:self.count])
+        else:
+            candidates, _ = self._gather(lo[None], hi[None])
+        return np.concatenate([candidates, self._pending_slots()])
+
+    def radius(self, point, r):
+        """到point距离不超过r的点的下标(从小到大)"""
+        point = np.asarray(point, dtype=np.float64).reshape(3)
+        self._ensure()
+        candidates = self._query_block(point - r, point + r)
+        d2 = ((self.points[candidates].astype(np.float64) - point) ** 2).sum(axis=1)
+        return np.sort(candidates[d2 <= r * r])
+
+    def box(self, bounds):
+        """在包围盒 (xmin, xmax, ymin, ymax, zmin, zmax) 里的点的下标(从小到大)，和VTK的GetBounds顺序一样"""
+        bounds = np.asarray(bounds, dtype=np.float64).reshape(3, 2)
+        self._ensure()
+        candidates = self._query_block(bounds[:, 0], bounds[:, 1])
+        points = self.points[candidates]
+        inside = np.all((points >= bounds[:, 0]) & (points <= bounds[:, 1]), axis=1)
+        return np.sort(candidates[inside])
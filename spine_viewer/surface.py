@@ -0,0 +1,149 @@
+import os
+import time
+import hashlib
+
+from vtkmodules.vtkCommonCore import vtkSMPTools
+from vtkmodules.vtkFiltersCore import (vtkFlyingEdges3D, vtkPolyDataNormals, vtkQuadricDecimation,
+                                       vtkSmoothPolyDataFilter, vtkWindowedSincPolyDataFilter)
+
+from .instrument import log, timed
+from .mesh_io import export_stl, load_polydata, save_polydata
+
+# 从HU体数据提取骨骼表面：flying edges(多线程) -> 光滑 -> 可选减面 -> 最后算一次法向
+# 结果按 序列指纹 + 阈值 + 光滑/减面参数 缓存成二进制网格，同样的参数再次打开直接mmap读取
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "spine_viewer", "surfaces")
+SURFACE_VERSION = 1
+
+
+def use_smp_threads(threads=None):
+    """vtk的SMP默认是单线程(Sequential)，切到STDThread；threads为None时用全部核"""
+    if vtkSMPTools.GetBackend() == "Sequential":
+        vtkSMPTools.SetBackend("STDThread")
+    vtkSMPTools.Initialize(threads or 0)
+
+
+class BoneSurfaceExtractor:
+    """
+    iso_value: 阈值(HU)，低于它的不会显示
+    smoothing: "laplacian"(vtkSmoothPolyDataFilter) / "sinc"(vtkWindowedSincPolyDataFilter) / None
+    decimate: 减面比例，0不减面，0.5表示去掉一半三角形
+    threads: flying edges等滤波器的线程数，None用全部核
+    """
+
+    def __init__(self, iso_value=200, smoothing="laplacian", iterations=20, relaxation=0.1,
+                 pass_band=0.1, decimate=0.0, threads=None, cache_dir=None):
+        if smoothing not in ("laplacian", "sinc", None):
+            raise ValueError(f"未知的光滑方式: {smoothing}")
+        self.iso_value = iso_value
+        self.smoothing = smoothing
+        self.iterations = iterations
+        self.relaxation = relaxation
+        self.pass_band = pass_band
+        self.decimate = decimate
+        self.threads = threads
+        self.cache_dir = cache_dir or CACHE_DIR
+        self.polydata = None
+
+    def params(self):
+        """影响结果的参数，缓存键的一部分"""
+        params = {"iso": float(self.iso_value), "smoothing": self.smoothing, "decimate": float(self.decimate)}
+        if self.smoothing == "laplacian":
+            params.update(iterations=self.iterations, relaxation=float(self.relaxation))
+        elif self.smoothing == "sinc":
+            params.update(iterations=self.iterations, pass_band=float(self.pass_band))
+        return params
+
+    def key(self, series_key):
+        text = f"v{SURFACE_VERSION}:{series_key}:{sorted(self.params().items())}"
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def path(self, series_key):
+        return os.path.join(self.cache_dir, self.key(series_key) + ".mesh")
+
+    @timed("bone_surface")
+    def extract(self, vtk_image, series_key=None):
+        """
+        提取表面得到vtkPolyData
+        series_key: 序列指纹(VolumeCache.key)，给了就读写磁盘缓存
+        """
+        path = self.path(series_key) if series_key else None
+        if path:
+            start = time.perf_counter()
+            polydata = load_polydata(path)
+            if polydata is not None:
+                log(f"表面: 缓存命中 {polydata.GetNumberOfPolys()} 个三角形, "
+                    f"{time.perf_counter() - start:.3f}s")
+                self.polydata = polydata
+                return polydata
+
+        polydata = self.build(vtk_image)
+        if path:
+            save_polydata(path, polydata)
+        self.polydata = polydata
+        return polydata
+
+    def build(self, vtk_image):
+        """不查缓存，直接从体数据提取"""
+        use_smp_threads(self.threads)
+        timings = []
+
+        start = time.perf_counter()
+        iso = vtkFlyingEdges3D()
+        iso.SetInputData(vtk_image)
+        iso.SetValue(0, self.iso_value)
+        # 法向等光滑/减面之后再算，这里算了也会作废
+        iso.ComputeNormalsOff()
+        iso.ComputeGradientsOff()
+        iso.ComputeScalarsOff()
+        iso.Update()
+        polydata = iso.GetOutput()
+        timings.append(("flying edges", time.perf_counter() - start))
+
+        if self.smoothing is not None and polydata.GetNumberOfPoints():
+            start = time.perf_counter()
+            if self.smoothing == "laplacian":
+                smooth = vtkSmoothPolyDataFilter()
+                smooth.SetRelaxationFactor(self.relaxation)
+            else:
+                smooth = vtkWindowedSincPolyDataFilter()
+                smooth.SetPassBand(self.pass_band)
+                smooth.NormalizeCoordinatesOn()
+            smooth.SetNumberOfIterations(self.iterations)
+            smooth.SetInputData(polydata)
+            smooth.Update()
+            polydata = smooth.GetOutput()
+            timings.append(("光滑", time.perf_counter() - start))
+
+        if self.decimate > 0 and polydata.GetNumberOfPolys():
+            start = time.perf_counter()
+            decimate = vtkQuadricDecimation()
+            decimate.SetInputData(polydata)
+            decimate.SetTargetReduction(self.decimate)
+            decimate.Update()
+            polydata = decimate.GetOutput()
+            timings.append(("减面", time.perf_counter() - start))
+
+        start = time.perf_counter()
+        normals = vtkPolyDataNormals()
+        normals.SetInputData(polydata)
+        # 不分裂尖锐边，点数不变，缓存里法向和点一一对应
+        normals.SplittingOff()
+        normals.ConsistencyOff()
+        normals.ComputePointNormalsOn()
+        normals.ComputeCellNormalsOff()
+        normals.Update()
+        polydata = normals.GetOutput()
+        timings.append(("法向", time.perf_counter() - start))
+
+        log(f"表面: {polydata.GetNumberOfPolys()} 个三角形, "
+            + ", ".join(f"{name} {seconds:.3f}s" for name, seconds in timings))
+        return polydata
+
+    def export_stl(self, path, polydata=None):
+        """把(缓存的)表面导出成STL，给LoadSTL的场景用"""
+        if polydata is None:
+            polydata = self.polydata
+        if polydata is None:
+            raise ValueError("还没有提取表面")
+        return export_stl(polydata, path)
@@ -0,0 +1,161 @@
+import os
+import json
+import numpy as np
+
+from vtkmodules.vtkCommonDataModel import vtkPiecewiseFunction
+from vtkmodules.vtkRenderingCore import vtkColorTransferFunction, vtkVolumeProperty
+
+# 传输函数预设：从json文件读取(骨骼、软组织、自定义)，每个预设的vtkVolumeProperty只建一次
+# 切换预设只是换vtkVolume的property；重复选同一个预设什么都不做，mapper不会重建查找表
+
+PRESET_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tf_presets.json")
+# 自定义预设，格式和tf_presets.json一样，同名的会覆盖默认预设
+USER_PRESET_FILE = os.path.join(os.path.expanduser("~"), ".config", "spine_viewer", "tf_presets.json")
+
+
+def _fill_functions(color_func, opacity_func, spec):
+    color_func.RemoveAllPoints()
+    for x, r, g, b in spec["color"]:
+        color_func.AddRGBPoint(x, r, g, b)
+    opacity_func.RemoveAllPoints()
+    for x, a in spec["opacity"]:
+        opacity_func.AddPoint(x, a)
+
+
+def _fill_property(volume_property, spec):
+    volume_property.SetShade(1 if spec.get("shade", True) else 0)
+    volume_property.SetInterpolationTypeToLinear()
+    volume_property.SetAmbient(spec.get("ambient", 0.4))
+    volume_property.SetDiffuse(spec.get("diffuse", 0.6))
+    volume_property.SetSpecular(spec.get("specular", 0.2))
+
+
+def _blend_points(points_a, points_b, t):
+    """两组分段线性的点按t插值，x取两组点的并集"""
+    a = np.asarray(points_a, dtype=float)
+    b = np.asarray(points_b, dtype=float)
+    xs = np.union1d(a[:, 0], b[:, 0])
+    columns = [xs]
+    for k in range(1, a.shape[1]):
+        va = np.interp(xs, a[:, 0], a[:, k])
+        vb = np.interp(xs, b[:, 0], b[:, k])
+        columns.append((1 - t) * va + t * vb)
+    return np.stack(columns, axis=1).tolist()
+
+
+class TransferFunctionPresets:
+    """传输函数预设表"""
+
+    def __init__(self, path=PRESET_FILE, user_path=USER_PRESET_FILE):
+        self._specs = {}
+        self._properties = {}
+        self.load(path)
+        if user_path and os.path.exists(user_path):
+            self.load(user_path)
+
+        # 插值过渡用的property，反复使用同一个对象
+        self._blend_color = vtkColorTransferFunction()
+        self._blend_opacity = vtkPiecewiseFunction()
+        self._blend_property = vtkVolumeProperty()
+        self._blend_property.SetColor(self._blend_color)
+        self._blend_property.SetScalarOpacity(self._blend_opacity)
+        self._transition_timer = None
+        self._transition_observer = None
+        self._transition_interactor = None
+
+    def load(self, path):
+        with open(path, "r", encoding="utf-8") as f:
+            for name, spec in json.load(f).items():
+                self.register(name, spec)
+
+    def register(self, name, spec):
+        """添加或替换一个预设，spec格式同tf_presets.json"""
+        self._specs[name] = spec
+        self._properties.pop(name, None)
+
+    def names(self):
+        return list(self._specs)
+
+    def label(self, name):
+        return self._specs[name].get("label", name)
+
+    def property(self, name):
+        """预设对应的vtkVolumeProperty，第一次用到时创建，之后一直复用"""
+        if name not in self._properties:
+            spec = self._specs[name]
+            color_func = vtkColorTransferFunction()
+            opacity_func = vtkPiecewiseFunction()
+            _fill_functions(color_func, opacity_func, spec)
+            volume_property = vtkVolumeProperty()
+            volume_property.SetColor(color_func)
+            volume_property.SetScalarOpacity(opacity_func)
+            _fill_property(volume_property, spec)
+            self._properties[name] = volume_property
+        return self._properties[name]
+
+    def name_of(self, volume_property):
+        for name, prop in self._properties.items():
+            if prop is volume_property:
+                return name
+        return None
+
+    def apply(self, volume, name):
+        """切换到预设，已经是这个预设时不做任何修改，返回是否有切换；正在过渡时先停掉过渡"""
+        self._stop_transition()
+        volume_property = self.property(name)
+        if volume.GetProperty() is volume_property:
+            return False
+        volume.SetProperty(volume_property)
+        return True
+
+    def blend(self, name_a, name_b, t):
+        """返回两个预设按t(0~1)插值后的property(同一个对象会被下次blend覆盖)"""
+        spec_a, spec_b = self._specs[name_a], self._specs[name_b]
+        spec = {
+            "color": _blend_points(spec_a["color"], spec_b["color"], t),
+            "opacity": _blend_points(spec_a["opacity"], spec_b["opacity"], t),
+            "shade": spec_b.get("shade", True) if t >= 0.5 else spec_a.get("shade", True),
+        }
+        for key, default in (("ambient", 0.4), ("diffuse", 0.6), ("specular", 0.2)):
+            spec[key] = (1 - t) * spec_a.get(key, default) + t * spec_b.get(key, default)
+        _fill_functions(self._blend_color, self._blend_opacity, spec)
+        _fill_property(self._blend_property, spec)
+        return self._blend_property
+
+    def transition(self, volume, name, interactor, duration=0.3, steps=8):
+        """用interactor定时器从当前预设平滑过渡到name，最后换成预建好的property"""
+        # 上一次过渡还没结束时先停掉，否则它的定时器会把结果覆盖回去
+        self._stop_transition()
+        current = self.name_of(volume.GetProperty())
+        if current is None or current == name or steps < 2:
+            self.apply(volume, name)
+            interactor.GetRenderWindow().Render()
+            return
+
+        state = {"step": 0}
+
+        def timer_callback(obj, event):
+            if obj.GetTimerEventId() != self._transition_timer:
+                return
+            state["step"] += 1
+            if state["step"] >= steps:
+                self.apply(volume, name)
+            else:
+                volume.SetProperty(self.blend(current, name, state["step"] / steps))
+            obj.GetRenderWindow().Render()
+
+        self._transition_observer = interactor.AddObserver("TimerEvent", timer_callback)
+        self._transition_timer = interactor.CreateRepeatingTimer(max(1, int(duration * 1000 / steps)))
+        self._transition_interactor = interactor
+
+    def _stop_transition(self):
+        interactor = self._transition_interactor
+        if interactor is None:
+            return
+        if self._transition_timer is not None:
+            interactor.DestroyTimer(self._transition_timer)
+            self._transition_timer = None
+        if self._transition_observer is not None:
+            interactor.RemoveObserver(self._transition_observer)
+            self._transition_observer = None
+        self._transition_interactor = None
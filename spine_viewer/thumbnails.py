@@ -0,0 +1,335 @@
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from vtkmodules.vtkIOImage import vtkPNGWriter
+from vtkmodules.vtkRenderingCore import vtkActor, vtkPolyDataMapper, vtkWindowToImageFilter
+
+from . import instrument
+from .dicom_loader import list_files
+from .instrument import log
+from .mpr import CAMERAS
+from .pipeline import DicomVolumePipeline
+from .rendering import create_renderer, create_render_window
+from .surface import BoneSurfaceExtractor
+from .volume_cache import VolumeCache
+from .volume_pyramid import VolumePyramid, vtk_image_to_numpy
+
+# 无界面批量生成缩略图(病例选择列表用)：数据目录下每个含有文件的目录算一个检查(里面切片最多的序列)，
+# 离屏渲染 正位(ap)、侧位(lateral) 的体绘制 和 骨骼表面(bone) 的三维视图，存成PNG
+# 检查分给进程池(spawn，每个进程自己的离屏窗口，处理一定数量的检查后换新进程，长时间跑内存不会涨)
+# 每个检查按 文件路径/大小/修改时间 + 渲染参数 算指纹，和输出目录里的 thumbnails.json 一致时跳过
+#
+#   python -m spine_viewer.thumbnails 数据目录 输出目录 [--views ap,lateral,bone] [--size 256] [--workers N]
+
+THUMBNAIL_VERSION = 1
+MANIFEST_NAME = "thumbnails.json"
+# 视图 -> (相机看的方向, 相机向上)；正位从前往后看，侧位从左往右看，骨骼表面从左前上方看
+VIEWS = {
+    "ap": CAMERAS["coronal"],
+    "lateral": CAMERAS["sagittal"],
+    "bone": ((-0.5, 0.8, -0.35), (0.0, 0.0, 1.0)),
+}
+BONE_COLOR = (0.95, 0.9, 0.8)
+
+# 每个工作进程里的离屏窗口，第一次用到时创建，之后的检查都复用
+_worker = {}
+
+
+def find_studies(root):
+    """root下所有直接含有(非隐藏)文件的目录，按路径排序"""
+    studies = []
+    for directory, dirs, files in os.walk(root):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        if any(not name.startswith(".") for name in files):
+            studies.append(directory)
+    return sorted(studies)
+
+
+def study_fingerprint(study_dir, options):
+    """根据每个文件的路径、大小、修改时间和渲染参数计算检查的指纹，不读文件内容"""
+    sha = hashlib.sha1(f"v{THUMBNAIL_VERSION}:{json.dumps(options, sort_keys=True)}\n".encode("utf-8"))
+    for file_path in list_files(study_dir):
+        if os.path.basename(file_path).startswith("."):
+            continue
+        st = os.stat(file_path)
+        sha.update(f"{os.path.relpath(file_path, study_dir)}|{st.st_size}|{st.st_mtime_ns}\n".encode("utf-8"))
+    return sha.hexdigest()
+
+
+def study_name(root, study_dir):
+    """输出文件名前缀: 相对路径，目录分隔符换成 __"""
+    name = os.path.relpath(study_dir, root)
+    return "root" if name == "." else name.replace(os.sep, "__")
+
+
+def _init_worker(verbose):
+    instrument.quiet = not verbose
+
+
+def _render_window(size):
+    if _worker.get("size") != size:
+        renderer = create_renderer(background=(0, 0, 0))
+        _worker.update(size=size, renderer=renderer,
+                       window=create_render_window(renderer, (size, size), offscreen=True))
+    return _worker["renderer"], _worker["window"]
+
+
+def bone_bounds(vtk_image, iso_value):
+    """HU >= iso_value 的体素的世界坐标范围 (xmin, xmax, ymin, ymax, zmin, zmax)，没有骨头时返回整个体数据的范围"""
+    volume = vtk_image_to_numpy(vtk_image)
+    inside = volume >= iso_value
+    if not inside.any():
+        return vtk_image.GetBounds()
+    origin, spacing = vtk_image.GetOrigin(), vtk_image.GetSpacing()
+    bounds = []
+    # volume是 (z, y, x)，对每个坐标轴把另外两个轴合并掉
+    for axis, other in ((0, (0, 1)), (1, (0, 2)), (2, (1, 2))):
+        index = np.flatnonzero(inside.any(axis=other))
+        bounds += [origin[axis] + index[0] * spacing[axis], origin[axis] + index[-1] * spacing[axis]]
+    return bounds
+
+
+def _snapshot(renderer, window, direction, view_up, path, bounds=None):
+    """相机按 (方向, 向上) 对准场景(或bounds)，渲染一帧存成PNG(先写临时文件再替换)"""
+    camera = renderer.GetActiveCamera()
+    camera.SetFocalPoint(0.0, 0.0, 0.0)
+    camera.SetPosition(*(-np.asarray(direction, dtype=np.float64)))
+    camera.SetViewUp(*view_up)
+    if bounds is None:
+        renderer.ResetCamera()
+    else:
+        renderer.ResetCamera(bounds)
+    window.Render()
+
+    grab = vtkWindowToImageFilter()
+    grab.SetInput(window)
+    grab.ReadFrontBufferOff()
+    grab.Update()
+    writer = vtkPNGWriter()
+    writer.SetFileName(path + ".tmp.png")
+    writer.SetInputConnection(grab.GetOutputPort())
+    writer.Write()
+    os.replace(path + ".tmp.png", path)
+
+
+def render_study(study_dir, out_dir, name, options):
+    """
+    在工作进程里渲染一个检查的所有视图，返回结果dict(images: 视图 -> 文件名，seconds，出错时error，没有DICOM时empty)
+    options: views, size, preset, downsample, iso_value, keep_caches, threads
+    """
+    start = time.perf_counter()
+    result = {"images": {}}
+    # 不保留缓存时体数据/表面缓存写到临时目录，渲染完删掉，几百个检查不会占满磁盘
+    work_dir = None if options["keep_caches"] else tempfile.mkdtemp(prefix="spine_thumbnail_")
+    try:
+        cache = VolumeCache(cache_dir=work_dir) if work_dir else None
+        pipeline = DicomVolumePipeline(workers=options["threads"], use_index=False, cache=cache)
+        vtk_image = pipeline.load_volume_image(study_dir)
+        if vtk_image is None:
+            result["empty"] = True
+            return result
+        result["dimensions"] = list(vtk_image.GetDimensions())
+
+        # 缩略图用不到全分辨率，降采样(按块取最大值，骨头不会变淡)后渲染和提取表面都快得多
+        factor = options["downsample"]
+        series_key = pipeline.series_key
+        if factor > 1:
+            pyramid = VolumePyramid(vtk_image, factors=(factor,), key=pipeline.series_key,
+                                    cache_dir=pipeline.volume_cache.cache_dir)
+            vtk_image = pyramid.images[pyramid.factors[-1]]
+            # 降采样体数据提取的表面和全分辨率的分开缓存
+            series_key = f"{series_key}.max{pyramid.factors[-1]}"
+
+        renderer, window = _render_window(options["size"])
+        renderer.RemoveAllViewProps()
+        volume_views = [view for view in options["views"] if view != "bone"]
+        if volume_views:
+            renderer.AddVolume(pipeline.setup_volume_rendering(vtk_image, preset=options["preset"]))
+            # 体绘制里空气和软组织是透明的，相机对准骨头的范围，不然脊柱在图里只占一小块
+            bounds = bone_bounds(vtk_image, options["iso_value"])
+            for view in volume_views:
+                file_name = f"{name}_{view}.png"
+                _snapshot(renderer, window, *VIEWS[view], os.path.join(out_dir, file_name), bounds)
+                result["images"][view] = file_name
+            renderer.RemoveAllViewProps()
+
+        if "bone" in options["views"]:
+            extractor = BoneSurfaceExtractor(iso_value=options["iso_value"], threads=options["threads"],
+                                             cache_dir=work_dir)
+            mapper = vtkPolyDataMapper()
+            mapper.SetInputData(extractor.extract(vtk_image, series_key))
+            actor = vtkActor()
+            actor.SetMapper(mapper)
+            actor.GetProperty().SetColor(*BONE_COLOR)
+            renderer.AddActor(actor)
+            file_name = f"{name}_bone.png"
+            _snapshot(renderer, window, *VIEWS["bone"], os.path.join(out_dir, file_name))
+            result["images"]["bone"] = file_name
+            renderer.RemoveAllViewProps()
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        if work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        result["seconds"] = time.perf_counter() - start
+    return result
+
+
+class ThumbnailBatch:
+    """
+    root: 数据目录，out_dir: 缩略图输出目录(里面的thumbnails.json记录每个检查的指纹和结果)
+    views: 要渲染的视图(VIEWS的名字)，size: 图片边长(像素)，preset: 体绘制的传输函数预设
+    downsample: 渲染前体数据降采样倍数，iso_value: 骨骼表面阈值(HU)
+    workers: 进程数，None时用cpu核数；每个进程解码用 cpu核数/进程数 个线程
+    keep_caches: 保留体数据和表面缓存(~/.cache/spine_viewer)，之后交互打开这些检查更快，但很占磁盘
+    tasks_per_worker: 每个进程处理多少个检查后换新进程
+    """
+
+    def __init__(self, root, out_dir, views=("ap", "lateral", "bone"), size=256, preset="bone", downsample=2,
+                 iso_value=200, workers=None, keep_caches=False, tasks_per_worker=20, verbose=False):
+        unknown = [view for view in views if view not in VIEWS]
+        if unknown:
+            raise ValueError(f"未知的视图: {unknown}，可选 {sorted(VIEWS)}")
+        self.root = os.path.abspath(root)
+        self.out_dir = os.path.abspath(out_dir)
+        self.workers = workers or os.cpu_count() or 1
+        self.tasks_per_worker = tasks_per_worker
+        self.verbose = verbose
+        self.options = {
+            "views": list(views), "size": int(size), "preset": preset, "downsample": int(downsample),
+            "iso_value": float(iso_value), "keep_caches": bool(keep_caches),
+            "threads": max(1, (os.cpu_count() or 1) // self.workers),
+        }
+        self.manifest_path = os.path.join(self.out_dir, MANIFEST_NAME)
+        self.manifest = self._load_manifest()
+        self.stats = {}
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if data.get("version") != THUMBNAIL_VERSION:
+            return {}
+        return data.get("studies", {})
+
+    def _save_manifest(self):
+        # 每完成一个检查就写一次，半夜中断也不会丢掉已经完成的
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": THUMBNAIL_VERSION, "root": self.root, "studies": self.manifest}, f,
+                      indent=1, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _fingerprint_options(self):
+        # 只有影响图片的参数进指纹
+        return {key: value for key, value in self.options.items() if key not in ("keep_caches", "threads")}
+
+    def _up_to_date(self, name, fingerprint):
+        entry = self.manifest.get(name)
+        if entry is None or entry.get("fingerprint") != fingerprint:
+            return False
+        return all(os.path.exists(os.path.join(self.out_dir, file_name))
+                   for file_name in entry.get("images", {}).values())
+
+    def pending(self, force=False):
+        """需要(重新)渲染的检查 [(目录, 名字, 指纹)]，以及跳过的数量"""
+        todo, skipped = [], 0
+        for study_dir in find_studies(self.root):
+            if os.path.commonpath([study_dir, self.out_dir]) == self.out_dir:
+                continue
+            name = study_name(self.root, study_dir)
+            fingerprint = study_fingerprint(study_dir, self._fingerprint_options())
+            if not force and self._up_to_date(name, fingerprint):
+                skipped += 1
+            else:
+                todo.append((study_dir, name, fingerprint))
+        return todo, skipped
+
+    def run(self, force=False, limit=None):
+        """渲染所有需要渲染的检查，返回统计(检查数、失败数、每分钟检查数等)"""
+        os.makedirs(self.out_dir, exist_ok=True)
+        start = time.perf_counter()
+        todo, skipped = self.pending(force)
+        if limit is not None:
+            todo = todo[:limit]
+        log(f"{len(todo)} 个检查需要渲染, {skipped} 个已是最新 (指纹 {time.perf_counter() - start:.2f}s), "
+            f"{self.workers} 个进程")
+
+        done = failed = 0
+        start = time.perf_counter()
+        # spawn: 工作进程不继承主进程的vtk/OpenGL和线程状态
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(self.verbose,), max_tasks_per_child=self.tasks_per_worker) as pool:
+            futures = {pool.submit(render_study, study_dir, self.out_dir, name, self.options): (name, fingerprint)
+                       for study_dir, name, fingerprint in todo}
+            for future in as_completed(futures):
+                name, fingerprint = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:  # 工作进程崩溃(例如内存不够)
+                    result = {"images": {}, "error": f"{type(e).__name__}: {e}", "seconds": 0.0}
+                done += 1
+                if "error" in result:
+                    failed += 1
+                    status = f"失败: {result['error']}"
+                else:
+                    # 没有DICOM的目录也记下指纹，下次直接跳过
+                    result["fingerprint"] = fingerprint
+                    status = "没有DICOM图像" if result.get("empty") else f"{result['seconds']:.1f}s"
+                self.manifest[name] = result
+                self._save_manifest()
+                rate = done / (time.perf_counter() - start) * 60
+                print(f"[{done}/{len(todo)}] {name} {status} | {rate:.1f} 检查/分钟, "
+                      f"预计还要 {(len(todo) - done) / rate:.1f} 分钟")
+
+        elapsed = time.perf_counter() - start
+        self.stats = {
+            "studies": done, "failed": failed, "skipped": skipped, "seconds": elapsed,
+            "studies_per_minute": done / elapsed * 60 if elapsed > 0 else 0.0, "workers": self.workers,
+        }
+        return self.stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批量离屏渲染检查的缩略图")
+    parser.add_argument("root", help="数据目录，每个含有DICOM文件的目录算一个检查")
+    parser.add_argument("out_dir", help="缩略图输出目录")
+    parser.add_argument("--views", default="ap,lateral,bone", help=f"逗号分隔，可选 {','.join(VIEWS)}")
+    parser.add_argument("--size", type=int, default=256, help="图片边长(像素)")
+    parser.add_argument("--preset", default="bone", help="体绘制的传输函数预设")
+    parser.add_argument("--downsample", type=int, default=2, help="渲染前体数据降采样倍数，1不降采样")
+    parser.add_argument("--iso", type=float, default=200, help="骨骼表面阈值(HU)")
+    parser.add_argument("--workers", type=int, default=None, help="进程数，默认cpu核数")
+    parser.add_argument("--keep-caches", action="store_true", help="保留体数据和表面缓存")
+    parser.add_argument("--force", action="store_true", help="不按指纹跳过，全部重新渲染")
+    parser.add_argument("--limit", type=int, default=None, help="最多渲染多少个检查")
+    parser.add_argument("--verbose", action="store_true", help="打印工作进程里各阶段的提示信息")
+    args = parser.parse_args(argv)
+
+    try:
+        batch = ThumbnailBatch(args.root, args.out_dir, views=[v for v in args.views.split(",") if v],
+                               size=args.size, preset=args.preset, downsample=args.downsample, iso_value=args.iso,
+                               workers=args.workers, keep_caches=args.keep_caches, verbose=args.verbose)
+    except ValueError as e:
+        parser.error(str(e))
+    stats = batch.run(force=args.force, limit=args.limit)
+    print(f"完成 {stats['studies']} 个检查 (失败 {stats['failed']}, 跳过 {stats['skipped']}), "
+          f"{stats['seconds']:.1f}s, {stats['studies_per_minute']:.1f} 检查/分钟, {stats['workers']} 个进程")
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
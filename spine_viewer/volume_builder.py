@@ -0,0 +1,134 @@
+import time
+import numpy as np
+
+from .instrument import log
+
+# 体数据组装：每个切片直接写进预先分配好的 (slices, rows, cols) 连续缓冲区(VTK内存顺序)
+# rescale原地计算，所有切片共用同一组slope/intercept时最后整体计算一次
+
+
+def rescale_params(ds):
+    slope = float(getattr(ds, "RescaleSlope", 1) or 1)
+    intercept = float(getattr(ds, "RescaleIntercept", 0) or 0)
+    return slope, intercept
+
+
+def raw_value_range(ds):
+    """根据BitsStored和PixelRepresentation得到原始像素值范围"""
+    bits = int(getattr(ds, "BitsStored", 0) or getattr(ds, "BitsAllocated", 16))
+    if int(getattr(ds, "PixelRepresentation", 0)) == 1:
+        return -(1 << (bits - 1)), (1 << (bits - 1)) - 1
+    return 0, (1 << bits) - 1
+
+
+def choose_dtype(dicom_series):
+    """选择不会溢出的输出类型: 原始值和HU值都能放下的最小整数类型，slope/intercept不是整数时用float32"""
+    lo, hi = 0, 0
+    integral = True
+    for key in {(rescale_params(ds), raw_value_range(ds)) for ds in dicom_series}:
+        (slope, intercept), (raw_lo, raw_hi) = key
+        # 原地计算时先乘slope再加intercept，中间结果也要放得下
+        values = (raw_lo, raw_hi, raw_lo * slope, raw_hi * slope,
+                  raw_lo * slope + intercept, raw_hi * slope + intercept)
+        lo, hi = min(lo, *values), max(hi, *values)
+        integral = integral and slope.is_integer() and intercept.is_integer()
+    if not integral:
+        return np.dtype(np.float32)
+    for dtype in (np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= lo and hi <= info.max:
+            return np.dtype(dtype)
+    return np.dtype(np.float64)
+
+
+def crop_slices(dicom_series, crop=None):
+    """crop (row0, row1, col0, col1) -> 切片内的 (行slice, 列slice)，None表示整张切片"""
+    if crop is None:
+        crop = (0, int(dicom_series[0].Rows), 0, int(dicom_series[0].Columns))
+    row0, row1, col0, col1 = map(int, crop)
+    return slice(row0, row1), slice(col0, col1)
+
+
+def fill_missing(volume, missing):
+    """缺失的切片填成其他切片的最小值(一般是空气)，不会被当成组织显示"""
+    present = np.ones(len(volume), dtype=bool)
+    present[missing] = False
+    volume[missing] = min(volume[k].min() for k in np.flatnonzero(present))
+
+
+class VolumeBuilder:
+    """
+    按顺序把切片写进体数据缓冲区
+    dicom_series: 排好序的头信息(Dataset或SliceRecord)，用来确定尺寸、类型和rescale参数
+    out: 可以传入外部缓冲区(例如mmap文件)，否则用np.empty分配
+    crop: (row0, row1, col0, col1)，只保存切片内这个范围的像素(roi.VolumeROI)
+    """
+
+    def __init__(self, dicom_series, dtype=None, out=None, crop=None):
+        self.crop = crop_slices(dicom_series, crop)
+        rows, cols = (s.stop - s.start for s in self.crop)
+        self.shape = (len(dicom_series), rows, cols)
+        self.dtype = np.dtype(dtype) if dtype is not None else choose_dtype(dicom_series)
+        if out is None:
+            out = np.empty(self.shape, dtype=self.dtype)
+        elif out.shape != self.shape or out.dtype != self.dtype or not out.flags.c_contiguous:
+            raise ValueError(f"缓冲区需要是C连续的 {self.shape} {self.dtype}")
+        self.volume = out
+        params = {rescale_params(ds) for ds in dicom_series}
+        # 所有切片rescale参数相同时，最后对整个体数据计算一次
+        self.shared_rescale = params.pop() if len(params) == 1 else None
+        self.count = 0
+        self.missing = []  # 解码失败、留空的切片下标
+        self._start = time.perf_counter()
+
+    def _rescale(self, out, slope, intercept):
+        # 标量先转成输出类型，整数类型时不会产生float64中间结果
+        if slope != 1:
+            np.multiply(out, self.dtype.type(slope), out=out, casting="unsafe")
+        if intercept != 0:
+            np.add(out, self.dtype.type(intercept), out=out, casting="unsafe")
+
+    def add(self, ds):
+        """写入下一个切片"""
+        if self.count >= self.shape[0]:
+            raise IndexError("切片数超过了体数据大小")
+        out = self.volume[self.count]
+        np.copyto(out, ds.pixel_array[self.crop], casting="unsafe")
+        if self.shared_rescale is None:
+            self._rescale(out, *rescale_params(ds))
+        self.count += 1
+
+    def skip(self):
+        """下一个切片解码失败: 位置留空(最后填成体数据的最小值)，后面的切片仍然在原来的z位置"""
+        if self.count >= self.shape[0]:
+            raise IndexError("切片数超过了体数据大小")
+        self.missing.append(self.count)
+        self.count += 1
+
+    def put(self, index, ds):
+        """把切片写到指定位置并立即rescale，渐进加载时切片不是按顺序到达的"""
+        out = self.volume[index]
+        np.copyto(out, ds.pixel_array[self.crop], casting="unsafe")
+        self._rescale(out, *rescale_params(ds))
+
+    def finish(self):
+        """完成组装，返回已写入的部分"""
+        volume = self.volume[:self.count]
+        if self.shared_rescale is not None:
+            self._rescale(volume, *self.shared_rescale)
+        if self.missing and len(self.missing) < self.count:
+            fill_missing(volume, self.missing)
+        elapsed = time.perf_counter() - self._start
+        rescale = (f"slope={self.shared_rescale[0]:g}, intercept={self.shared_rescale[1]:g}"
+                   if self.shared_rescale is not None else "逐切片rescale")
+        log(f"体数据: {self.count}/{self.shape[0]} 个切片, {self.shape[1]}x{self.shape[2]}, "
+            f"{self.dtype}, {volume.nbytes / 1e6:.1f}MB, {rescale}, {elapsed:.2f}s")
+        return volume
+
+
+def build_volume(dicom_series, dtype=None, out=None, crop=None):
+    """把解码好的切片组装成 (slices, rows, cols) 的HU体数据"""
+    builder = VolumeBuilder(dicom_series, dtype=dtype, out=out, crop=crop)
+    for ds in dicom_series:
+        builder.add(ds)
+    return builder.finish()
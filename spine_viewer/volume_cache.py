@@ -0,0 +1,179 @@
+import os
+import hashlib
+import numpy as np
+
+from vtkmodules.vtkCommonDataModel import vtkImageData
+from vtkmodules.util import numpy_support
+
+from .instrument import log
+from .volume_builder import VolumeBuilder, choose_dtype, crop_slices
+
+# HU体数据缓存
+# 体数据按VTK的内存顺序(x最快)保存成 (slices, rows, cols) 的npy文件
+# 再次打开同一个序列时直接mmap文件，零拷贝包装成vtkImageData的标量
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "spine_viewer", "volumes")
+CACHE_VERSION = 2
+
+
+def series_fingerprint(dicom_series, dtype, crop=None):
+    """根据每个切片的文件路径、大小、修改时间和排序(以及ROI的像素范围)计算序列指纹"""
+    sha = hashlib.sha1(f"v{CACHE_VERSION}:{np.dtype(dtype).str}".encode("utf-8"))
+    if crop is not None:
+        sha.update(f"crop:{tuple(map(int, crop))}\n".encode("utf-8"))
+    for ds in dicom_series:
+        file_path = os.path.abspath(str(ds.filename))
+        st = os.stat(file_path)
+        sha.update(f"{file_path}|{st.st_size}|{st.st_mtime_ns}\n".encode("utf-8"))
+    return sha.hexdigest()
+
+
+def series_spacing(dicom_series):
+    """体数据间距 (dx, dy, dz)，x对应列，y对应行"""
+    dx, dy = 1.0, 1.0
+    if hasattr(dicom_series[0], "PixelSpacing"):
+        # PixelSpacing = [行间距, 列间距]
+        dy, dx = map(float, dicom_series[0].PixelSpacing)
+    dz = 1.0
+    if len(dicom_series) > 1 and hasattr(dicom_series[0], "ImagePositionPatient"):
+        z1 = float(dicom_series[0].ImagePositionPatient[2])
+        z2 = float(dicom_series[1].ImagePositionPatient[2])
+        dz = abs(z2 - z1) or 1.0
+    return dx, dy, dz
+
+
+def series_origin(dicom_series, crop=None):
+    """第一个体素的世界坐标；有crop时向内偏移 (col0*dx, row0*dy)"""
+    origin = (0.0, 0.0, 0.0)
+    if hasattr(dicom_series[0], "ImagePositionPatient"):
+        origin = tuple(map(float, dicom_series[0].ImagePositionPatient))
+    if crop is not None:
+        dx, dy, _ = series_spacing(dicom_series)
+        origin = (origin[0] + int(crop[2]) * dx, origin[1] + int(crop[0]) * dy, origin[2])
+    return origin
+
+
+def numpy_to_vtk_image(volume, spacing, origin=(0.0, 0.0, 0.0)):
+    """把 (slices, rows, cols) 的C连续体数据零拷贝包装成vtkImageData"""
+    if not volume.flags.c_contiguous:
+        raise ValueError("体数据必须是C连续的 (slices, rows, cols) 数组")
+    slices, rows, cols = volume.shape
+    # reshape对C连续数组只是视图；deep=False时vtk数组直接引用numpy内存
+    vtk_data = numpy_support.numpy_to_vtk(
+        volume.reshape(-1), deep=False,
+        array_type=numpy_support.get_vtk_array_type(volume.dtype)
+    )
+    vtk_image = vtkImageData()
+    vtk_image.SetDimensions(cols, rows, slices)
+    vtk_image.SetSpacing(*spacing)
+    vtk_image.SetOrigin(*origin)
+    vtk_image.GetPointData().SetScalars(vtk_data)
+    return vtk_image
+
+
+class VolumeCache:
+    """
+    按序列指纹缓存HU体数据，默认放在 ~/.cache/spine_viewer/volumes
+    dtype为None时根据头信息选择不会溢出的类型(volume_builder.choose_dtype)
+    """
+
+    def __init__(self, cache_dir=None, dtype=None):
+        self.cache_dir = cache_dir or CACHE_DIR
+        self.dtype = np.dtype(dtype) if dtype is not None else None
+
+    def key(self, dicom_series, crop=None):
+        """序列在缓存中的键(指纹)"""
+        dtype = self.dtype if self.dtype is not None else choose_dtype(dicom_series)
+        return series_fingerprint(dicom_series, dtype, crop)
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key + ".npy")
+
+    def load(self, key):
+        """命中返回mmap的体数据，否则返回None"""
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            # copy-on-write映射：页按需从文件读入，不会整体复制
+            return np.load(path, mmap_mode="c")
+        except (OSError, ValueError) as e:
+            log(f"体数据缓存损坏，重新生成: {e}")
+            return None
+
+    def create(self, key, shape, dtype):
+        """新建待写入的mmap体数据(临时文件)，写完后调用commit"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        return np.lib.format.open_memmap(self.path(key) + ".tmp", mode="w+", dtype=dtype, shape=shape)
+
+    def commit(self, key, volume):
+        """把create得到的体数据写回磁盘并放进缓存，volume之后仍然可以继续使用"""
+        volume.flush()
+        os.replace(self.path(key) + ".tmp", self.path(key))
+
+    def store(self, key, headers, slices, dtype, crop=None):
+        """
+        把解码好的切片逐个写进mmap文件，返回mmap的体数据
+        有切片解码失败时那些位置留空(填成空气)，返回内存里的体数据，不放进缓存
+        headers: 排好序的头信息，决定体数据尺寸
+        slices: 解码后的切片，可以是生成器(DicomSeriesLoader.iter_decode)
+        crop: 只保存切片内 (row0, row1, col0, col1) 的像素
+        """
+        path = self.path(key)
+        tmp_path = path + ".tmp"
+
+        rows, cols = crop_slices(headers, crop)
+        shape = (len(headers), rows.stop - rows.start, cols.stop - cols.start)
+        volume = self.create(key, shape, dtype)
+        builder = VolumeBuilder(headers, dtype=dtype, out=volume, crop=crop)
+        # 解码失败的切片会被跳过，用文件名对应回切片位置，失败的位置留空，后面的切片z位置不变
+        positions = {str(ds.filename): i for i, ds in enumerate(headers)}
+        for ds in slices:
+            index = positions[str(ds.filename)]
+            while builder.count < index:
+                builder.skip()
+            builder.add(ds)
+        while builder.count < shape[0]:
+            builder.skip()
+        decoded = shape[0] - len(builder.missing)
+        if decoded == 0:
+            del builder, volume
+            os.remove(tmp_path)
+            return None
+        built = builder.finish()
+
+        if builder.missing:
+            # 不完整的体数据不进缓存(下次打开重新解码)，留空的切片填成空气
+            log(f"警告: {len(builder.missing)}/{shape[0]} 个切片解码失败，这些位置显示为空白: "
+                f"{builder.missing[:20]}{' ...' if len(builder.missing) > 20 else ''}")
+            partial = np.array(built)
+            del built, builder, volume
+            os.remove(tmp_path)
+            return partial
+        self.commit(key, volume)
+        del built, builder, volume
+        return self.load(key)
+
+    def discard(self, key):
+        """删掉create得到的临时文件(体数据不完整、不放进缓存时)"""
+        try:
+            os.remove(self.path(key) + ".tmp")
+        except OSError as e:
+            log(f"临时体数据文件删除失败: {e}")
+
+    def get(self, dicom_series, decode=None, crop=None):
+        """
+        取序列的体数据，缓存命中时不需要解码像素
+        decode: 没命中时把头信息转换成解码后切片的函数(例如 loader.iter_decode)
+        crop: 只保存切片内 (row0, row1, col0, col1) 的像素，ROI不同缓存也不同
+        """
+        dtype = self.dtype if self.dtype is not None else choose_dtype(dicom_series)
+        key = series_fingerprint(dicom_series, dtype, crop)
+        volume = self.load(key)
+        if volume is not None:
+            log(f"体数据缓存命中: {self.path(key)}")
+            return volume
+        slices = dicom_series
+        if decode is not None and not hasattr(dicom_series[0], "PixelData"):
+            slices = decode(dicom_series)
+        return self.store(key, dicom_series, slices, dtype, crop)
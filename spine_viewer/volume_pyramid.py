@@ -0,0 +1,175 @@
+import os
+import numpy as np
+
+from vtkmodules.vtkRenderingVolumeOpenGL2 import vtkSmartVolumeMapper
+from vtkmodules.util import numpy_support
+
+from .instrument import log
+from .volume_cache import CACHE_DIR, numpy_to_vtk_image
+
+# 多分辨率体数据金字塔：2x、4x、8x降采样(按块取最大值或平均值，取最大值时骨头不会变淡)
+# 相机交互时渲染粗一级的体数据，交互结束后切回全分辨率
+
+
+def downsample(volume, factor, mode="max"):
+    """把 (slices, rows, cols) 的体数据每 factor^3 个体素合并成一个，多出来的边缘丢掉"""
+    s, r, c = (n // factor for n in volume.shape)
+    out = np.empty((s, r, c), dtype=volume.dtype)
+    # 按z方向一块一块算，临时内存只有一个块
+    for k in range(s):
+        slab = volume[k * factor:(k + 1) * factor, :r * factor, :c * factor]
+        blocks = slab.reshape(factor, r, factor, c, factor)
+        if mode == "max":
+            np.max(blocks, axis=(0, 2, 4), out=out[k])
+        elif mode == "mean":
+            np.copyto(out[k], blocks.mean(axis=(0, 2, 4), dtype=np.float32), casting="unsafe")
+        else:
+            raise ValueError(f"未知的降采样方式: {mode}")
+    return out
+
+
+def vtk_image_to_numpy(vtk_image):
+    """vtkImageData的标量零拷贝转成 (slices, rows, cols) 数组"""
+    cols, rows, slices = vtk_image.GetDimensions()
+    array = numpy_support.vtk_to_numpy(vtk_image.GetPointData().GetScalars())
+    return array.reshape(slices, rows, cols)
+
+
+def _level_path(cache_dir, key, mode, factor):
+    return os.path.join(cache_dir, f"{key}.{mode}{factor}.npy")
+
+
+def _load_level(cache_dir, key, mode, factor):
+    path = _level_path(cache_dir, key, mode, factor)
+    if key is None or not os.path.exists(path):
+        return None
+    try:
+        return np.load(path, mmap_mode="c")
+    except (OSError, ValueError):
+        return None
+
+
+def _save_level(cache_dir, key, mode, factor, array):
+    if key is None:
+        return
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        path = _level_path(cache_dir, key, mode, factor)
+        tmp_path = path + ".tmp.npy"
+        np.save(tmp_path, array)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        log(f"金字塔缓存保存失败: {e}")
+
+
+def build_levels(volume, factors=(2, 4, 8), mode="max", key=None, cache_dir=None):
+    """
+    金字塔每一级的数组 {factor: (slices, rows, cols)}，每一级从上一级算出来；key给了就读写磁盘缓存
+    只用numpy和文件，可以在后台线程里算，vtkImageData由VolumePyramid在主线程里包装
+    """
+    cache_dir = cache_dir or CACHE_DIR
+    levels = {}
+    previous, previous_factor = volume, 1
+    for factor in sorted(factors):
+        step = factor // previous_factor
+        if step < 2 or min(previous.shape) < step:
+            break
+        array = _load_level(cache_dir, key, mode, factor)
+        if array is None:
+            array = downsample(previous, step, mode)
+            _save_level(cache_dir, key, mode, factor, array)
+        levels[factor] = array
+        previous, previous_factor = array, factor
+    return levels
+
+
+class VolumePyramid:
+    """
+    vtk_image: 全分辨率体数据
+    factors: 降采样倍数，每一级从上一级算出来
+    key: 序列指纹(VolumeCache.key)，给了就把每一级缓存到磁盘
+    levels: 后台线程里build_levels算好的各级数组，给了就只包装成vtkImageData
+    """
+
+    def __init__(self, vtk_image, factors=(2, 4, 8), mode="max", key=None, cache_dir=None, levels=None):
+        self.mode = mode
+        self.key = key
+        self.cache_dir = cache_dir or CACHE_DIR
+        self.images = {1: vtk_image}
+
+        if levels is None:
+            levels = build_levels(vtk_image_to_numpy(vtk_image), factors, mode, key, self.cache_dir)
+        spacing = vtk_image.GetSpacing()
+        origin = vtk_image.GetOrigin()
+        for factor, array in sorted(levels.items()):
+            # 合并后的体素中心相对原来偏移了 (factor-1)/2 个体素
+            level_origin = [o + (factor - 1) / 2.0 * d for o, d in zip(origin, spacing)]
+            level_spacing = [d * factor for d in spacing]
+            self.images[factor] = numpy_to_vtk_image(array, level_spacing, level_origin)
+
+        log(f"体数据金字塔: {sorted(self.images)} ({mode})")
+
+    @property
+    def factors(self):
+        return sorted(self.images)
+
+
+class InteractiveLOD:
+    """
+    交互时自动选择金字塔层级
+    每一级用自己的mapper，切换时只换vtkVolume的mapper，不会让mapper重新上传数据
+    根据每一级实际的渲染时间，选能达到target_fps的最细一级
+    """
+
+    def __init__(self, volume, pyramid, interactor, renderer, target_fps=15.0):
+        self.volume = volume
+        self.pyramid = pyramid
+        self.renderer = renderer
+        self.target_fps = target_fps
+        self.level = 1
+        self._mappers = {1: volume.GetMapper()}
+        self._render_times = {}
+
+        style = interactor.GetInteractorStyle()
+        style.AddObserver("StartInteractionEvent", self._on_start_interaction)
+        style.AddObserver("EndInteractionEvent", self._on_end_interaction)
+        renderer.AddObserver("EndEvent", self._on_render_end)
+        self._render_window = interactor.GetRenderWindow()
+
+    def _mapper(self, factor):
+        if factor not in self._mappers:
+            mapper = vtkSmartVolumeMapper()
+            mapper.SetInputData(self.pyramid.images[factor])
+            self._mappers[factor] = mapper
+        return self._mappers[factor]
+
+    def choose_level(self):
+        """估计每一级的渲染时间(没测过的按体素数从全分辨率推算)，选最细的能满足帧率的一级"""
+        budget = 1.0 / self.target_fps
+        full_time = self._render_times.get(1)
+        for factor in self.pyramid.factors:
+            estimate = self._render_times.get(factor)
+            if estimate is None and full_time is not None:
+                estimate = full_time / factor ** 3
+            if estimate is not None and estimate <= budget:
+                return factor
+        return self.pyramid.factors[-1]
+
+    def use_level(self, factor):
+        if factor != self.level:
+            self.volume.SetMapper(self._mapper(factor))
+            self.level = factor
+
+    def _on_render_end(self, obj, event):
+        elapsed = self.renderer.GetLastRenderTimeInSeconds()
+        previous = self._render_times.get(self.level)
+        # 指数平滑，避免偶尔一帧慢就来回切换
+        self._render_times[self.level] = elapsed if previous is None else 0.7 * previous + 0.3 * elapsed
+
+    def _on_start_interaction(self, obj, event):
+        self.use_level(self.choose_level())
+
+    def _on_end_interaction(self, obj, event):
+        if self.level != 1:
+            self.use_level(1)
+            self._render_window.Render()
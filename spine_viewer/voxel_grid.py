@@ -0,0 +1,139 @@
+import numpy as np
+
+# 流式体素网格降采样：点按体素分箱，每个体素只保留一个代表点(落在里面的点的平均值)
+# 体素数有上限(内存预算)，满了之后淘汰最久没有更新(lru)或最早建立(age)的体素
+# 占用的槽位始终是 [0, count)，淘汰出来的槽位马上给新体素用，means[:count]可以直接零拷贝给VTK显示
+
+_KEY_BITS = 21
+_KEY_OFFSET = 1 << (_KEY_BITS - 1)
+_KEY_MASK = (1 << _KEY_BITS) - 1
+
+# 每个体素占的内存: means float32*3 + sums float64*3 + counts/keys/updated/created int64 + 字典项(估计值)
+BYTES_PER_VOXEL = 12 + 24 + 8 * 4 + 100
+
+
+def voxel_cells(points, voxel_size):
+    """点 (N, 3) -> 所在体素的整数坐标 (N, 3)"""
+    return np.floor(np.asarray(points, dtype=np.float64) / voxel_size).astype(np.int64)
+
+
+def pack_cells(cells):
+    """体素整数坐标 (N, 3) -> 体素键 int64，每个坐标轴21位，范围是 ±2^20 个体素；同一(x, y)列里z连续"""
+    index = np.clip(cells + _KEY_OFFSET, 0, _KEY_MASK)
+    return (index[:, 0] << (2 * _KEY_BITS)) | (index[:, 1] << _KEY_BITS) | index[:, 2]
+
+
+def voxel_keys(points, voxel_size):
+    """点 (N, 3) -> 体素键 int64"""
+    return pack_cells(voxel_cells(points, voxel_size))
+
+
+class VoxelGrid:
+    """
+    voxel_size: 体素边长(和点坐标同单位)
+    max_voxels: 最多保留的体素数，也可以用memory_bytes按内存预算换算
+    eviction: "lru" 淘汰最久没有新点落入的体素，"age" 淘汰最早建立的体素
+    """
+
+    def __init__(self, voxel_size, max_voxels=None, memory_bytes=None, eviction="lru"):
+        if eviction not in ("lru", "age"):
+            raise ValueError(f"未知的淘汰方式: {eviction}")
+        if max_voxels is None:
+            if memory_bytes is None:
+                raise ValueError("需要给出max_voxels或memory_bytes")
+            max_voxels = int(memory_bytes) // BYTES_PER_VOXEL
+        if max_voxels < 1:
+            raise ValueError("体素数上限必须大于0")
+
+        self.voxel_size = float(voxel_size)
+        self.max_voxels = int(max_voxels)
+        self.eviction = eviction
+        self.count = 0
+        self.evicted = 0
+        self.points_seen = 0
+
+        self.means = np.zeros((self.max_voxels, 3), dtype=np.float32)
+        self._sums = np.zeros((self.max_voxels, 3), dtype=np.float64)
+        self._counts = np.zeros(self.max_voxels, dtype=np.int64)
+        self._keys = np.zeros(self.max_voxels, dtype=np.int64)
+        self._updated = np.zeros(self.max_voxels, dtype=np.int64)
+        self._created = np.zeros(self.max_voxels, dtype=np.int64)
+        self._slots = {}  # 体素键 -> 槽位
+        self._tick = 0
+
+    def points(self):
+        """每个体素的代表点 (count, 3)，是内部数组的视图"""
+        return self.means[:self.count]
+
+    def counts(self):
+        return self._counts[:self.count]
+
+    def _allocate(self, n):
+        """取n个槽位，不够时按淘汰策略腾出来"""
+        occupied = self.count
+        free = min(n, self.max_voxels - occupied)
+        slots = np.arange(occupied, occupied + free, dtype=np.int64)
+        self.count += free
+        need = n - free
+        if need <= 0:
+            return slots
+
+        # 只从原来占用的槽位里挑
+        stamp = self._updated if self.eviction == "lru" else self._created
+        if need < occupied:
+            victims = np.argpartition(stamp[:occupied], need - 1)[:need]
+        else:
+            victims = np.arange(occupied, dtype=np.int64)
+        slots_dict = self._slots
+        for key in self._keys[victims].tolist():
+            del slots_dict[key]
+        self.evicted += len(victims)
+        return np.concatenate([slots, victims])
+
+    def add(self, points):
+        """加入一批点 (N, 3)，返回这一批更新过的槽位"""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        if not len(points):
+            return np.empty(0, dtype=np.int64)
+        self._tick += 1
+        self.points_seen += len(points)
+
+        # 先在这一批里按体素合并，再和已有体素合并
+        keys, inverse = np.unique(voxel_keys(points, self.voxel_size), return_inverse=True)
+        inverse = inverse.reshape(-1)
+        counts = np.bincount(inverse, minlength=len(keys))
+        sums = np.stack([np.bincount(inverse, weights=points[:, axis], minlength=len(keys))
+                         for axis in range(3)], axis=1)
+
+        slots_dict = self._slots
+        slots = np.fromiter((slots_dict.get(key, -1) for key in keys.tolist()), dtype=np.int64, count=len(keys))
+        new = slots < 0
+        old_slots = slots[~new]
+        self._sums[old_slots] += sums[~new]
+        self._counts[old_slots] += counts[~new]
+        # 先标记这一批更新过的体素，lru淘汰时不会选到它们
+        self._updated[old_slots] = self._tick
+
+        new_keys = keys[new]
+        if len(new_keys) > self.max_voxels:
+            # 一批的新体素就超过上限时只保留点最多的
+            keep = np.argsort(counts[new], kind="stable")[-self.max_voxels:]
+            new_keys, new_sums, new_counts = new_keys[keep], sums[new][keep], counts[new][keep]
+        else:
+            new_sums, new_counts = sums[new], counts[new]
+        new_slots = self._allocate(len(new_keys))
+        self._sums[new_slots] = new_sums
+        self._counts[new_slots] = new_counts
+        self._keys[new_slots] = new_keys
+        self._created[new_slots] = self._tick
+        slots_dict.update(zip(new_keys.tolist(), new_slots.tolist()))
+
+        # 被淘汰的旧槽位可能刚在这一批里更新过，只更新现在还属于这一批体素的槽位
+        touched = np.concatenate([old_slots[self._keys[old_slots] == keys[~new]], new_slots])
+        self._updated[new_slots] = self._tick
+        self.means[touched] = self._sums[touched] / self._counts[touched, None]
+        return touched
+
+    def clear(self):
+        self.count = 0
+        self._slots.clear()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 仓库根目录加到路径里，才能导入spine_viewer(和LoadPydicom、benchmarks里的做法一样)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
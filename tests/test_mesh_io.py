@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from spine_viewer.mesh_io import (HEADER_SIZE, MESH_MAGIC, load_mesh, load_polydata, polydata_to_arrays,
+                                  save_mesh, save_polydata)
+
+# 网格文件的读写往返，以及截断/损坏的缓存文件当作没有缓存
+
+
+def make_mesh(rng, n_points=50, n_triangles=80):
+    points = rng.normal(size=(n_points, 3)).astype(np.float32)
+    triangles = rng.integers(0, n_points, size=(n_triangles, 3)).astype(np.int32)
+    normals = rng.normal(size=(n_points, 3)).astype(np.float32)
+    return points, triangles, normals
+
+
+@pytest.mark.parametrize("with_normals", [True, False])
+def test_roundtrip(tmp_path, with_normals):
+    points, triangles, normals = make_mesh(np.random.default_rng(0))
+    path = str(tmp_path / "mesh.bin")
+    save_mesh(path, points, triangles, normals if with_normals else None)
+    loaded = load_mesh(path)
+    assert loaded is not None
+    np.testing.assert_array_equal(loaded[0], points)
+    np.testing.assert_array_equal(loaded[1], triangles)
+    if with_normals:
+        np.testing.assert_array_equal(loaded[2], normals)
+    else:
+        assert loaded[2] is None
+    assert not (tmp_path / "mesh.bin.tmp").exists()
+
+
+def test_polydata_roundtrip(tmp_path):
+    points, triangles, normals = make_mesh(np.random.default_rng(1))
+    path = str(tmp_path / "sub" / "mesh.bin")
+    save_mesh(path, points, triangles, normals)
+    polydata = load_polydata(path)
+    assert polydata.GetNumberOfPoints() == len(points)
+    assert polydata.GetNumberOfCells() == len(triangles)
+    # 再存一次读回来还是同样的数组
+    save_polydata(str(tmp_path / "again.bin"), polydata)
+    again = polydata_to_arrays(load_polydata(str(tmp_path / "again.bin")))
+    for a, b in zip(again, (points, triangles, normals)):
+        np.testing.assert_array_equal(a, b)
+
+
+@pytest.mark.parametrize("size", [0, 4, HEADER_SIZE - 1, HEADER_SIZE, HEADER_SIZE + 100, -1])
+def test_truncated_file(tmp_path, size):
+    points, triangles, normals = make_mesh(np.random.default_rng(2))
+    path = str(tmp_path / "mesh.bin")
+    save_mesh(path, points, triangles, normals)
+    data = open(path, "rb").read()
+    with open(path, "wb") as f:
+        f.write(data[:size])
+    assert load_mesh(path) is None
+    assert load_polydata(path) is None
+
+
+def test_corrupt_file(tmp_path):
+    points, triangles, _ = make_mesh(np.random.default_rng(3))
+    path = str(tmp_path / "mesh.bin")
+    save_mesh(path, points, triangles)
+    data = open(path, "rb").read()
+
+    # 魔数不对
+    with open(path, "wb") as f:
+        f.write(b"X" * len(MESH_MAGIC) + data[len(MESH_MAGIC):])
+    assert load_mesh(path) is None
+    # 文件比头信息说的长
+    with open(path, "wb") as f:
+        f.write(data + b"\0" * 12)
+    assert load_mesh(path) is None
+    # 头信息里的点数是负数
+    header = np.array([-1, len(triangles), 0], dtype=np.int64).tobytes()
+    with open(path, "wb") as f:
+        f.write(MESH_MAGIC + header + data[HEADER_SIZE:])
+    assert load_mesh(path) is None
+
+
+def test_missing_file(tmp_path):
+    assert load_mesh(str(tmp_path / "missing.bin")) is None
+    assert load_polydata(str(tmp_path / "missing.bin")) is None
@@ -0,0 +1,122 @@
+import numpy as np
+import pytest
+
+from spine_viewer.spatial_index import PointIndex
+
+# PointIndex和暴力计算对比，点缓冲区按环形缓冲区(PointCloud)的方式覆盖写入
+
+
+def brute_nearest(points, queries):
+    d2 = ((queries[:, None, :].astype(np.float64) - points[None, :, :].astype(np.float64)) ** 2).sum(axis=2)
+    return np.sqrt(d2.min(axis=1))
+
+
+def ring_index(rng, capacity=3000, batches=12, batch=700, min_rebuild=300, **kwargs):
+    """
+    往容量capacity的缓冲区里按环形写入几批点(后面的覆盖前面的)，每批之后update
+    最后一批比min_rebuild少，查询时网格里有点、同时还有没重建进去的改动点
+    """
+    buffer = np.zeros((capacity, 3), dtype=np.float32)
+    index = PointIndex(buffer, count=0, min_rebuild=min_rebuild, rebuild_fraction=0.0, **kwargs)
+    head, count = 0, 0
+    for i in range(batches):
+        size = batch if i < batches - 1 else min_rebuild // 2
+        # 每批点在不同的位置，覆盖后旧位置的点要从结果里消失
+        points = rng.normal(loc=i * 5.0, scale=20.0, size=(size, 3)).astype(np.float32)
+        slots = (head + np.arange(size)) % capacity
+        buffer[slots] = points
+        head = (head + size) % capacity
+        count = min(capacity, count + size)
+        index.update(slots, count=count)
+        # 每批之后查询一次，改动多的时候会重建
+        index.nearest(points[:5])
+    assert index.rebuilds > 1 and len(index._pending_slots())
+    return buffer, index
+
+
+@pytest.mark.parametrize("kwargs", [{}, {"cell_size": 2.0}, {"cell_size": 0.3}])
+def test_nearest_matches_brute_force(kwargs):
+    rng = np.random.default_rng(0)
+    buffer, index = ring_index(rng, **kwargs)
+    # 点云附近和很远的查询点都有(很远的要扩大好几圈)
+    queries = np.concatenate([rng.normal(loc=30.0, scale=25.0, size=(300, 3)),
+                              rng.normal(loc=30.0, scale=400.0, size=(50, 3))])
+    distances, indices = index.nearest(queries)
+    expected = brute_nearest(buffer[:index.count], queries)
+    np.testing.assert_allclose(distances, expected, rtol=1e-9, atol=1e-9)
+    # 返回的下标对应的点确实在这个距离上
+    found = np.linalg.norm(buffer[indices].astype(np.float64) - queries, axis=1)
+    np.testing.assert_allclose(found, expected, rtol=1e-9, atol=1e-9)
+
+
+def test_nearest_max_distance():
+    rng = np.random.default_rng(1)
+    buffer, index = ring_index(rng)
+    queries = rng.normal(loc=30.0, scale=60.0, size=(400, 3))
+    distances, indices = index.nearest(queries, max_distance=3.0)
+    expected = brute_nearest(buffer[:index.count], queries)
+    near = expected <= 3.0
+    assert near.any() and (~near).any()
+    np.testing.assert_allclose(distances[near], expected[near], rtol=1e-9, atol=1e-9)
+    assert np.all(np.isinf(distances[~near]))
+    assert np.all(indices[~near] == -1)
+
+
+def test_growing_count():
+    # 只增加count(不给slots)时新的点也要算进去
+    rng = np.random.default_rng(5)
+    buffer = rng.normal(scale=10.0, size=(4000, 3)).astype(np.float32)
+    index = PointIndex(buffer, count=1000, min_rebuild=100, rebuild_fraction=0.0)
+    index.nearest(np.zeros((1, 3)))
+    queries = rng.normal(scale=15.0, size=(200, 3))
+    for count in (1050, 3000):
+        index.update(count=count)
+        distances, _ = index.nearest(queries)
+        np.testing.assert_allclose(distances, brute_nearest(buffer[:count], queries), rtol=1e-9, atol=1e-9)
+
+
+def test_nearest_empty():
+    index = PointIndex(np.zeros((10, 3), dtype=np.float32), count=0)
+    distances, indices = index.nearest(np.zeros((2, 3)))
+    assert np.all(np.isinf(distances)) and np.all(indices == -1)
+
+
+@pytest.mark.parametrize("kwargs", [{}, {"cell_size": 2.0}])
+def test_radius_matches_brute_force(kwargs):
+    rng = np.random.default_rng(2)
+    buffer, index = ring_index(rng, **kwargs)
+    points = buffer[:index.count].astype(np.float64)
+    for center in rng.normal(loc=30.0, scale=30.0, size=(40, 3)):
+        for r in (0.5, 4.0, 15.0):
+            expected = np.flatnonzero(((points - center) ** 2).sum(axis=1) <= r * r)
+            np.testing.assert_array_equal(index.radius(center, r), expected)
+
+
+@pytest.mark.parametrize("kwargs", [{}, {"cell_size": 2.0}])
+def test_box_matches_brute_force(kwargs):
+    rng = np.random.default_rng(3)
+    buffer, index = ring_index(rng, **kwargs)
+    points = buffer[:index.count]
+    for _ in range(40):
+        lo = rng.normal(loc=30.0, scale=30.0, size=3)
+        hi = lo + rng.uniform(0.5, 40.0, size=3)
+        bounds = np.stack([lo, hi], axis=1).ravel()
+        expected = np.flatnonzero(np.all((points >= lo) & (points <= hi), axis=1))
+        np.testing.assert_array_equal(index.box(bounds), expected)
+
+
+def test_rebuild_threshold():
+    rng = np.random.default_rng(4)
+    buffer = rng.normal(size=(5000, 3)).astype(np.float32)
+    index = PointIndex(buffer, min_rebuild=100, rebuild_fraction=0.0)
+    index.nearest(np.zeros((1, 3)))
+    rebuilds = index.rebuilds
+    # 改动的点没超过阈值时不重建，只是查询时暴力计算它们
+    buffer[:50] += 1.0
+    index.update(np.arange(50))
+    index.nearest(np.zeros((1, 3)))
+    assert index.rebuilds == rebuilds
+    buffer[50:200] += 1.0
+    index.update(np.arange(50, 200))
+    index.nearest(np.zeros((1, 3)))
+    assert index.rebuilds == rebuilds + 1
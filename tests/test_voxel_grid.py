@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+
+from spine_viewer.voxel_grid import VoxelGrid, voxel_keys
+
+# VoxelGrid淘汰和槽位的不变量，代表点和暴力计算的平均值对比
+
+
+def check_slots(grid):
+    """占用的槽位正好是 [0, count)，字典和槽位里的体素键一一对应"""
+    assert grid.count <= grid.max_voxels
+    slots = np.array(sorted(grid._slots.values()), dtype=np.int64)
+    np.testing.assert_array_equal(slots, np.arange(grid.count))
+    for key, slot in grid._slots.items():
+        assert grid._keys[slot] == key
+
+
+def check_means(grid, batches):
+    """每个体素的代表点 = 它(最近一次)建立以来落进去的所有点的平均值"""
+    for key, slot in grid._slots.items():
+        points = np.concatenate([points[voxel_keys(points, grid.voxel_size) == key]
+                                 for tick, points in enumerate(batches, 1) if tick >= grid._created[slot]])
+        assert grid.counts()[slot] == len(points)
+        np.testing.assert_allclose(grid.points()[slot], points.mean(axis=0), rtol=1e-6, atol=1e-5)
+
+
+def stream(rng, batches=30, batch=400):
+    # 点在一个移动的区域里，旧的体素不再更新，新的体素不断出现
+    for i in range(batches):
+        yield rng.normal(loc=(i * 0.5, 0.0, 0.0), scale=2.0, size=(batch, 3))
+
+
+def test_unbounded_matches_brute_force():
+    rng = np.random.default_rng(0)
+    grid = VoxelGrid(0.5, max_voxels=10**6)
+    batches = []
+    for points in stream(rng, batches=10):
+        batches.append(points)
+        grid.add(points)
+    all_points = np.concatenate(batches)
+    assert grid.count == len(np.unique(voxel_keys(all_points, 0.5)))
+    assert grid.evicted == 0 and grid.points_seen == len(all_points)
+    check_slots(grid)
+    check_means(grid, batches)
+
+
+@pytest.mark.parametrize("eviction", ["lru", "age"])
+def test_eviction_invariants(eviction):
+    rng = np.random.default_rng(1)
+    grid = VoxelGrid(0.5, max_voxels=1500, eviction=eviction)
+    batches = []
+    evicted_total = 0
+    for points in stream(rng):
+        stamp = grid._updated if eviction == "lru" else grid._created
+        before = {key: int(stamp[slot]) for key, slot in grid._slots.items()}
+        batches.append(points)
+        touched = grid.add(points)
+        keys = set(voxel_keys(points, grid.voxel_size).tolist())
+        check_slots(grid)
+
+        evicted = [key for key in before if key not in grid._slots]
+        evicted_total += len(evicted)
+        kept = [key for key in before if key in grid._slots and key not in keys]
+        if evicted:
+            assert grid.count == grid.max_voxels
+            # 淘汰的是时间戳最早的那些
+            if kept:
+                assert max(before[key] for key in evicted) <= min(before[key] for key in kept)
+            if eviction == "lru":
+                # 这一批更新过的旧体素不会被淘汰
+                assert not keys.intersection(evicted)
+        # 返回的槽位就是这一批的体素现在所在的槽位
+        np.testing.assert_array_equal(np.sort(touched), np.sort([grid._slots[key] for key in keys
+                                                                 if key in grid._slots]))
+    assert evicted_total > 0 and grid.evicted == evicted_total
+    check_means(grid, batches)
+
+
+def test_eviction_counts_recreated_voxels():
+    # 体素被淘汰后又有点落进去时重新建立，代表点只用重新建立之后的点
+    grid = VoxelGrid(1.0, max_voxels=2, eviction="age")
+    a, b, c = np.array([[0.5, 0.5, 0.5]]), np.array([[5.5, 0.5, 0.5]]), np.array([[9.5, 0.5, 0.5]])
+    batches = [a, b, c, a + 0.1]
+    for points in batches:
+        grid.add(points)
+        check_slots(grid)
+    assert grid.evicted == 2
+    check_means(grid, batches)
+    slot = grid._slots[int(voxel_keys(a, 1.0)[0])]
+    np.testing.assert_allclose(grid.points()[slot], (a + 0.1)[0], rtol=1e-6)
+
+
+def test_batch_larger_than_budget_keeps_densest():
+    grid = VoxelGrid(1.0, max_voxels=3)
+    points = np.array([[0.5, 0.5, 0.5]] * 1 + [[2.5, 0.5, 0.5]] * 4 + [[4.5, 0.5, 0.5]] * 2 +
+                      [[6.5, 0.5, 0.5]] * 5 + [[8.5, 0.5, 0.5]] * 3)
+    grid.add(points)
+    check_slots(grid)
+    assert sorted(grid.counts().tolist()) == [3, 4, 5]
+
+
+def test_memory_budget():
+    grid = VoxelGrid(1.0, memory_bytes=1 << 20)
+    assert grid.max_voxels > 0 and grid.means.nbytes < 1 << 20
+    with pytest.raises(ValueError):
+        VoxelGrid(1.0)
+    with pytest.raises(ValueError):
+        VoxelGrid(1.0, max_voxels=10, eviction="random")